@@ -4,7 +4,6 @@ This defines the application module that essentially creates a new flask app obj
 """
 import logging
 import os
-from datetime import datetime
 
 import jinja2
 from flask import Flask, g
@@ -82,6 +81,7 @@ def create_app(config_name):
 
     error_handlers(app)
     register_app_blueprints(app)
+    init_app_services(app)
     app_request_handlers(app, db)
     app_logger_handler(app, config_name)
 
@@ -108,16 +108,13 @@ def app_request_handlers(app, db_):
     @app.before_request
     def before_request():
         """
-        Before submitting the request, change the currently logged in user 'last seen' status to now
-        this will update the database last_seen column and every time the user makes a request (refreshes the
-        page), the last seen will be updated. this is called before any request is ma
+        Before submitting the request, change the currently logged in user 'last seen' status to now.
+        The time is buffered and written to the last_seen column in bulk, so the request itself does
+        not write to the database. this is called before any request is made
         """
         g.user = current_user
         if current_user.is_authenticated:
-            current_user.last_seen = datetime.now()
-            db.session.add(g.user)
-            db_.session.add(current_user)
-            db_.session.commit()
+            current_user.ping()
 
 
 def app_logger_handler(app, config_name):
@@ -207,3 +204,14 @@ def register_app_blueprints(app_):
 
     app_.register_blueprint(auth)
     app_.register_blueprint(crypto)
+
+
+def init_app_services(app_):
+    """
+    Initializes the modules' shared service objects with the current app's configuration
+    :param app_: the current flask app
+    """
+    from app import mod_auth, mod_crypto
+
+    mod_auth.init_app(app_)
+    mod_crypto.init_app(app_)
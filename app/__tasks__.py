@@ -1,17 +1,13 @@
 """
 Configures the schedules that will run in the application
 """
-from celery.beat import crontab
-from app.mod_crypto.tasks import post_crypto_emergency, post_telegram_notification
+from app.mod_crypto.polling import AdaptiveSchedule
+from app.mod_crypto.tasks import ingest_ticker_snapshot
 
 
 app_schedules = {
-    post_crypto_emergency.__qualname__ : {
-        "task": f"app.mod_crypto_tasks.{post_crypto_emergency.__qualname__}",
-        'schedule': crontab(minute="10"),
+    ingest_ticker_snapshot.__qualname__: {
+        "task": f"app.mod_crypto.tasks.{ingest_ticker_snapshot.__qualname__}",
+        "schedule": AdaptiveSchedule()
     },
-    post_telegram_notification.__qualname__: {
-        "task": f"app.mod_crypto_tasks.{post_telegram_notification.__qualname__}",
-        "schedule": crontab(minute="10")
-    }
-}
\ No newline at end of file
+}
@@ -0,0 +1,164 @@
+"""
+Key value backends for state shared between the web and celery processes.
+
+Redis is used when REDIS_SERVER is configured, otherwise an in process backend with the same
+interface is used so that the application (and its tests) run without a live server
+"""
+import threading
+import time
+
+
+class MemoryBackend(object):
+    """
+    In process key value backend. Values are only shared by threads of the same process
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._expires = {}
+        self._locks = {}
+
+    def _expire(self, key):
+        expires_at = self._expires.get(key)
+        if expires_at is not None and expires_at <= time.time():
+            self._values.pop(key, None)
+            self._expires.pop(key, None)
+
+    def get(self, key):
+        with self._lock:
+            self._expire(key)
+            return self._values.get(key)
+
+    def set(self, key, value, ex=None):
+        """
+        Sets a key
+        :param key: key to set
+        :param value: bytes or str value
+        :param ex: seconds after which the key expires
+        """
+        with self._lock:
+            self._values[key] = value
+            if ex is None:
+                self._expires.pop(key, None)
+            else:
+                self._expires[key] = time.time() + ex
+
+    def delete(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+            self._expires.pop(key, None)
+
+    def incr(self, key, amount=1, ex=None):
+        """
+        Increments an integer key
+        :param ex: seconds after which the key expires, only applied when the key is created
+        :return: the incremented value
+        :rtype: int
+        """
+        with self._lock:
+            self._expire(key)
+            created = key not in self._values
+            value = int(self._values.get(key) or 0) + amount
+            self._values[key] = value
+            if created and ex is not None:
+                self._expires[key] = time.time() + ex
+            return value
+
+    def set_max(self, key, value):
+        """
+        Sets an integer key to the given value unless it already holds a greater one
+        :return: the value the key holds afterwards
+        :rtype: int
+        """
+        with self._lock:
+            self._expire(key)
+            current = int(self._values.get(key) or 0)
+            if value > current:
+                self._values[key] = value
+                return value
+            return current
+
+    def lock(self, key, timeout=None):
+        """
+        Gets the lock of a key, for read-modify-write sequences of several calls
+        :param key: key to lock
+        :param timeout: seconds after which a Redis lock is released, unused in process
+        :return: context manager holding the lock
+        """
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+
+class RedisBackend(object):
+    """
+    Redis key value backend
+    """
+    SET_MAX_SCRIPT = """
+    local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+    local value = tonumber(ARGV[1])
+    if value > current then
+        redis.call('SET', KEYS[1], value)
+        return value
+    end
+    return current
+    """
+    INCR_SCRIPT = """
+    local value = redis.call('INCRBY', KEYS[1], ARGV[1])
+    if value == tonumber(ARGV[1]) and tonumber(ARGV[2]) > 0 then
+        redis.call('EXPIRE', KEYS[1], ARGV[2])
+    end
+    return value
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._set_max = client.register_script(self.SET_MAX_SCRIPT)
+        self._incr = client.register_script(self.INCR_SCRIPT)
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, ex=None):
+        self.client.set(key, value, ex=ex)
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def incr(self, key, amount=1, ex=None):
+        if ex is None:
+            return self.client.incrby(key, amount)
+        return int(self._incr(keys=[key], args=[amount, int(ex)]))
+
+    def set_max(self, key, value):
+        return int(self._set_max(keys=[key], args=[value]))
+
+    def lock(self, key, timeout=None):
+        return self.client.lock(key, timeout=timeout)
+
+
+def create_backend(app):
+    """
+    Creates the shared backend for the given application
+    :param app: the flask app
+    :return: RedisBackend if REDIS_SERVER is configured, MemoryBackend otherwise
+    """
+    redis_server = app.config.get("REDIS_SERVER")
+    if not redis_server:
+        return MemoryBackend()
+
+    import redis
+    client = redis.StrictRedis(host=redis_server, port=int(app.config.get("REDIS_PORT") or 6379),
+                               db=int(app.config.get("REDIS_DB") or 0))
+    return RedisBackend(client)
+
+
+def get_backend(app):
+    """
+    Gets the shared backend of the given application, creating it on first use
+    :param app: the flask app
+    :return: shared key value backend
+    """
+    if "shared_backend" not in app.extensions:
+        app.extensions["shared_backend"] = create_backend(app)
+    return app.extensions["shared_backend"]
@@ -5,3 +5,19 @@ auth = Blueprint(name="auth", import_name=__name__, url_prefix="/auth", static_f
                  template_folder="templates")
 
 from . import views
+
+
+def init_app(app):
+    """
+    Initializes the auth module's shared service objects with the application configuration
+    :param app: the flask app
+    """
+    from .hashing import password_hasher
+    from .identity import identity_cache
+    from .presence import last_seen_buffer
+    from .security_utils import token_claims_cache
+
+    password_hasher.init_app(app)
+    identity_cache.init_app(app)
+    last_seen_buffer.init_app(app)
+    token_claims_cache.init_app(app)
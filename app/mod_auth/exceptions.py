@@ -20,3 +20,9 @@ class ValidationError(APIException):
     """ Raises exception when token is invalid """
     status_code = 406
     detail = 'Invalid Token'
+
+
+class ServiceBusy(APIException):
+    """Raises a 503 status when too many passwords are being hashed to take another one """
+    status_code = 503
+    detail = 'Too many logins are being processed, please retry shortly'
@@ -0,0 +1,101 @@
+"""
+Bounded pool for password hashing.
+
+PBKDF2 hashes are computed by a fixed number of worker threads instead of on the request
+threads, and at most queue_size more hashes wait for a worker. A request that finds the pool
+saturated is rejected right away with ServiceBusy (503) instead of queueing behind a login burst,
+so that hashing never takes more than the pool's share of the CPU away from the rest of the API.
+hashlib releases the GIL while it computes PBKDF2, so the workers run on as many cores as there
+are workers
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from .exceptions import ServiceBusy
+
+
+class PasswordHasher(object):
+    """
+    Hashes and verifies passwords on a bounded pool of threads. Configured from the application
+    config on init_app, until then passwords are hashed on the calling thread
+    :cvar iterations PBKDF2 iterations of new password hashes. Existing hashes are verified
+    with the iterations they were created with
+    :cvar workers number of hashes computed at once
+    :cvar queue_size number of hashes waiting for a worker before new ones are rejected
+    :cvar timeout seconds a request waits for its hash before it is rejected
+    """
+
+    def __init__(self, app=None):
+        self.iterations = 150000
+        self.workers = os.cpu_count() or 1
+        self.queue_size = 16
+        self.timeout = 10
+        self._executor = None
+        self._slots = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Reads the hashing cost and pool bounds from the application configuration and starts
+        a new pool
+        :param app: the flask app
+        """
+        self.iterations = app.config.get("PASSWORD_HASH_ITERATIONS", self.iterations)
+        self.workers = app.config.get("PASSWORD_HASH_WORKERS") or self.workers
+        self.queue_size = app.config.get("PASSWORD_HASH_QUEUE_SIZE", self.queue_size)
+        self.timeout = app.config.get("PASSWORD_HASH_TIMEOUT", self.timeout)
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+
+    @property
+    def method(self):
+        return "pbkdf2:sha256:{}".format(self.iterations)
+
+    def _run(self, function, *args):
+        # init_app may replace the pool meanwhile, the call releases the slot it acquired
+        executor, slots = self._executor, self._slots
+        if executor is None:
+            return function(*args)
+        if not slots.acquire(blocking=False):
+            raise ServiceBusy()
+        try:
+            future = executor.submit(function, *args)
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise ServiceBusy()
+
+    def hash(self, password):
+        """
+        Hashes a password with the configured cost
+        :param password: plain text password
+        :return: werkzeug password hash
+        :rtype: str
+        :raises: ServiceBusy if the pool is saturated
+        """
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        """
+        Checks a password against its hash
+        :param password_hash: werkzeug password hash
+        :param password: plain text password
+        :rtype: bool
+        :raises: ServiceBusy if the pool is saturated
+        """
+        return self._run(check_password_hash, password_hash, password)
+
+
+password_hasher = PasswordHasher()
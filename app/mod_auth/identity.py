@@ -0,0 +1,181 @@
+"""
+Identity cache of the flask login user loader.
+
+Requests carrying a session load their user from a per process LRU cache with a TTL instead of
+looking the account up by primary key. With Redis configured a shared second level keeps the
+records across processes. Cached users are lightweight records detached from any session, not
+UserAccount instances. They are invalidated once a change of the account's password, email or
+confirmation is committed, or the account is deleted. Invalidating only after the commit keeps a
+concurrent request from caching the old row again. Other processes keep serving an invalidated
+record until its TTL expires
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask_login import UserMixin
+from sqlalchemy import event
+
+from app import db
+from app.backends import RedisBackend, get_backend
+from .presence import last_seen_buffer
+
+USER_KEY = "auth:user:{}"
+PENDING_INVALIDATIONS = "identity_cache.pending"
+
+
+class UserRecord(UserMixin):
+    """
+    Detached read only copy of a user account, as far as the authenticated requests need it
+    """
+    FIELDS = ("id", "uuid", "username", "email", "confirmed", "admin", "user_profile_id")
+
+    def __init__(self, **kwargs):
+        for field in self.FIELDS:
+            setattr(self, field, kwargs.get(field))
+
+    @classmethod
+    def from_account(cls, user_account):
+        """
+        :param user_account: UserAccount
+        :rtype: UserRecord
+        """
+        return cls(**{field: getattr(user_account, field) for field in cls.FIELDS})
+
+    def to_json(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def ping(self):
+        """
+        Records that the user was seen, see UserAccount.ping
+        """
+        last_seen_buffer.record(self.id)
+
+    def __repr__(self):
+        return "UserRecord(id={}, username={})".format(self.id, self.username)
+
+
+class IdentityCache(object):
+    """
+    LRU cache of user records with a TTL. Configured from the application config on init_app
+    :cvar max_size number of user records kept per process
+    :cvar ttl seconds a record is served from the process before it is loaded again
+    :cvar shared_ttl seconds a record is kept in Redis, if it is configured
+    """
+
+    def __init__(self, app=None):
+        self.max_size = 1024
+        self.ttl = 30
+        self.shared_ttl = 300
+        self.backend = None
+        self._lock = threading.Lock()
+        self._records = OrderedDict()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Reads the size and TTLs from the application configuration and uses Redis as the shared
+        level if it is configured
+        :param app: the flask app
+        """
+        self.max_size = app.config.get("IDENTITY_CACHE_SIZE", self.max_size)
+        self.ttl = app.config.get("IDENTITY_CACHE_TTL", self.ttl)
+        self.shared_ttl = app.config.get("IDENTITY_CACHE_SHARED_TTL", self.shared_ttl)
+        backend = get_backend(app)
+        self.backend = backend if isinstance(backend, RedisBackend) else None
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+    def __len__(self):
+        return len(self._records)
+
+    def _get(self, user_id):
+        with self._lock:
+            entry = self._records.get(user_id)
+            if entry is None:
+                return None
+            record, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._records[user_id]
+                return None
+            self._records.move_to_end(user_id)
+            return record
+
+    def _put(self, user_id, record):
+        with self._lock:
+            self._records[user_id] = (record, time.monotonic() + self.ttl)
+            self._records.move_to_end(user_id)
+            while len(self._records) > self.max_size:
+                self._records.popitem(last=False)
+
+    def load(self, user_id):
+        """
+        Loads the user record of an account, from the cache if possible
+        :param user_id: id of the user account
+        :return: the user record or None if the account does not exist
+        :rtype: UserRecord
+        """
+        from .models import UserAccount
+
+        user_id = int(user_id)
+        record = self._get(user_id)
+        if record is not None:
+            return record
+
+        if self.backend is not None:
+            data = self.backend.get(USER_KEY.format(user_id))
+            if data is not None:
+                record = UserRecord(**json.loads(data))
+
+        if record is None:
+            user_account = UserAccount.query.get(user_id)
+            if user_account is None:
+                return None
+            record = UserRecord.from_account(user_account)
+            if self.backend is not None:
+                self.backend.set(USER_KEY.format(user_id), json.dumps(record.to_json()), ex=self.shared_ttl)
+
+        self._put(user_id, record)
+        return record
+
+    def invalidate(self, user_id):
+        """
+        Drops the cached record of an account after it changed or was deleted
+        :param user_id: id of the user account
+        """
+        if user_id is None:
+            return
+        with self._lock:
+            self._records.pop(int(user_id), None)
+        if self.backend is not None:
+            self.backend.delete(USER_KEY.format(user_id))
+
+    def invalidate_on_commit(self, user_id, session=None):
+        """
+        Drops the cached record of an account once the session's change of it is committed.
+        Nothing is dropped if the session rolls back
+        :param user_id: id of the user account
+        :param session: session holding the change, defaults to the current one
+        """
+        session = session or db.session
+        session.info.setdefault(PENDING_INVALIDATIONS, set()).add(user_id)
+
+
+identity_cache = IdentityCache()
+
+
+@event.listens_for(db.session, "after_commit")
+def _invalidate_committed(session):
+    for user_id in session.info.pop(PENDING_INVALIDATIONS, ()):
+        identity_cache.invalidate(user_id)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _forget_rolled_back(session):
+    session.info.pop(PENDING_INVALIDATIONS, None)
@@ -8,10 +8,14 @@ from flask_login import UserMixin
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
 from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Boolean
 from sqlalchemy.orm import relationship
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.orm.attributes import set_committed_value
 
 from app.models import Base
 from .. import db, login_manager
+from .hashing import password_hasher
+from .identity import identity_cache
+from .presence import last_seen_buffer
+from .security_utils import generate_auth_token, verify_auth_token
 
 
 class Permission:
@@ -138,14 +142,18 @@ class UserAccount(Base, UserMixin):
 
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     @password.getter
     def get_password(self):
         return self.password_hash
 
     def verify_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """
+        Checks a password against the account's hash on the password hashing pool
+        :raises: ServiceBusy if too many passwords are being hashed
+        """
+        return password_hasher.verify(self.password_hash, password)
 
     def generate_reset_token(self, expiration=3600):
         """
@@ -173,6 +181,7 @@ class UserAccount(Base, UserMixin):
             return False
         self.password = new_password
         db.session.add(self)
+        identity_cache.invalidate_on_commit(self.id)
         return True
 
     def generate_confirmation_token(self, expiration=3600):
@@ -201,6 +210,7 @@ class UserAccount(Base, UserMixin):
             return False
         self.confirmed = True
         db.session.add(self)
+        identity_cache.invalidate_on_commit(self.id)
         return True
 
     def generate_email_change_token(self, new_email, expiration=3600):
@@ -237,29 +247,28 @@ class UserAccount(Base, UserMixin):
         self.email = new_email
         self.avatar_hash = hashlib.md5(self.email.encode('utf-8')).hexdigest()
         db.session.add(self)
+        identity_cache.invalidate_on_commit(self.id)
         return True
 
-    def generate_auth_token(self, expiration):
+    def generate_auth_token(self, expiration=None):
         """
         Generates an authentication token
         :param expiration: expiration time
-        :return:
+        :return: JWT string, see security_utils.generate_auth_token
         """
-        serializer = Serializer(current_app.config["SECRET_KEY"], expires_in=expiration)
-        return serializer.dumps({"id": self.id}).decode("ascii")
+        return generate_auth_token(self.id, self.username, expiration)
 
-    def verify_auth_token(self, token):
+    @staticmethod
+    def verify_auth_token(token):
         """
         Verifies the generated auth token
         :param token: token to verify
-        :return: None or the user
+        :return: None or the cached user record
         """
-        s = Serializer(current_app.config['SECRET_KEY'])
-        try:
-            data = s.loads(token)
-        except:
+        claims = verify_auth_token(token)
+        if claims is None:
             return None
-        return self.query.get(data['id'])
+        return identity_cache.load(claims["id"])
 
     def can(self, permissions):
         """
@@ -280,10 +289,12 @@ class UserAccount(Base, UserMixin):
 
     def ping(self):
         """
-        Pings the current user and updates their last seen attribute
+        Pings the current user and updates their last seen attribute. The time is written to the
+        database by the last seen buffer, the instance is not made dirty
         """
-        self.last_seen = datetime.now()
-        db.session.add(self)
+        now = datetime.now()
+        set_committed_value(self, "last_seen", now)
+        last_seen_buffer.record(self.id, now)
 
     def __repr__(self):
         return "Id: {},\n uuid: {}, Username: {} ProfileId:{}, AccountStatusId:{}" \
@@ -312,7 +323,18 @@ class UserAccount(Base, UserMixin):
         self.password_hash = user["password"]
 
 
-# This callback is used to reload the user object from the user ID stored in the session
+# This callback is used to reload the user object from the user ID stored in the session. It
+# returns a cached UserRecord, views that change the account load the UserAccount themselves
 @login_manager.user_loader
 def load_user(user_id):
-    return UserAccount.query.get(int(user_id))
+    return identity_cache.load(user_id)
+
+
+# This callback authenticates requests without a session that bear an auth token in an
+# "Authorization: Bearer <token>" header, e.g. machine clients of the API
+@login_manager.request_loader
+def load_user_from_request(request):
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return UserAccount.verify_auth_token(token.strip())
@@ -0,0 +1,121 @@
+"""
+Write behind buffer of the users' last seen times.
+
+Requests only record when a user was seen in memory, several hits of the same user are coalesced
+into the latest one. The recorded times are written with one bulk UPDATE per flush interval by
+a timer thread, so authenticated requests do not write to the database. Every process buffers
+its own hits, the UPDATE never moves a last seen time backwards
+"""
+import atexit
+import threading
+from datetime import datetime
+
+from sqlalchemy import bindparam, or_
+
+from app import app_logger, db
+
+
+class LastSeenBuffer(object):
+    """
+    Buffers last seen times until they are flushed. Configured from the application config on
+    init_app
+    :cvar flush_interval seconds between a hit and the flush that writes it, 0 to only write on
+    explicit flushes
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.flush_interval = 60
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._timer = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Binds the buffer to the app whose database it flushes to and reads the flush interval
+        :param app: the flask app
+        """
+        self.app = app
+        self.flush_interval = app.config.get("LAST_SEEN_FLUSH_INTERVAL", self.flush_interval)
+        with self._lock:
+            self._pending = {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def record(self, user_id, seen=None):
+        """
+        Records that a user was seen, scheduling a flush if none is
+        :param user_id: id of the user account
+        :param seen: datetime the user was seen, defaults to now
+        """
+        seen = seen or datetime.now()
+        with self._lock:
+            if self._pending.get(user_id) is None or self._pending[user_id] < seen:
+                self._pending[user_id] = seen
+            if self._timer is None and self.flush_interval:
+                self._timer = threading.Timer(self.flush_interval, self._flush_in_context)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush_in_context(self):
+        with self._lock:
+            self._timer = None
+        try:
+            with self.app.app_context():
+                self.flush()
+        except Exception as e:
+            app_logger.exception(f"Failed to flush last seen times. Error => {e}")
+
+    def flush(self):
+        """
+        Writes the buffered last seen times with one bulk UPDATE. Times that fail to be written
+        are buffered again unless a later one was recorded meanwhile
+        :return: number of users written
+        :rtype: int
+        """
+        from .models import UserAccount
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        table = UserAccount.__table__
+        statement = table.update() \
+            .where(table.c.id == bindparam("user_id")) \
+            .where(or_(table.c.last_seen.is_(None), table.c.last_seen < bindparam("seen"))) \
+            .values(last_seen=bindparam("seen"))
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(statement, [dict(user_id=user_id, seen=seen) for user_id, seen in pending.items()])
+        except Exception:
+            with self._lock:
+                for user_id, seen in pending.items():
+                    if self._pending.get(user_id) is None or self._pending[user_id] < seen:
+                        self._pending[user_id] = seen
+            raise
+        return len(pending)
+
+    def close(self):
+        """
+        Cancels the scheduled flush and writes the buffered times, used on process exit. Nothing
+        is written when only explicit flushes are configured
+        """
+        with self._lock:
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        if self._pending and self.app is not None and self.flush_interval:
+            self._flush_in_context()
+
+
+last_seen_buffer = LastSeenBuffer()
+atexit.register(last_seen_buffer.close)
@@ -4,14 +4,18 @@ order to confirm his/her account
 url will be something like this http://<base_url>/confirm.
 The key here is the id. We are going to encode the user email (along with a timestamp) in the id using the itsdangerous package.
 """
+import threading
+import time
+from collections import OrderedDict
 from itsdangerous import URLSafeTimedSerializer
 from flask import current_app
 from app import mail
 from flask_mail import Message
-import hashlib
 from datetime import datetime, timedelta
 import jwt
 
+JWT_ALGORITHM = "HS256"
+
 
 def send_mail(to, subject, template):
     """
@@ -55,19 +59,92 @@ def confirm_token(token):
     return email
 
 
-def generate_auth_token(username, password):
+def generate_auth_token(user_id, username, expiration=None):
     """
-    Generates an auth token given a user's username and password, uses a secret key and
-    JWT tokens to generate
+    Generates an auth token for a user, a JWT signed with the secret key. It carries the user's
+    id so that requests bearing it can be authenticated without a database lookup
+    :param user_id: id of the current logged in user
     :param username: username of current logged in user
-    :param password: password of current logged in user
+    :param expiration: seconds the token is valid for, defaults to AUTH_TOKEN_EXPIRATION
     :return: JWT string
     :rtype: str
     """
-    hash_pass = hashlib.sha512(password.encode("UTF-8")).hexdigest()
-
-    user = dict(username=username,password=hash_pass)
-    user['exp'] = datetime.utcnow() + timedelta(minutes=60)
+    expiration = expiration or current_app.config.get("AUTH_TOKEN_EXPIRATION", 3600)
+    now = datetime.utcnow()
+    claims = dict(id=user_id, username=username, iat=now, exp=now + timedelta(seconds=expiration))
     secret_key = current_app.config.get('SECRET_KEY')
-    jwt_string = jwt.encode(user, secret_key)
-    return jwt_string.decode("utf-8")
+    jwt_string = jwt.encode(claims, secret_key, algorithm=JWT_ALGORITHM)
+    return jwt_string.decode("utf-8") if isinstance(jwt_string, bytes) else jwt_string
+
+
+class TokenClaimsCache(object):
+    """
+    LRU cache of the claims of verified auth tokens, each kept until its token expires
+    :cvar max_size number of tokens kept
+    """
+
+    def __init__(self, app=None):
+        self.max_size = 4096
+        self._lock = threading.Lock()
+        self._claims = OrderedDict()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Reads the cache size from the application configuration
+        :param app: the flask app
+        """
+        self.max_size = app.config.get("AUTH_TOKEN_CACHE_SIZE", self.max_size)
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._claims.clear()
+
+    def __len__(self):
+        return len(self._claims)
+
+    def get(self, token, now=None):
+        now = now or time.time()
+        with self._lock:
+            claims = self._claims.get(token)
+            if claims is None:
+                return None
+            if claims["exp"] <= now:
+                del self._claims[token]
+                return None
+            self._claims.move_to_end(token)
+            return claims
+
+    def put(self, token, claims):
+        with self._lock:
+            self._claims[token] = claims
+            self._claims.move_to_end(token)
+            while len(self._claims) > self.max_size:
+                self._claims.popitem(last=False)
+
+
+token_claims_cache = TokenClaimsCache()
+
+
+def verify_auth_token(token):
+    """
+    Verifies the signature and expiry of an auth token from generate_auth_token. The claims of
+    verified tokens are cached until the tokens expire
+    :param token: JWT string
+    :return: the token's claims or None if the token is invalid or has expired
+    :rtype: dict
+    """
+    claims = token_claims_cache.get(token)
+    if claims is not None:
+        return claims
+    try:
+        claims = jwt.decode(token, current_app.config.get("SECRET_KEY"), algorithms=[JWT_ALGORITHM])
+    except jwt.InvalidTokenError:
+        return None
+    if "id" not in claims or "exp" not in claims:
+        return None
+    token_claims_cache.put(token, claims)
+    return claims
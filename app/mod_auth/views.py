@@ -2,7 +2,7 @@ from flask import request, jsonify
 from flask_api.exceptions import AuthenticationFailed, NotFound
 from flask_login import login_user, logout_user, login_required, current_user
 from app import db
-from .exceptions import UserAlreadyExists, CredentialsRequired
+from .exceptions import UserAlreadyExists, CredentialsRequired, ServiceBusy
 
 from . import auth
 from .models import UserAccount, UserProfile
@@ -25,7 +25,7 @@ def login():
         # check for password validity
         if user_account is not None:
             if user_account.verify_password(password):
-                token = generate_auth_token(username, password)
+                token = generate_auth_token(user_account.id, user_account.username)
                 db.session.commit()
                 login_user(user_account)
                 return jsonify({
@@ -99,3 +99,19 @@ def logout():
         })
     else:
         raise NotFound()
+
+
+@auth.app_errorhandler(ServiceBusy)
+def service_busy(error):
+    """
+    Rejects requests that need a password hash while the hashing pool is saturated, asking the
+    client to retry shortly
+    :return: JSON response with a 503 status code and a Retry-After header
+    """
+    response = jsonify({
+        "message": error.detail,
+        "error": True
+    })
+    response.status_code = error.status_code
+    response.headers["Retry-After"] = "1"
+    return response
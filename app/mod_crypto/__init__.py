@@ -4,3 +4,32 @@ crypto = Blueprint(name="crypto", url_prefix="/crypto", static_folder="static",
                    template_folder="templates", import_name=__name__)
 
 from . import views
+
+
+def init_app(app):
+    """
+    Initializes the crypto module's shared service objects with the application configuration
+    :param app: the flask app
+    """
+    from .alerts import alert_engine, trigger_state
+    from .breaker import upstream_breaker
+    from .client import http_client
+    from .dispatch import webhook_dispatcher
+    from .polling import polling_policy
+    from .ratelimit import rate_limiter
+    from .cache import ticker_cache
+    from .singleflight import single_flight
+    from .store import snapshot_store
+    from .stream import price_broadcaster
+
+    http_client.init_app(app)
+    single_flight.init_app(app)
+    rate_limiter.init_app(app)
+    upstream_breaker.init_app(app)
+    price_broadcaster.init_app(app)
+    snapshot_store.init_app(app)
+    ticker_cache.init_app(app)
+    alert_engine.init_app(app)
+    trigger_state.init_app(app)
+    webhook_dispatcher.init_app(app)
+    polling_policy.init_app(app)
@@ -0,0 +1,405 @@
+"""
+Alert rule engine.
+
+Rules are grouped by coin, field and condition, and every group keeps its thresholds in a
+sorted array. Evaluating a snapshot is then one binary search per group: the triggered rules of
+a group are a contiguous slice of it, so the cost is close to O(triggered + coins log rules)
+instead of testing every rule.
+
+User rules come from the alert subscriptions. They are loaded in bulk and the index is only
+rebuilt when the subscriptions' version counter in the shared backend has moved, which every
+change to a subscription bumps.
+
+Trigger state makes alerts edge triggered: a rule that fired is suppressed until the value has
+moved back past its threshold by a hysteresis band, and it does not fire again within a cooldown
+window. Only the fired rules are kept, as one compact map in the shared backend that workers
+only read and write back while holding its lock
+"""
+import json
+import math
+import threading
+import time
+from bisect import bisect_left, bisect_right
+
+from app import db
+from app.backends import get_backend
+from .constants import BITCOIN_PRICE_THRESHOLD
+from .models import AlertSubscription
+from .ticker import Coin
+
+ABOVE = "above"
+BELOW = "below"
+CROSSES_ABOVE = "crosses_above"
+CROSSES_BELOW = "crosses_below"
+CONDITIONS = (ABOVE, BELOW, CROSSES_ABOVE, CROSSES_BELOW)
+CHANNELS = ("ifttt",)
+
+RULES_VERSION_KEY = "crypto:alerts:version"
+TRIGGER_STATE_KEY = "crypto:alerts:fired"
+TRIGGER_STATE_LOCK_KEY = "crypto:alerts:fired:lock"
+
+
+class AlertRule(object):
+    """
+    A single alert rule
+    :cvar id id of the rule
+    :cvar user_id id of the user that owns the rule, None for the application's own rules
+    :cvar coin_id upstream id of the crypto currency, e.g. bitcoin
+    :cvar field upstream key of the numeric field to watch, e.g. price_usd or percent_change_24h
+    :cvar condition one of above, below, crosses_above and crosses_below
+    :cvar threshold value the field is compared with
+    :cvar channel channel the alert is delivered on
+    :cvar webhook_key the owner's key for the channel's webhook, None to use the application's
+    """
+    __slots__ = ("id", "user_id", "coin_id", "field", "condition", "threshold", "channel", "webhook_key")
+
+    def __init__(self, id, user_id, coin_id, field, condition, threshold, channel="ifttt", webhook_key=None):
+        self.id = id
+        self.user_id = user_id
+        self.coin_id = coin_id
+        self.field = field
+        self.condition = condition
+        self.threshold = threshold
+        self.channel = channel
+        self.webhook_key = webhook_key
+
+    def __repr__(self):
+        return "AlertRule(id={}, user_id={}, {} {} {} {})".format(self.id, self.user_id, self.coin_id, self.field,
+                                                                 self.condition, self.threshold)
+
+
+class AlertTrigger(object):
+    """
+    A rule triggered by a snapshot
+    :cvar rule the triggered rule
+    :cvar value value of the rule's field in the snapshot
+    :cvar previous_value value of the rule's field in the previous snapshot, if it was known
+    """
+    __slots__ = ("rule", "value", "previous_value")
+
+    def __init__(self, rule, value, previous_value=None):
+        self.rule = rule
+        self.value = value
+        self.previous_value = previous_value
+
+    def __repr__(self):
+        return "AlertTrigger(rule={}, value={})".format(self.rule, self.value)
+
+
+def validate_rule(rule):
+    """
+    Checks that a rule can be evaluated
+    :param rule: AlertRule
+    :raises ValueError: if the rule watches an unknown field, has an unknown condition or channel
+    or a threshold that is not a finite number
+    """
+    if rule.field not in Coin.ATTRIBUTES or Coin.ATTRIBUTES[rule.field] in ("id", "name", "symbol"):
+        raise ValueError("Rule {} watches unknown field {}".format(rule.id, rule.field))
+    if rule.condition not in CONDITIONS:
+        raise ValueError("Rule {} has unknown condition {}".format(rule.id, rule.condition))
+    if rule.channel not in CHANNELS:
+        raise ValueError("Rule {} has unknown channel {}".format(rule.id, rule.channel))
+    if not isinstance(rule.threshold, (int, float)) or not math.isfinite(rule.threshold):
+        # a NaN would break the order of the threshold arrays the rules are searched in
+        raise ValueError("Rule {} has no finite threshold".format(rule.id))
+
+
+class AlertEngine(object):
+    """
+    Evaluates snapshots against an index of alert rules
+    :cvar size number of rules in the index
+    :cvar version version of the rules the index was built from, None if it was never loaded
+    """
+
+    def __init__(self, rules=(), loader=None):
+        self.loader = loader
+        self.backend = None
+        self.version = None
+        self._lock = threading.Lock()
+        self._index = {}
+        self._rules = {}
+        self.size = 0
+        self.load(rules)
+
+    def init_app(self, app):
+        """
+        Sets up the backend holding the rules' version counter
+        :param app: the flask app
+        """
+        self.backend = get_backend(app)
+        with self._lock:
+            self.version = None
+
+    def invalidate(self):
+        """
+        Bumps the rules' version counter, so that every process rebuilds its index on the next
+        refresh. Call it after a subscription was created, changed or deleted
+        """
+        if self.backend is not None:
+            self.backend.incr(RULES_VERSION_KEY)
+        else:
+            with self._lock:
+                self.version = None
+
+    def refresh(self):
+        """
+        Reloads the rules from the loader if their version counter moved since the last load
+        :return: the engine
+        :rtype: AlertEngine
+        """
+        if self.loader is None:
+            return self
+        version = int(self.backend.get(RULES_VERSION_KEY) or 0) if self.backend is not None else 0
+        with self._lock:
+            if version != self.version:
+                # the version is read before loading, a change made meanwhile triggers another load
+                self.load(self.loader())
+                self.version = version
+        return self
+
+    def load(self, rules):
+        """
+        Replaces the rule index with the given rules
+        :param rules: iterable of AlertRule
+        :raises ValueError: if a rule watches an unknown field or has an unknown condition
+        """
+        groups = {}
+        by_id = {}
+        size = 0
+        for rule in rules:
+            validate_rule(rule)
+            by_id[str(rule.id)] = rule
+            groups.setdefault(rule.coin_id, {}) \
+                .setdefault((Coin.ATTRIBUTES[rule.field], rule.condition), []) \
+                .append(rule)
+            size += 1
+
+        index = {}
+        for coin_id, coin_groups in groups.items():
+            index[coin_id] = {}
+            for group, group_rules in coin_groups.items():
+                group_rules.sort(key=lambda rule: rule.threshold)
+                index[coin_id][group] = ([rule.threshold for rule in group_rules], group_rules)
+
+        self._index = index
+        self._rules = by_id
+        self.size = size
+
+    def get(self, rule_id):
+        """
+        :param rule_id: id of a rule
+        :return: the rule or None if it is not in the index
+        :rtype: AlertRule
+        """
+        return self._rules.get(str(rule_id))
+
+    def coin_ids(self):
+        """
+        :return: ids of the coins watched by at least one rule
+        :rtype: list
+        """
+        return list(self._index)
+
+    def threshold_distance(self, ticker):
+        """
+        Distance of the watched values in a snapshot to their nearest alert threshold, relative to
+        the threshold. Found with one binary search per rule group
+        :param ticker: Ticker snapshot
+        :return: the smallest distance, e.g. 0.02 for 2%, or None if no watched value is known
+        :rtype: float
+        """
+        nearest = None
+        for coin_id, groups in self._index.items():
+            coin = ticker.get(coin_id)
+            if coin is None:
+                continue
+            for (attribute, _), (thresholds, _) in groups.items():
+                value = getattr(coin, attribute)
+                if value is None:
+                    continue
+                position = bisect_left(thresholds, value)
+                for threshold in thresholds[max(position - 1, 0):position + 1]:
+                    distance = abs(value - threshold) / abs(threshold) if threshold else abs(value)
+                    if nearest is None or distance < nearest:
+                        nearest = distance
+        return nearest
+
+    def evaluate(self, ticker, previous=None):
+        """
+        Evaluates a snapshot against all rules
+        :param ticker: Ticker snapshot
+        :param previous: the Ticker snapshot before it, needed for the crosses conditions
+        :return: the triggered rules
+        :rtype: list of AlertTrigger
+        """
+        triggered = []
+        for coin_id, groups in self._index.items():
+            coin = ticker.get(coin_id)
+            if coin is None:
+                continue
+            previous_coin = previous.get(coin_id) if previous is not None else None
+
+            for (attribute, condition), (thresholds, rules) in groups.items():
+                value = getattr(coin, attribute)
+                if value is None:
+                    continue
+                previous_value = getattr(previous_coin, attribute) if previous_coin is not None else None
+
+                if condition == ABOVE:
+                    matched = rules[:bisect_left(thresholds, value)]
+                elif condition == BELOW:
+                    matched = rules[bisect_right(thresholds, value):]
+                elif previous_value is None:
+                    continue
+                elif condition == CROSSES_ABOVE:
+                    # previous value < threshold <= value
+                    matched = rules[bisect_right(thresholds, previous_value):bisect_right(thresholds, value)]
+                else:
+                    # value <= threshold < previous value
+                    matched = rules[bisect_left(thresholds, value):bisect_left(thresholds, previous_value)]
+
+                triggered.extend(AlertTrigger(rule, value, previous_value) for rule in matched)
+        return triggered
+
+
+class TriggerState(object):
+    """
+    Per rule trigger state shared by all workers. A rule is armed until it fires, then it is
+    suppressed while its condition holds and re-armed once the value is back past the threshold
+    by more than the hysteresis band. A re-armed rule fires again only after the cooldown
+    :cvar hysteresis width of the band as a fraction of the threshold, e.g. 0.01 for 1%
+    :cvar cooldown minimum seconds between two alerts of the same rule
+    :cvar lock_timeout seconds after which the lock of the state is released if its holder died
+    """
+
+    def __init__(self, app=None):
+        self.hysteresis = 0.01
+        self.cooldown = 3600
+        self.lock_timeout = 30
+        self.backend = None
+        self._fired = {}
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Sets up the backend and the hysteresis and cooldown from the application configuration
+        :param app: the flask app
+        """
+        self.backend = get_backend(app)
+        self.hysteresis = app.config.get("ALERT_HYSTERESIS", self.hysteresis)
+        self.cooldown = app.config.get("ALERT_COOLDOWN", self.cooldown)
+
+    def _locked(self):
+        if self.backend is None:
+            return self._lock
+        return self.backend.lock(TRIGGER_STATE_LOCK_KEY, timeout=self.lock_timeout)
+
+    def _load(self):
+        if self.backend is None:
+            return dict(self._fired)
+        blob = self.backend.get(TRIGGER_STATE_KEY)
+        if not blob:
+            return {}
+        return json.loads(blob.decode("utf-8") if isinstance(blob, bytes) else blob)
+
+    def _save(self, fired):
+        if self.backend is None:
+            self._fired = fired
+        else:
+            self.backend.set(TRIGGER_STATE_KEY, json.dumps(fired))
+
+    def coin_ids(self, engine):
+        """
+        :param engine: AlertEngine the fired rules are looked up in
+        :return: ids of the coins of rules that fired and are not back to armed yet. They can fire
+        again once their cooldown ended even if their coin did not change
+        :rtype: set
+        """
+        return {rule.coin_id for rule in map(engine.get, self._load()) if rule is not None}
+
+    def _rearms(self, rule, value):
+        """
+        :return: whether the value is back past the rule's threshold by more than the band
+        :rtype: bool
+        """
+        if value is None:
+            return False
+        band = abs(rule.threshold) * self.hysteresis
+        if rule.condition in (ABOVE, CROSSES_ABOVE):
+            return value < rule.threshold - band
+        return value > rule.threshold + band
+
+    def filter(self, triggers, engine, ticker, now=None):
+        """
+        Updates the trigger state with a snapshot's triggers and drops the triggers of rules
+        that already fired. Fired rules that are no longer triggered are checked for re-arming.
+        The state is read and only written back if it changed under its lock, so that workers
+        evaluating snapshots concurrently do not overwrite each other's updates
+        :param triggers: AlertTrigger list the engine returned for the snapshot
+        :param engine: AlertEngine the triggers come from, used to look the fired rules up
+        :param ticker: Ticker snapshot the triggers were evaluated on
+        :param now: unix timestamp of the evaluation, defaults to now
+        :return: the triggers to deliver
+        :rtype: list of AlertTrigger
+        """
+        now = now or time.time()
+        with self._locked():
+            fired = self._load()
+            state = {}
+            deliver = []
+
+            for trigger in triggers:
+                key = str(trigger.rule.id)
+                entry = fired.get(key)
+                if entry is None or (entry[1] and now - entry[0] >= self.cooldown):
+                    deliver.append(trigger)
+                    state[key] = [now, False]
+                else:
+                    state[key] = entry
+
+            for key, (fired_at, rearmed) in fired.items():
+                if key in state:
+                    continue
+                rule = engine.get(key)
+                if rule is None:
+                    continue
+                if not rearmed:
+                    coin = ticker.get(rule.coin_id)
+                    rearmed = coin is not None and self._rearms(rule, getattr(coin, Coin.ATTRIBUTES[rule.field]))
+                if rearmed and now - fired_at >= self.cooldown:
+                    # back to armed, nothing needs to be remembered about the rule
+                    continue
+                state[key] = [fired_at, rearmed]
+
+            if state != fired:
+                self._save(state)
+        return deliver
+
+
+def default_rules():
+    """
+    :return: the application's own alert rules
+    :rtype: list of AlertRule
+    """
+    return [AlertRule(0, None, "bitcoin", "price_usd", BELOW, BITCOIN_PRICE_THRESHOLD)]
+
+
+def subscription_rules():
+    """
+    Loads the application's rules and the rules of all active subscriptions with one query
+    :return: list of AlertRule
+    """
+    rows = db.session.query(AlertSubscription.id, AlertSubscription.user_account_id, AlertSubscription.coin_id,
+                            AlertSubscription.field, AlertSubscription.condition, AlertSubscription.threshold,
+                            AlertSubscription.channel, AlertSubscription.webhook_key) \
+        .filter(AlertSubscription.active.is_(True)) \
+        .all()
+    # rows stored before thresholds were checked to be finite are skipped, not loaded
+    return default_rules() + [AlertRule(*row) for row in rows if math.isfinite(row.threshold)]
+
+
+alert_engine = AlertEngine(default_rules(), loader=subscription_rules)
+trigger_state = TriggerState()
@@ -0,0 +1,143 @@
+"""
+Circuit breaker for the upstream API.
+
+The outcomes of the recent upstream calls are kept in a sliding time window. Once enough of
+them failed the breaker opens and calls fail fast, without touching the network, so that request
+threads never queue up behind a dead upstream and callers fall back to the last good snapshot.
+After a cool off a single probe call is let through: it closes the breaker again if it succeeds
+and re-opens it if it fails
+"""
+import threading
+import time
+from collections import deque
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker(object):
+    """
+    Per process circuit breaker. Configured from the application config on init_app
+    :cvar window seconds of call outcomes the failure rate is computed over
+    :cvar min_calls number of calls in the window needed before the breaker may open
+    :cvar failure_rate fraction of failed calls in the window that opens the breaker
+    :cvar open_timeout seconds the breaker stays open before a probe call is let through
+    :cvar state closed, open or half_open
+    """
+
+    def __init__(self, app=None):
+        self.window = 60
+        self.min_calls = 5
+        self.failure_rate = 0.5
+        self.open_timeout = 30
+        self.state = CLOSED
+        self._lock = threading.Lock()
+        self._outcomes = deque()
+        self._opened_at = None
+        self._probing = False
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Reads the window, thresholds and timeout from the application configuration and closes
+        the breaker
+        :param app: the flask app
+        """
+        self.window = app.config.get("CIRCUIT_BREAKER_WINDOW", self.window)
+        self.min_calls = app.config.get("CIRCUIT_BREAKER_MIN_CALLS", self.min_calls)
+        self.failure_rate = app.config.get("CIRCUIT_BREAKER_FAILURE_RATE", self.failure_rate)
+        self.open_timeout = app.config.get("CIRCUIT_BREAKER_OPEN_TIMEOUT", self.open_timeout)
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.state = CLOSED
+            self._outcomes.clear()
+            self._opened_at = None
+            self._probing = False
+
+    @property
+    def retry_after(self):
+        """
+        :return: seconds until the open breaker lets a probe call through, 0 if it is not open
+        :rtype: int
+        """
+        opened_at = self._opened_at
+        if self.state != OPEN or opened_at is None:
+            return 0
+        return max(int(opened_at + self.open_timeout - time.monotonic()) + 1, 0)
+
+    def allow(self):
+        """
+        Checks whether a call may be made. An open breaker becomes half open once its timeout
+        expired, and then lets exactly one probe call through at a time
+        :return: True if the call may be made, False if it should fail fast
+        :rtype: bool
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_timeout:
+                    return False
+                self.state = HALF_OPEN
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def cancel(self):
+        """
+        Gives up a call that allow let through without making it, freeing the probe slot of a
+        half open breaker
+        """
+        with self._lock:
+            self._probing = False
+
+    def _trim(self, now):
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            self._outcomes.popleft()
+
+    def _open(self, now):
+        self.state = OPEN
+        self._opened_at = now
+        self._probing = False
+        self._outcomes.clear()
+
+    def record_success(self):
+        """
+        Records a successful call, closing a half open breaker
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.state = CLOSED
+                self._probing = False
+                self._outcomes.clear()
+            self._trim(now)
+            self._outcomes.append((now, True))
+
+    def record_failure(self):
+        """
+        Records a failed call, opening the breaker if the probe failed or the failure rate
+        in the window reached the threshold
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._open(now)
+                return
+            self._trim(now)
+            self._outcomes.append((now, False))
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if len(self._outcomes) >= self.min_calls and failures >= self.failure_rate * len(self._outcomes):
+                self._open(now)
+
+    def to_json(self):
+        return dict(state=self.state, calls=len(self._outcomes), retry_after=self.retry_after)
+
+
+upstream_breaker = CircuitBreaker()
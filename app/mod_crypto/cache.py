@@ -0,0 +1,120 @@
+"""
+In process cache for the ticker snapshot.
+
+The upstream ticker only changes about once a minute, so the last full response is kept for a
+configurable TTL. Once it expires the stale snapshot keeps being served while a single
+background refresh fetches the next one
+"""
+import threading
+import time
+
+from app import app_logger
+from .store import snapshot_store
+
+
+class TickerCache(object):
+    """
+    Ticker snapshot cache with stale-while-revalidate semantics
+    :cvar ttl number of seconds a snapshot is considered fresh
+    """
+
+    def __init__(self, loader, app=None):
+        """
+        :param loader: callable returning the full Ticker or None on failure
+        :param app: the flask app
+        """
+        self.ttl = 60
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._fetched_at = 0
+        self._refreshing = False
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Reads the TTL from the application configuration and drops any cached snapshot
+        :param app: the flask app
+        """
+        self.ttl = app.config.get("TICKER_CACHE_TTL", self.ttl)
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._snapshot = None
+            self._fetched_at = 0
+
+    @property
+    def age(self):
+        """
+        :return: seconds since the current snapshot was fetched, None if there is none
+        """
+        if self._snapshot is None:
+            return None
+        return time.monotonic() - self._fetched_at
+
+    @property
+    def is_stale(self):
+        age = self.age
+        return age is None or age >= self.ttl
+
+    def _store(self, snapshot):
+        with self._lock:
+            self._snapshot = snapshot
+            self._fetched_at = time.monotonic()
+
+    def refresh(self):
+        """
+        Fetches a new snapshot, keeping the current one if the fetch fails
+        :return: the new snapshot or None if the fetch failed
+        """
+        snapshot = self._loader()
+        if snapshot:
+            self._store(snapshot)
+        return snapshot
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            app_logger.exception(f"Failed to refresh ticker snapshot. Error => {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _schedule_refresh(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, name="ticker-cache-refresh", daemon=True).start()
+
+    def get_all(self):
+        """
+        Gets the cached ticker snapshot. A cold cache is filled synchronously, an expired one
+        is returned as is while a background refresh runs
+        :return: ticker snapshot or None if none could be fetched
+        :rtype: Ticker
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.refresh()
+        if self.is_stale:
+            self._schedule_refresh()
+        return snapshot
+
+    def get(self, crypto_currency):
+        """
+        Gets a single crypto currency from the cached snapshot. Coins that are not part of the
+        snapshot are not fetched on their own, the snapshot holds every coin the upstream lists
+        :param crypto_currency: crypto currency id
+        :return: crypto currency or None if it could not be found
+        :rtype: Coin
+        """
+        snapshot = self.get_all()
+        return snapshot.get(crypto_currency) if snapshot is not None else None
+
+
+ticker_cache = TickerCache(snapshot_store.load)
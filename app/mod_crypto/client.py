@@ -0,0 +1,183 @@
+"""
+Shared HTTP client for the upstream ticker and IFTTT calls.
+
+A single requests.Session is kept per process so that consecutive calls re-use pooled
+keep-alive connections instead of doing a new TCP + TLS handshake each time. The pool is
+re-created after a fork so that gunicorn/celery workers never share sockets with the parent
+"""
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class PoolStats(object):
+    """
+    Connection pool counters. A hit is a request that was served over an already open
+    connection, a miss is one that had to open (and handshake) a new connection
+    :cvar checkouts number of times a connection was taken from the pool
+    :cvar misses number of new connections that were opened
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.misses = 0
+
+    def record_checkout(self):
+        with self._lock:
+            self.checkouts += 1
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    @property
+    def hits(self):
+        return self.checkouts - self.misses
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.misses = 0
+
+    def to_json(self):
+        return dict(checkouts=self.checkouts, hits=self.hits, misses=self.misses)
+
+
+def _counting_pool_class(pool_class, stats):
+    """
+    Creates a subclass of the given urllib3 connection pool class that reports connection
+    checkouts and newly opened connections to the given stats
+    :param pool_class: urllib3 connection pool class
+    :param stats: PoolStats to report to
+    :return: connection pool class
+    """
+
+    class CountingConnectionPool(pool_class):
+
+        def _get_conn(self, timeout=None):
+            stats.record_checkout()
+            return super(CountingConnectionPool, self)._get_conn(timeout=timeout)
+
+        def _new_conn(self):
+            stats.record_miss()
+            return super(CountingConnectionPool, self)._new_conn()
+
+    CountingConnectionPool.__name__ = "Counting" + pool_class.__name__
+    return CountingConnectionPool
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """
+    HTTP adapter whose connection pools report hits and misses to a PoolStats object
+    """
+
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        super(CountingHTTPAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(CountingHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool_class(HTTPConnectionPool, self.stats),
+            "https": _counting_pool_class(HTTPSConnectionPool, self.stats),
+        }
+
+
+class HttpClient(object):
+    """
+    Per process pooled HTTP client. Configured from the application config on init_app
+    :cvar connect_timeout seconds to wait for a connection to be established
+    :cvar read_timeout seconds to wait for the server to send a response
+    :cvar pool_connections number of hosts to keep connection pools for
+    :cvar pool_maxsize number of connections to keep open per host
+    """
+
+    def __init__(self, app=None):
+        self.connect_timeout = 3.05
+        self.read_timeout = 10
+        self.pool_connections = 4
+        self.pool_maxsize = 10
+        self.stats = PoolStats()
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Reads the timeouts and pool sizes from the application configuration and drops any
+        session created with the previous configuration
+        :param app: the flask app
+        """
+        self.connect_timeout = app.config.get("HTTP_CONNECT_TIMEOUT", self.connect_timeout)
+        self.read_timeout = app.config.get("HTTP_READ_TIMEOUT", self.read_timeout)
+        self.pool_connections = app.config.get("HTTP_POOL_CONNECTIONS", self.pool_connections)
+        self.pool_maxsize = app.config.get("HTTP_POOL_MAXSIZE", self.pool_maxsize)
+        self.close()
+        self.stats.reset()
+
+    @property
+    def timeout(self):
+        return self.connect_timeout, self.read_timeout
+
+    @property
+    def session(self):
+        """
+        Session for the current process, created lazily. A forked child gets a fresh session
+        :return: pooled session
+        :rtype: requests.Session
+        """
+        pid = os.getpid()
+        if self._session is None or self._pid != pid:
+            with self._lock:
+                if self._session is None or self._pid != pid:
+                    self._session = self._create_session()
+                    self._pid = pid
+        return self._session
+
+    def _create_session(self):
+        session = requests.Session()
+        adapter = CountingHTTPAdapter(self.stats, pool_connections=self.pool_connections,
+                                      pool_maxsize=self.pool_maxsize)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def get(self, url, **kwargs):
+        """
+        Sends a GET request over the pooled session
+        :param url: url to send the request to
+        :return: response
+        :rtype: requests.Response
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """
+        Sends a POST request over the pooled session
+        :param url: url to send the request to
+        :return: response
+        :rtype: requests.Response
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.post(url, **kwargs)
+
+    def close(self):
+        """
+        Closes the pooled connections of this process
+        """
+        with self._lock:
+            if self._session is not None and self._pid == os.getpid():
+                self._session.close()
+            self._session = None
+            self._pid = None
+
+
+http_client = HttpClient()
@@ -1,3 +1,7 @@
 COINMARKET_CAP_API_URL = "https://api.coinmarketcap.com/v1/ticker/"
 IFTTT_BASE_URL = "https://maker.ifttt.com/trigger/{}/with/key/"
 BITCOIN_PRICE_THRESHOLD = 10000  # Set this to whatever you like
+TICKER_POLL_INTERVAL = 60  # seconds between ticker snapshot refreshes
+ROLLUP_RESOLUTIONS = (60, 3600, 86400)  # bucket sizes in seconds of the 1m, 1h and 1d price rollups
+DIGEST_INTERVAL = 3600  # seconds between two telegram price digests
+DIGEST_STEP = 300  # seconds between two prices listed in a telegram price digest
@@ -0,0 +1,261 @@
+"""
+Concurrent webhook dispatcher.
+
+A batch of webhook deliveries is sent by a bounded pool of threads over the shared pooled HTTP
+client. Requests to the same host are further limited, so that one slow host cannot take every
+worker. Deliveries answered with 429 or a 5xx, or failing on the network, are retried with
+jittered exponential backoff. Those that still fail end up on a dead letter list
+"""
+import math
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from requests import RequestException
+from app import app_logger
+from .client import http_client
+from .constants import IFTTT_BASE_URL
+
+
+class WebhookDelivery(object):
+    """
+    A single webhook event to deliver
+    :cvar event name of the IFTTT event
+    :cvar key IFTTT webhook key of the receiving account, None for the application's key
+    :cvar data payload to post
+    :cvar attempts number of requests made for this delivery
+    :cvar status HTTP status of the last response, None if no response was received
+    :cvar error description of the last failure
+    :cvar latency seconds from the first attempt until the delivery succeeded or was given up
+    """
+    __slots__ = ("event", "key", "data", "attempts", "status", "error", "latency")
+
+    def __init__(self, event, key, data):
+        self.event = event
+        self.key = key
+        self.data = data
+        self.attempts = 0
+        self.status = None
+        self.error = None
+        self.latency = None
+
+    def __repr__(self):
+        return "WebhookDelivery(event={}, attempts={}, status={}, error={})".format(
+            self.event, self.attempts, self.status, self.error)
+
+    def to_json(self):
+        return dict(event=self.event, data=self.data, attempts=self.attempts, status=self.status,
+                    error=self.error)
+
+
+def percentile(values, fraction):
+    """
+    Nearest rank percentile
+    :param values: sorted list of numbers
+    :param fraction: percentile as a fraction, e.g. 0.99
+    :return: the percentile or None if there are no values
+    """
+    if not values:
+        return None
+    rank = max(int(math.ceil(fraction * len(values))) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+class BatchReport(object):
+    """
+    Outcome of dispatching a batch of deliveries
+    :cvar sent number of deliveries that succeeded
+    :cvar failed deliveries that were given up on
+    :cvar attempts number of requests made
+    :cvar duration seconds the batch took
+    :cvar latencies sorted latencies of all deliveries in seconds
+    """
+
+    def __init__(self, sent, failed, attempts, duration, latencies):
+        self.sent = sent
+        self.failed = failed
+        self.attempts = attempts
+        self.duration = duration
+        self.latencies = latencies
+
+    @property
+    def throughput(self):
+        """
+        :return: deliveries completed per second
+        :rtype: float
+        """
+        total = self.sent + len(self.failed)
+        return total / self.duration if self.duration > 0 else float(total)
+
+    def to_json(self, details=False):
+        """
+        :param details: whether to include the latencies and the failed deliveries, which
+        merge_reports needs to combine reports
+        :return: summary of the report
+        :rtype: dict
+        """
+        report = dict(
+            sent=self.sent,
+            failed=len(self.failed),
+            attempts=self.attempts,
+            duration=self.duration,
+            throughput=self.throughput,
+            latency_p50=percentile(self.latencies, 0.5),
+            latency_p90=percentile(self.latencies, 0.9),
+            latency_p99=percentile(self.latencies, 0.99),
+            latency_max=self.latencies[-1] if self.latencies else None,
+        )
+        if details:
+            report.update(latencies=self.latencies,
+                          dead_letters=[delivery if isinstance(delivery, dict) else delivery.to_json()
+                                        for delivery in self.failed])
+        return report
+
+
+def merge_reports(reports):
+    """
+    Combines the detailed reports of chunks of one batch that were dispatched in parallel
+    :param reports: list of dicts returned by BatchReport.to_json(details=True)
+    :return: report of the whole batch, its failed deliveries are dicts and its duration is that
+    of the slowest chunk
+    :rtype: BatchReport
+    """
+    return BatchReport(sent=sum(report["sent"] for report in reports),
+                       failed=[delivery for report in reports for delivery in report["dead_letters"]],
+                       attempts=sum(report["attempts"] for report in reports),
+                       duration=max([report["duration"] for report in reports] or [0]),
+                       latencies=sorted(latency for report in reports for latency in report["latencies"]))
+
+
+class WebhookDispatcher(object):
+    """
+    Sends batches of webhook deliveries concurrently. Configured from the application config on
+    init_app
+    :cvar max_concurrency number of requests in flight at once
+    :cvar max_per_host number of requests in flight at once to the same host. It is also capped
+    at the HTTP client's pool size, so that every request reuses a pooled connection
+    :cvar max_retries number of retries of a delivery after the first attempt
+    :cvar backoff_base seconds the first retry waits for at most, doubled on every further retry
+    :cvar backoff_max upper bound in seconds of the wait before a retry
+    :cvar default_key IFTTT webhook key used for deliveries without a key of their own
+    :cvar dead_letters most recent deliveries that were given up on
+    :cvar chunk_size number of deliveries per chunk when a batch is fanned out across workers
+    """
+    RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+    def __init__(self, client=http_client, app=None):
+        self.client = client
+        self.max_concurrency = 16
+        self.max_per_host = 8
+        self.max_retries = 3
+        self.backoff_base = 0.5
+        self.backoff_max = 30
+        self.default_key = None
+        self.dead_letters = deque(maxlen=1000)
+        self.chunk_size = 100
+        self.sleep = time.sleep
+        self._lock = threading.Lock()
+        self._host_limits = {}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Reads the concurrency, retry and dead letter settings from the application configuration
+        :param app: the flask app
+        """
+        self.max_concurrency = app.config.get("WEBHOOK_MAX_CONCURRENCY", self.max_concurrency)
+        self.max_per_host = app.config.get("WEBHOOK_MAX_PER_HOST", self.max_per_host)
+        self.max_retries = app.config.get("WEBHOOK_MAX_RETRIES", self.max_retries)
+        self.backoff_base = app.config.get("WEBHOOK_BACKOFF_BASE", self.backoff_base)
+        self.backoff_max = app.config.get("WEBHOOK_BACKOFF_MAX", self.backoff_max)
+        self.default_key = app.config.get("IFTTT_WEBHOOK_KEY", self.default_key)
+        self.dead_letters = deque(maxlen=app.config.get("WEBHOOK_DEAD_LETTER_SIZE", self.dead_letters.maxlen))
+        self.chunk_size = app.config.get("WEBHOOK_CHUNK_SIZE", self.chunk_size)
+        with self._lock:
+            self._host_limits = {}
+
+    def url(self, delivery):
+        """
+        :param delivery: WebhookDelivery
+        :return: IFTTT url of the delivery's event and key
+        """
+        return IFTTT_BASE_URL.format(delivery.event) + (delivery.key or self.default_key or "")
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            limit = self._host_limits.get(host)
+            if limit is None:
+                limit = threading.BoundedSemaphore(max(min(self.max_per_host, self.client.pool_maxsize), 1))
+                self._host_limits[host] = limit
+            return limit
+
+    def _backoff(self, attempt, response=None):
+        """
+        Full jitter backoff: a random wait between 0 and base * 2 ** attempt, capped at backoff_max.
+        A Retry-After given in seconds with a 429 is honoured as the lower bound
+        """
+        wait = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                wait = max(wait, min(float(retry_after), self.backoff_max))
+        return wait
+
+    def _send(self, delivery):
+        url = self.url(delivery)
+        limit = self._host_limit(url)
+        started_at = time.monotonic()
+
+        while True:
+            response = None
+            delivery.attempts += 1
+            try:
+                with limit:
+                    response = self.client.post(url, json=delivery.data)
+                delivery.status = response.status_code
+                delivery.error = None if response.ok else (response.reason or f"HTTP {response.status_code}")
+                retry = response.status_code in self.RETRY_STATUSES
+            except RequestException as e:
+                delivery.status = None
+                delivery.error = str(e)
+                retry = True
+
+            if delivery.error is None or not retry or delivery.attempts > self.max_retries:
+                break
+            self.sleep(self._backoff(delivery.attempts - 1, response))
+
+        delivery.latency = time.monotonic() - started_at
+        return delivery
+
+    def dispatch(self, deliveries):
+        """
+        Sends a batch of deliveries and waits for all of them to succeed or be given up on
+        :param deliveries: list of WebhookDelivery
+        :return: report of the batch
+        :rtype: BatchReport
+        """
+        started_at = time.monotonic()
+        if deliveries:
+            workers = max(min(self.max_concurrency, len(deliveries)), 1)
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="webhook") as executor:
+                list(executor.map(self._send, deliveries))
+
+        failed = [delivery for delivery in deliveries if delivery.error is not None]
+        for delivery in failed:
+            app_logger.error(f"Giving up on webhook event {delivery.event} after {delivery.attempts} "
+                             f"attempts. Error => {delivery.error}")
+        self.dead_letters.extend(failed)
+
+        return BatchReport(sent=len(deliveries) - len(failed), failed=failed,
+                           attempts=sum(delivery.attempts for delivery in deliveries),
+                           duration=time.monotonic() - started_at,
+                           latencies=sorted(delivery.latency for delivery in deliveries))
+
+
+webhook_dispatcher = WebhookDispatcher()
@@ -0,0 +1,208 @@
+"""
+Price history persistence and queries.
+
+Every snapshot is recorded as raw ticks and rolled up incrementally into 1 minute, 1 hour and
+1 day OHLC buckets, so that history queries with a coarse step read a few hundred rollups
+instead of every tick
+"""
+import calendar
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import bindparam
+
+from app import db
+from .constants import ROLLUP_RESOLUTIONS
+from .models import PriceTick, PriceRollup
+
+
+def to_timestamp(date):
+    """
+    :param date: naive UTC datetime
+    :return: unix timestamp
+    :rtype: int
+    """
+    return calendar.timegm(date.utctimetuple())
+
+
+def _bucket_start(date, resolution):
+    """
+    :param date: naive UTC datetime
+    :param resolution: bucket size in seconds
+    :return: naive UTC datetime of the start of the bucket the date falls in
+    """
+    timestamp = to_timestamp(date)
+    return datetime.utcfromtimestamp(timestamp - timestamp % resolution)
+
+
+def _tick_time(coin, fetched_at):
+    return datetime.utcfromtimestamp(coin.last_updated) if coin.last_updated else fetched_at
+
+
+def _insert_batches(table, rows):
+    batch_size = current_app.config.get("PRICE_TICK_INSERT_BATCH_SIZE", 1000)
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(table.insert().values(rows[start:start + batch_size]))
+
+
+def record_price_ticks(ticker):
+    """
+    Persists the prices of a ticker snapshot. All coins are written with one multi-row INSERT
+    per PRICE_TICK_INSERT_BATCH_SIZE coins instead of one statement per coin
+    :param ticker: Ticker snapshot
+    :return: number of ticks written
+    :rtype: int
+    """
+    now = datetime.utcnow()
+    fetched_at = datetime.utcfromtimestamp(ticker.fetched_at)
+    rows = [dict(
+        coin_id=coin.id,
+        timestamp=_tick_time(coin, fetched_at),
+        price_usd=coin.price_usd,
+        price_btc=coin.price_btc,
+        volume_24h_usd=coin.volume_24h_usd,
+        market_cap_usd=coin.market_cap_usd,
+        date_created=now,
+        date_modified=now,
+    ) for coin in ticker]
+    if not rows:
+        return 0
+
+    _insert_batches(PriceTick.__table__, rows)
+    db.session.commit()
+    return len(rows)
+
+
+def update_price_rollups(ticker):
+    """
+    Rolls the prices of a ticker snapshot up into the 1m, 1h and 1d buckets. Per resolution the
+    open buckets of the snapshot's coins are read with one query, new buckets are written with
+    multi-row INSERTs and changed ones with one batched UPDATE. Ticks that are not newer than a
+    bucket's close are ignored, so re-ingesting an unchanged coin is a no-op
+    :param ticker: Ticker snapshot
+    :return: number of rollups inserted or updated
+    :rtype: int
+    """
+    fetched_at = datetime.utcfromtimestamp(ticker.fetched_at)
+    ticks = [(coin, _tick_time(coin, fetched_at)) for coin in ticker if coin.price_usd is not None]
+    if not ticks:
+        return 0
+
+    now = datetime.utcnow()
+    table = PriceRollup.__table__
+    update = table.update().where(table.c.id == bindparam("_id")).values(
+        high=bindparam("_high"), low=bindparam("_low"), close=bindparam("_close"),
+        volume_24h_usd=bindparam("_volume_24h_usd"), close_at=bindparam("_close_at"),
+        ticks=bindparam("_ticks"), date_modified=bindparam("_date_modified"))
+    written = 0
+
+    for resolution in ROLLUP_RESOLUTIONS:
+        buckets = {(coin.id, _bucket_start(tick_at, resolution)): (coin, tick_at) for coin, tick_at in ticks}
+        coin_ids = {coin_id for coin_id, _ in buckets}
+        bucket_starts = {bucket for _, bucket in buckets}
+        existing = {(rollup.coin_id, rollup.bucket): rollup for rollup in db.session.query(
+            PriceRollup.id, PriceRollup.coin_id, PriceRollup.bucket, PriceRollup.high, PriceRollup.low,
+            PriceRollup.close_at, PriceRollup.ticks).filter(
+            PriceRollup.resolution == resolution, PriceRollup.coin_id.in_(coin_ids),
+            PriceRollup.bucket.in_(bucket_starts))}
+
+        inserts = []
+        updates = []
+        for (coin_id, bucket), (coin, tick_at) in buckets.items():
+            price = coin.price_usd
+            rollup = existing.get((coin_id, bucket))
+            if rollup is None:
+                inserts.append(dict(coin_id=coin_id, resolution=resolution, bucket=bucket, open=price,
+                                    high=price, low=price, close=price, volume_24h_usd=coin.volume_24h_usd,
+                                    close_at=tick_at, ticks=1, date_created=now, date_modified=now))
+            elif tick_at > rollup.close_at:
+                updates.append(dict(_id=rollup.id, _high=max(rollup.high, price), _low=min(rollup.low, price),
+                                    _close=price, _volume_24h_usd=coin.volume_24h_usd, _close_at=tick_at,
+                                    _ticks=rollup.ticks + 1, _date_modified=now))
+
+        if inserts:
+            _insert_batches(table, inserts)
+        if updates:
+            db.session.execute(update, updates)
+        written += len(inserts) + len(updates)
+
+    db.session.commit()
+    return written
+
+
+def _rollup_resolution(step):
+    """
+    Picks the coarsest rollup resolution that is not longer than a step. Rollup buckets are
+    assigned to the step they start in, so a step that is not a multiple of the resolution is
+    built from whole buckets
+    :param step: requested step in seconds
+    :return: resolution in seconds or None if the step needs raw ticks
+    """
+    if not step:
+        return None
+    resolutions = [resolution for resolution in ROLLUP_RESOLUTIONS if resolution <= step]
+    return max(resolutions) if resolutions else None
+
+
+def get_price_history(coin_id, start, end, step=None):
+    """
+    Gets the price history of a crypto currency. Steps of at least the finest rollup resolution
+    are served from the coarsest rollup not longer than the step, shorter ones with a range scan
+    over the raw ticks' (coin_id, timestamp) index
+    :param coin_id: upstream id of the crypto currency
+    :param start: naive UTC datetime of the oldest tick to include
+    :param end: naive UTC datetime of the newest tick to include
+    :param step: if given, one entry is returned for every step seconds long bucket
+    :return: list of ticks or OHLC buckets ordered by time
+    :rtype: list
+    """
+    resolution = _rollup_resolution(step)
+    if resolution is not None:
+        return _get_rollup_history(coin_id, start, end, resolution, step)
+    return _get_tick_history(coin_id, start, end, step)
+
+
+def _get_rollup_history(coin_id, start, end, resolution, step):
+    rows = db.session.query(PriceRollup.bucket, PriceRollup.open, PriceRollup.high, PriceRollup.low,
+                            PriceRollup.close, PriceRollup.volume_24h_usd) \
+        .filter(PriceRollup.coin_id == coin_id, PriceRollup.resolution == resolution,
+                PriceRollup.bucket >= _bucket_start(start, resolution), PriceRollup.bucket <= end) \
+        .order_by(PriceRollup.bucket) \
+        .all()
+
+    history = []
+    last_bucket = None
+    for bucket, open_, high, low, close, volume_24h_usd in rows:
+        timestamp = to_timestamp(bucket)
+        step_bucket = timestamp - timestamp % step
+        if step_bucket == last_bucket:
+            entry = history[-1]
+            entry.update(high=max(entry["high"], high), low=min(entry["low"], low), close=close,
+                         price_usd=close, volume_24h_usd=volume_24h_usd)
+            continue
+        last_bucket = step_bucket
+        history.append(dict(timestamp=step_bucket, open=open_, high=high, low=low, close=close,
+                            price_usd=close, volume_24h_usd=volume_24h_usd))
+    return history
+
+
+def _get_tick_history(coin_id, start, end, step):
+    rows = db.session.query(PriceTick.timestamp, PriceTick.price_usd, PriceTick.price_btc,
+                            PriceTick.volume_24h_usd, PriceTick.market_cap_usd) \
+        .filter(PriceTick.coin_id == coin_id, PriceTick.timestamp >= start, PriceTick.timestamp <= end) \
+        .order_by(PriceTick.timestamp) \
+        .all()
+
+    history = []
+    last_bucket = None
+    for timestamp, price_usd, price_btc, volume_24h_usd, market_cap_usd in rows:
+        tick = dict(timestamp=to_timestamp(timestamp), price_usd=price_usd, price_btc=price_btc,
+                    volume_24h_usd=volume_24h_usd, market_cap_usd=market_cap_usd)
+        if step:
+            bucket = tick["timestamp"] // step
+            if bucket == last_bucket:
+                history[-1] = tick
+                continue
+            last_bucket = bucket
+        history.append(tick)
+    return history
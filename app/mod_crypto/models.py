@@ -0,0 +1,169 @@
+from sqlalchemy import Column, String, DateTime, Float, Index, Integer, ForeignKey, Boolean
+from sqlalchemy.orm import backref, relationship
+
+from app.models import Base
+
+
+class PriceTick(Base):
+    """
+    Price of a crypto currency at the time the upstream last updated it
+    :cvar coin_id upstream id of the crypto currency, e.g. bitcoin
+    :cvar timestamp time (UTC) the upstream last updated the price
+    :cvar price_usd price in USD
+    :cvar price_btc price in BTC
+    :cvar volume_24h_usd traded volume of the last 24 hours in USD
+    :cvar market_cap_usd market capitalization in USD
+    """
+    __tablename__ = "price_tick"
+    __table_args__ = (
+        Index("ix_price_tick_coin_id_timestamp", "coin_id", "timestamp"),
+    )
+
+    coin_id = Column(String(100), nullable=False)
+    timestamp = Column(DateTime, nullable=False)
+    price_usd = Column(Float, nullable=True)
+    price_btc = Column(Float, nullable=True)
+    volume_24h_usd = Column(Float, nullable=True)
+    market_cap_usd = Column(Float, nullable=True)
+
+    def __repr__(self):
+        return "CoinId: {}, Timestamp: {}, PriceUsd: {}".format(self.coin_id, self.timestamp, self.price_usd)
+
+    def to_json(self):
+        return dict(
+            coin_id=self.coin_id,
+            timestamp=self.timestamp,
+            price_usd=self.price_usd,
+            price_btc=self.price_btc,
+            volume_24h_usd=self.volume_24h_usd,
+            market_cap_usd=self.market_cap_usd,
+        )
+
+    def from_json(self, price_tick):
+        self.coin_id = price_tick["coin_id"]
+        self.timestamp = price_tick["timestamp"]
+        self.price_usd = price_tick.get("price_usd")
+        self.price_btc = price_tick.get("price_btc")
+        self.volume_24h_usd = price_tick.get("volume_24h_usd")
+        self.market_cap_usd = price_tick.get("market_cap_usd")
+
+
+class PriceRollup(Base):
+    """
+    Open, high, low and close prices of a crypto currency over a fixed size time bucket. Rollups
+    are maintained incrementally as snapshots are ingested
+    :cvar coin_id upstream id of the crypto currency, e.g. bitcoin
+    :cvar resolution size of the bucket in seconds, one of 60, 3600 and 86400
+    :cvar bucket start time (UTC) of the bucket
+    :cvar open first price in USD seen in the bucket
+    :cvar high highest price in USD seen in the bucket
+    :cvar low lowest price in USD seen in the bucket
+    :cvar close last price in USD seen in the bucket
+    :cvar volume_24h_usd 24 hour volume in USD reported with the close price
+    :cvar close_at time (UTC) of the tick the close price comes from
+    :cvar ticks number of ticks rolled up into the bucket
+    """
+    __tablename__ = "price_rollup"
+    __table_args__ = (
+        Index("ix_price_rollup_coin_id_resolution_bucket", "coin_id", "resolution", "bucket", unique=True),
+    )
+
+    coin_id = Column(String(100), nullable=False)
+    resolution = Column(Integer, nullable=False)
+    bucket = Column(DateTime, nullable=False)
+    open = Column(Float, nullable=False)
+    high = Column(Float, nullable=False)
+    low = Column(Float, nullable=False)
+    close = Column(Float, nullable=False)
+    volume_24h_usd = Column(Float, nullable=True)
+    close_at = Column(DateTime, nullable=False)
+    ticks = Column(Integer, nullable=False, default=1)
+
+    def __repr__(self):
+        return "CoinId: {}, Resolution: {}, Bucket: {}, OHLC: [{}, {}, {}, {}]".format(
+            self.coin_id, self.resolution, self.bucket, self.open, self.high, self.low, self.close)
+
+    def to_json(self):
+        return dict(
+            coin_id=self.coin_id,
+            resolution=self.resolution,
+            bucket=self.bucket,
+            open=self.open,
+            high=self.high,
+            low=self.low,
+            close=self.close,
+            volume_24h_usd=self.volume_24h_usd,
+            close_at=self.close_at,
+            ticks=self.ticks,
+        )
+
+    def from_json(self, price_rollup):
+        self.coin_id = price_rollup["coin_id"]
+        self.resolution = price_rollup["resolution"]
+        self.bucket = price_rollup["bucket"]
+        self.open = price_rollup["open"]
+        self.high = price_rollup["high"]
+        self.low = price_rollup["low"]
+        self.close = price_rollup["close"]
+        self.volume_24h_usd = price_rollup.get("volume_24h_usd")
+        self.close_at = price_rollup["close_at"]
+        self.ticks = price_rollup.get("ticks", 1)
+
+
+class AlertSubscription(Base):
+    """
+    A user's subscription to an alert on a crypto currency
+    :cvar user_account_id FK id of the user account that owns the subscription, the subscriptions
+    are deleted with the account
+    :cvar coin_id upstream id of the crypto currency, e.g. bitcoin
+    :cvar field upstream key of the numeric field to watch, e.g. price_usd
+    :cvar condition one of above, below, crosses_above and crosses_below
+    :cvar threshold value the field is compared with
+    :cvar channel channel the alert is delivered on
+    :cvar webhook_key the user's key for the channel's webhook
+    :cvar active whether the subscription is evaluated
+    """
+    __tablename__ = "alert_subscription"
+    __table_args__ = (
+        Index("ix_alert_subscription_coin_id", "coin_id"),
+        Index("ix_alert_subscription_user_account_id", "user_account_id"),
+    )
+
+    user_account_id = Column(Integer, ForeignKey("user_account.id", ondelete="CASCADE"), nullable=False)
+    coin_id = Column(String(100), nullable=False)
+    field = Column(String(50), nullable=False, default="price_usd")
+    condition = Column(String(20), nullable=False)
+    threshold = Column(Float, nullable=False)
+    channel = Column(String(20), nullable=False, default="ifttt")
+    webhook_key = Column(String(250), nullable=True)
+    active = Column(Boolean, nullable=False, default=True)
+
+    user_account = relationship("UserAccount", backref=backref("alert_subscriptions", lazy="dynamic",
+                                                               cascade="all, delete-orphan"))
+
+    def __repr__(self):
+        return "Id: {}, UserAccountId: {}, Alert: [{} {} {} {}], Channel: {}".format(
+            self.id, self.user_account_id, self.coin_id, self.field, self.condition, self.threshold, self.channel)
+
+    def to_json(self):
+        return dict(
+            id=self.id,
+            user_account_id=self.user_account_id,
+            coin_id=self.coin_id,
+            field=self.field,
+            condition=self.condition,
+            threshold=self.threshold,
+            channel=self.channel,
+            active=self.active,
+            date_created=self.date_created,
+            date_modified=self.date_modified,
+        )
+
+    def from_json(self, alert_subscription):
+        self.coin_id = alert_subscription.get("coin_id", self.coin_id)
+        self.field = alert_subscription.get("field", self.field or "price_usd")
+        self.condition = alert_subscription.get("condition", self.condition)
+        self.threshold = alert_subscription.get("threshold", self.threshold)
+        self.channel = alert_subscription.get("channel", self.channel or "ifttt")
+        self.webhook_key = alert_subscription.get("webhook_key", self.webhook_key)
+        self.active = alert_subscription.get("active", True if self.active is None else self.active)
@@ -0,0 +1,162 @@
+"""
+Adaptive ticker polling.
+
+After every ingest the next polling interval is derived from how urgent fresh data is: the
+hourly volatility of the watched coins and how close their values are to an alert threshold.
+Calm markets are polled at the maximum interval, turbulent ones down to the minimum. The upstream
+quota is never exceeded: an interval shorter than the steady pace is only used while the
+remaining budget still covers polling at the maximum interval until the quota window resets
+"""
+import time
+
+from celery.schedules import schedule, schedstate
+
+from app.backends import get_backend
+from .constants import TICKER_POLL_INTERVAL
+
+INTERVAL_KEY = "crypto:poll:interval"
+USED_KEY = "crypto:poll:used:{}"
+
+
+class PollingPolicy(object):
+    """
+    Computes the polling interval and keeps track of the upstream quota
+    :cvar min_interval shortest interval in seconds, used when the market is most volatile
+    :cvar max_interval longest interval in seconds, used when the market is calm
+    :cvar quota number of upstream requests allowed per quota window
+    :cvar quota_window length of the quota window in seconds
+    :cvar volatile_percent absolute 1h change in percent at which a coin counts as fully volatile
+    :cvar threshold_band relative distance to an alert threshold below which polling speeds up
+    """
+
+    def __init__(self, app=None):
+        self.min_interval = 15
+        self.max_interval = 300
+        self.quota = 86400 // TICKER_POLL_INTERVAL
+        self.quota_window = 86400
+        self.volatile_percent = 5.0
+        self.threshold_band = 0.05
+        self.backend = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Reads the interval bounds, quota and sensitivity from the application configuration
+        :param app: the flask app
+        """
+        self.backend = get_backend(app)
+        self.min_interval = app.config.get("POLL_MIN_INTERVAL", self.min_interval)
+        self.max_interval = app.config.get("POLL_MAX_INTERVAL", self.max_interval)
+        self.quota = app.config.get("POLL_QUOTA_REQUESTS", self.quota)
+        self.quota_window = app.config.get("POLL_QUOTA_WINDOW", self.quota_window)
+        self.volatile_percent = app.config.get("POLL_VOLATILE_PERCENT", self.volatile_percent)
+        self.threshold_band = app.config.get("POLL_THRESHOLD_BAND", self.threshold_band)
+
+    def _window_start(self, now):
+        return int(now - now % self.quota_window)
+
+    def record_request(self, now=None):
+        """
+        Counts an upstream request against the quota of the current window
+        :return: requests made in the current window
+        :rtype: int
+        """
+        now = now or time.time()
+        return self.backend.incr(USED_KEY.format(self._window_start(now)), ex=self.quota_window)
+
+    def used(self, now=None):
+        """
+        :return: upstream requests made in the current quota window
+        :rtype: int
+        """
+        now = now or time.time()
+        return int(self.backend.get(USED_KEY.format(self._window_start(now))) or 0)
+
+    def urgency(self, snapshot, engine):
+        """
+        How urgent fresh data is, from 0 (calm, nothing near a threshold) to 1
+        :param snapshot: latest Ticker snapshot
+        :param engine: AlertEngine with the active rules
+        :rtype: float
+        """
+        changes = [abs(coin.percent_change_1h) for coin in (snapshot.get(coin_id) for coin_id in engine.coin_ids())
+                   if coin is not None and coin.percent_change_1h is not None]
+        volatility = min(max(changes) / self.volatile_percent, 1.0) if changes else 0.0
+
+        distance = engine.threshold_distance(snapshot)
+        proximity = 1.0 - min(distance / self.threshold_band, 1.0) if distance is not None else 0.0
+
+        return max(volatility, proximity)
+
+    def budget_interval(self, interval, now=None):
+        """
+        Stretches an interval so that the quota of the current window is not exceeded
+        :param interval: desired interval in seconds
+        :param now: unix timestamp, defaults to now
+        :return: interval in seconds
+        :rtype: float
+        """
+        now = now or time.time()
+        time_left = self._window_start(now) + self.quota_window - now
+        remaining = self.quota - self.used(now)
+        if remaining <= 0:
+            return time_left
+        # spend the budget early only while enough is left to poll at the slowest pace afterwards
+        if (remaining - 1) * self.max_interval >= time_left - interval:
+            return interval
+        return max(interval, time_left / remaining)
+
+    def update(self, snapshot, engine, now=None):
+        """
+        Computes the interval until the next poll from a fresh snapshot and publishes it to
+        the scheduler
+        :param snapshot: latest Ticker snapshot
+        :param engine: AlertEngine with the active rules
+        :param now: unix timestamp, defaults to now
+        :return: the interval in seconds
+        :rtype: float
+        """
+        urgency = self.urgency(snapshot, engine)
+        interval = self.max_interval - urgency * (self.max_interval - self.min_interval)
+        interval = self.budget_interval(interval, now)
+        self.backend.set(INTERVAL_KEY, interval)
+        return interval
+
+    def interval(self):
+        """
+        :return: the published interval in seconds until the next poll
+        :rtype: float
+        """
+        interval = self.backend.get(INTERVAL_KEY) if self.backend is not None else None
+        return float(interval) if interval is not None else float(TICKER_POLL_INTERVAL)
+
+
+class AdaptiveSchedule(schedule):
+    """
+    Celery beat schedule that runs a task after the interval last published by the polling
+    policy, instead of a fixed one
+    """
+
+    def __init__(self, policy=None, **kwargs):
+        self.policy = policy
+        super(AdaptiveSchedule, self).__init__(run_every=TICKER_POLL_INTERVAL, **kwargs)
+
+    def is_due(self, last_run_at):
+        policy = self.policy or polling_policy
+        interval = policy.interval()
+        elapsed = (self.now() - self.maybe_make_aware(last_run_at)).total_seconds()
+        if elapsed >= interval:
+            return schedstate(is_due=True, next=interval)
+        return schedstate(is_due=False, next=interval - elapsed)
+
+    def __reduce__(self):
+        # beat persists its schedule, the policy holds connections and is looked up again instead
+        return self.__class__, ()
+
+    def __repr__(self):
+        return "<adaptive schedule>"
+
+
+polling_policy = PollingPolicy()
@@ -0,0 +1,224 @@
+"""
+Token bucket rate limiting of the upstream API.
+
+All processes calling the upstream share one bucket: in Redis when it is configured, otherwise
+in a lock protected state file that every gunicorn and celery worker on the host uses. Callers
+have a priority. Low priority callers (dashboard refreshes) leave a reserve of tokens that only
+high priority callers (alert fetches) may use. A caller that finds the bucket empty waits for
+a token up to its priority's maximum wait and otherwise gives up, so that the stale snapshot is
+served instead of getting the whole application throttled by the provider
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from app.backends import RedisBackend, get_backend
+from .singleflight import FileLockStore, fcntl
+
+PRIORITY_HIGH = 0
+PRIORITY_LOW = 1
+
+BUCKET_KEY = "crypto:upstream:bucket"
+
+
+def take_token(state, now, rate, capacity, floor):
+    """
+    Refills a bucket and takes one token from it, unless that would leave fewer than floor tokens
+    :param state: (tokens, updated_at) of the bucket or None for a full bucket
+    :param now: unix timestamp
+    :param rate: tokens added per second
+    :param capacity: maximum number of tokens
+    :param floor: tokens that must be left in the bucket after taking one
+    :return: the new state and the seconds to wait until a token can be taken, 0 if it was taken
+    :rtype: tuple
+    """
+    tokens, updated_at = state if state is not None else (capacity, now)
+    tokens = min(capacity, tokens + max(now - updated_at, 0) * rate)
+    if tokens - 1 >= floor:
+        return (tokens - 1, now), 0
+    return (tokens, now), (floor + 1 - tokens) / rate
+
+
+class MemoryTokenStore(object):
+    """
+    Bucket state of this process only
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {}
+
+    def take(self, key, now, rate, capacity, floor):
+        with self._lock:
+            self._state[key], wait = take_token(self._state.get(key), now, rate, capacity, floor)
+        return wait
+
+
+class FileTokenStore(object):
+    """
+    Bucket state shared by the processes of a host through a locked state file
+    """
+
+    def __init__(self, directory):
+        self.files = FileLockStore(directory)
+
+    def take(self, key, now, rate, capacity, floor):
+        with self.files.lock(key):
+            state = self.files.read(key, newer_than=0)
+            state, wait = take_token(tuple(state) if state else None, now, rate, capacity, floor)
+            self.files.write(key, state)
+        return wait
+
+
+class RedisTokenStore(object):
+    """
+    Bucket state shared by all processes through Redis
+    """
+    TAKE_SCRIPT = """
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+    local now = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local capacity = tonumber(ARGV[3])
+    local floor = tonumber(ARGV[4])
+    local tokens = tonumber(state[1]) or capacity
+    local updated_at = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(now - updated_at, 0) * rate)
+    local wait = 0
+    if tokens - 1 >= floor then
+        tokens = tokens - 1
+    else
+        wait = (floor + 1 - tokens) / rate
+    end
+    redis.call('HMSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, client):
+        self._take = client.register_script(self.TAKE_SCRIPT)
+
+    def take(self, key, now, rate, capacity, floor):
+        return float(self._take(keys=[key], args=[now, rate, capacity, floor]))
+
+
+class RateLimiterStats(object):
+    """
+    Rate limiter counters
+    :cvar granted number of requests that got a token right away
+    :cvar waited number of requests that got a token after waiting
+    :cvar rejected number of requests that gave up waiting
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.granted = 0
+        self.waited = 0
+        self.rejected = 0
+
+    def incr(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def reset(self):
+        with self._lock:
+            self.granted = 0
+            self.waited = 0
+            self.rejected = 0
+
+    def to_json(self):
+        return dict(granted=self.granted, waited=self.waited, rejected=self.rejected)
+
+
+class RateLimiter(object):
+    """
+    Upstream rate limiter. Configured from the application config on init_app, it lets every
+    request through until then
+    :cvar rate tokens added to the bucket per second
+    :cvar capacity size of the bucket, i.e. the largest burst
+    :cvar low_priority_reserve fraction of the bucket that low priority requests leave untouched
+    :cvar max_wait seconds a request waits for a token, by priority
+    """
+
+    def __init__(self, app=None):
+        self.rate = 0.5
+        self.capacity = 10
+        self.low_priority_reserve = 0.3
+        self.max_wait = {PRIORITY_HIGH: 10.0, PRIORITY_LOW: 0.0}
+        self.store = None
+        self.stats = RateLimiterStats()
+        self.sleep = time.sleep
+        self._local = threading.local()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Reads the rate, burst, reserve and waits from the application configuration and picks
+        the store shared by the processes: Redis if it is configured, else a state file in
+        UPSTREAM_RATE_LIMIT_DIR, else this process only
+        :param app: the flask app
+        """
+        self.rate = app.config.get("UPSTREAM_RATE", self.rate)
+        self.capacity = app.config.get("UPSTREAM_BURST", self.capacity)
+        self.low_priority_reserve = app.config.get("UPSTREAM_LOW_PRIORITY_RESERVE", self.low_priority_reserve)
+        self.max_wait = {
+            PRIORITY_HIGH: app.config.get("UPSTREAM_MAX_WAIT_HIGH", self.max_wait[PRIORITY_HIGH]),
+            PRIORITY_LOW: app.config.get("UPSTREAM_MAX_WAIT_LOW", self.max_wait[PRIORITY_LOW]),
+        }
+
+        backend = get_backend(app)
+        state_dir = app.config.get("UPSTREAM_RATE_LIMIT_DIR")
+        if isinstance(backend, RedisBackend):
+            self.store = RedisTokenStore(backend.client)
+        elif state_dir and fcntl is not None:
+            self.store = FileTokenStore(state_dir)
+        else:
+            self.store = MemoryTokenStore()
+        self.stats.reset()
+
+    @contextmanager
+    def priority(self, priority):
+        """
+        Runs the upstream requests made by this thread within the context at the given priority
+        :param priority: PRIORITY_HIGH or PRIORITY_LOW
+        """
+        previous = getattr(self._local, "priority", None)
+        self._local.priority = priority
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    @property
+    def current_priority(self):
+        priority = getattr(self._local, "priority", None)
+        return PRIORITY_LOW if priority is None else priority
+
+    def acquire(self, priority=None):
+        """
+        Takes a token for one upstream request, waiting for it up to the priority's maximum wait
+        :param priority: priority of the request, defaults to the one of the current context
+        :return: True if the request may be made, False if the caller should serve stale data
+        :rtype: bool
+        """
+        if self.store is None:
+            return True
+        priority = self.current_priority if priority is None else priority
+        floor = self.capacity * self.low_priority_reserve if priority == PRIORITY_LOW else 0
+        deadline = time.monotonic() + self.max_wait[priority]
+        waited = False
+
+        while True:
+            wait = self.store.take(BUCKET_KEY, time.time(), self.rate, self.capacity, floor)
+            if wait <= 0:
+                self.stats.incr("waited" if waited else "granted")
+                return True
+            if time.monotonic() + wait > deadline:
+                self.stats.incr("rejected")
+                return False
+            waited = True
+            self.sleep(wait)
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,110 @@
+"""
+Pre-serialized JSON response bodies.
+
+Price responses are derived from a snapshot that only changes about once a minute, so each one
+is serialized once per snapshot and its gzip (and, when available, brotli) encoded copies are
+kept alongside it. Responses carry an ETag derived from the serialized body so that polling
+clients get a header only 304 until the snapshot changes
+"""
+import gzip
+import hashlib
+import json
+
+from flask import current_app, request
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 512
+
+
+def dumps(data):
+    """
+    Serializes data to compact JSON bytes, using orjson when it is installed
+    :param data: JSON serializable data
+    :return: serialized data
+    :rtype: bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+class EncodedBody(object):
+    """
+    A serialized JSON body with its content encodings
+    :cvar identity uncompressed JSON bytes
+    :cvar etag digest of the uncompressed bytes
+    """
+    __slots__ = ("identity", "etag", "_encoded")
+
+    def __init__(self, data):
+        self.identity = dumps(data)
+        self.etag = hashlib.md5(self.identity).hexdigest()
+        self._encoded = {}
+
+    def encode(self, encoding):
+        """
+        Gets the body in the given content encoding, compressing it on first use
+        :param encoding: gzip or br
+        :return: encoded bytes
+        :rtype: bytes
+        """
+        encoded = self._encoded.get(encoding)
+        if encoded is None:
+            if encoding == "br":
+                encoded = brotli.compress(self.identity)
+            else:
+                encoded = gzip.compress(self.identity)
+            self._encoded[encoding] = encoded
+        return encoded
+
+
+def _negotiate_encoding(body):
+    """
+    Picks the content encoding to send the body with from the request's Accept-Encoding
+    :param body: EncodedBody
+    :return: br, gzip or None for no encoding
+    """
+    if len(body.identity) < MIN_COMPRESS_SIZE:
+        return None
+    accept_encodings = request.accept_encodings
+    if brotli is not None and accept_encodings["br"]:
+        return "br"
+    if accept_encodings["gzip"]:
+        return "gzip"
+    return None
+
+
+def json_response(body, status=200):
+    """
+    Creates a response for a pre-serialized body, answering conditional requests whose
+    If-None-Match matches the body's ETag with 304 Not Modified
+    :param body: EncodedBody
+    :param status: status code of the response
+    :return: response
+    :rtype: flask.Response
+    """
+    response = current_app.response_class(mimetype="application/json", status=status)
+    response.set_etag(body.etag)
+    response.vary.add("Accept-Encoding")
+
+    if request.if_none_match.contains(body.etag):
+        response.status_code = 304
+        return response
+
+    encoding = _negotiate_encoding(body)
+    if encoding is None:
+        response.set_data(body.identity)
+    else:
+        response.set_data(body.encode(encoding))
+        response.headers["Content-Encoding"] = encoding
+    return response
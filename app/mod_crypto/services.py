@@ -1,40 +1,82 @@
-import requests
+from requests import RequestException
+from app import app_logger
+from .breaker import upstream_breaker
+from .client import http_client
 from .constants import COINMARKET_CAP_API_URL, IFTTT_BASE_URL
+from .ratelimit import rate_limiter
+from .singleflight import single_flight
 
 
+def _get_upstream(url, description):
+    """
+    Sends a GET request to the upstream through the circuit breaker and the rate limiter. Timeouts,
+    connection errors, 429 and 5xx responses count as failures of the upstream
+    :param url: url to get
+    :param description: what is fetched, for the logs
+    :return: the response or None if the call failed, was rate limited or the circuit is open
+    :rtype: requests.Response
+    """
+    if not upstream_breaker.allow():
+        app_logger.warning(f"Upstream circuit is open, not fetching {description}")
+        return None
+    if not rate_limiter.acquire():
+        upstream_breaker.cancel()
+        app_logger.warning(f"Upstream rate limit reached, not fetching {description}")
+        return None
+    try:
+        response = http_client.get(url)
+    except RequestException as e:
+        upstream_breaker.record_failure()
+        app_logger.error(f"Failed to fetch {description}. Error => {e}")
+        return None
+    if not response.ok and (response.status_code == 429 or response.status_code >= 500):
+        upstream_breaker.record_failure()
+    else:
+        upstream_breaker.record_success()
+    return response
+
+
+@single_flight.coalesce(lambda: "ticker", shared=True)
 def get_all_crypto_currency_prices():
     """
     Gets all crypto currency prices
-    :return: Response in json format
+    :return: Response in json format, None if the call failed, the upstream quota is used up or
+    the upstream circuit is open
     """
-    response = requests.get(COINMARKET_CAP_API_URL)
-    if response.ok:
+    response = _get_upstream(COINMARKET_CAP_API_URL, "crypto currency prices")
+    if response is not None and response.ok:
         return response.json()
     else:
         return None
 
 
+@single_flight.coalesce(lambda crypto_currency: f"ticker/{crypto_currency}")
 def get_latest_crypto_price(crypto_currency):
     """
     Gets the latest crypto currency price
     :param crypto_currency: Crypto currency
-    :return: Response for the latest crypto currency
+    :return: Response for the latest crypto currency, None if the call failed, the upstream
+    quota is used up or the upstream circuit is open
     """
-    response = requests.get(COINMARKET_CAP_API_URL + f"/{crypto_currency}")
-    if response.ok:
+    response = _get_upstream(COINMARKET_CAP_API_URL + f"/{crypto_currency}", f"price for {crypto_currency}")
+    if response is not None and response.ok:
         response_json = response.json()
         return response_json[0]
     else:
         return None
 
 
-def post_iftt_webhook_event(event, data):
+def post_iftt_webhook_event(event, data, key=None):
     """
     Posts IFTTT webhook event
     :param event: event to post
     :param data: data to send
+    :param key: webhook key of the receiving IFTTT account, e.g. from a user's alert subscription
     :return:
     """
-    ifttt_event_url = IFTTT_BASE_URL.format(event)
+    ifttt_event_url = IFTTT_BASE_URL.format(event) + (key or "")
     # Sends a HTTP POST request to the webhook URL
-    requests.post(ifttt_event_url, json=data)
+    try:
+        http_client.post(ifttt_event_url, json=data)
+    except RequestException as e:
+        app_logger.error(f"Failed to post IFTTT event {event}. Error => {e}")
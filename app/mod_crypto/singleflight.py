@@ -0,0 +1,228 @@
+"""
+Single flight request coalescing for upstream fetches.
+
+Concurrent callers asking for the same key share one in-flight call. Within a process the
+followers wait on the leader's thread, across processes (gunicorn and celery workers on the
+same host) the leaders serialize on a file lock and the ones that come later re-use the result
+written by the first one instead of calling the upstream again. Only calls coalesced with
+shared=True, whose keys come from a fixed set, go through the lock files, so that keys built from
+request input cannot fill the lock directory
+"""
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from app import app_logger
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on windows
+    fcntl = None
+
+
+class SingleFlightStats(object):
+    """
+    Single flight counters
+    :cvar calls number of calls made through the single flight group
+    :cvar executions number of calls that actually ran the wrapped function
+    :cvar coalesced number of calls that waited on an in-flight call in the same process
+    :cvar coalesced_across_processes number of calls served from another process' result
+    :cvar timeouts number of calls that gave up waiting on an in-flight call
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.coalesced_across_processes = 0
+        self.timeouts = 0
+
+    def incr(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.executions = 0
+            self.coalesced = 0
+            self.coalesced_across_processes = 0
+            self.timeouts = 0
+
+    def to_json(self):
+        return dict(calls=self.calls, executions=self.executions, coalesced=self.coalesced,
+                    coalesced_across_processes=self.coalesced_across_processes, timeouts=self.timeouts)
+
+
+class FileLockStore(object):
+    """
+    Host local lock store. Every key gets a lock file and a result file in the given directory
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, suffix):
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, name + suffix)
+
+    @contextmanager
+    def lock(self, key):
+        """
+        Holds an exclusive lock on the given key for the duration of the context
+        :param key: key to lock
+        """
+        with open(self._path(key, ".lock"), "a+") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read(self, key, newer_than):
+        """
+        Reads the result stored for a key if it was written after the given time
+        :param key: key to read
+        :param newer_than: unix timestamp the result must be newer than
+        :return: stored result or None
+        """
+        path = self._path(key, ".json")
+        try:
+            if os.stat(path).st_mtime < newer_than:
+                return None
+            with open(path, "r") as result_file:
+                return json.load(result_file)
+        except (OSError, ValueError):
+            return None
+
+    def write(self, key, value):
+        """
+        Atomically stores the result for a key
+        :param key: key to write
+        :param value: JSON serializable result
+        """
+        path = self._path(key, ".json")
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "w") as result_file:
+            json.dump(value, result_file)
+        os.replace(tmp_path, path)
+
+
+class _Call(object):
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Group of coalesced calls keyed by string keys
+    :cvar wait_timeout seconds a call waits on an in-flight call before it gives up
+    """
+
+    def __init__(self, app=None):
+        self.lock_store = None
+        self.wait_timeout = 30
+        self.stats = SingleFlightStats()
+        self._calls = {}
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Sets up the cross process lock store from the application configuration. Setting
+        SINGLE_FLIGHT_LOCK_DIR to an empty value only coalesces calls within a process
+        :param app: the flask app
+        """
+        lock_dir = app.config.get("SINGLE_FLIGHT_LOCK_DIR")
+        self.wait_timeout = app.config.get("SINGLE_FLIGHT_WAIT_TIMEOUT", self.wait_timeout)
+        self.lock_store = FileLockStore(lock_dir) if lock_dir and fcntl is not None else None
+        self.stats.reset()
+
+    def do(self, key, fn, *args, shared=False, **kwargs):
+        """
+        Calls fn unless a call for the same key is already in flight, in which case that call's
+        result is returned instead
+        :param key: key identifying the call
+        :param fn: function to call
+        :param shared: whether to coalesce the call with the other processes of the host too.
+        Only for keys from a fixed set, every key gets its own lock and result files
+        :return: result of the call, None if the in-flight call did not finish within the wait
+        timeout
+        """
+        self.stats.incr("calls")
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            self.stats.incr("coalesced")
+            if not call.event.wait(self.wait_timeout):
+                self.stats.incr("timeouts")
+                app_logger.warning(f"Gave up waiting on the in-flight call for {key}")
+                return None
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._execute(key, shared, fn, *args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def _execute(self, key, shared, fn, *args, **kwargs):
+        lock_store = self.lock_store
+        if lock_store is None or not shared:
+            self.stats.incr("executions")
+            return fn(*args, **kwargs)
+
+        started = time.time()
+        with lock_store.lock(key):
+            shared = lock_store.read(key, newer_than=started)
+            if shared is not None:
+                self.stats.incr("coalesced_across_processes")
+                return shared
+            self.stats.incr("executions")
+            result = fn(*args, **kwargs)
+            if result is not None:
+                lock_store.write(key, result)
+            return result
+
+    def coalesce(self, key_fn, shared=False):
+        """
+        Decorator coalescing calls to the decorated function
+        :param key_fn: function building the call key from the decorated function's arguments
+        :param shared: whether to coalesce calls across the processes of the host, see do
+        :return: decorator
+        """
+
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                return self.do(key_fn(*args, **kwargs), fn, *args, shared=shared, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,158 @@
+"""
+Shared ticker snapshot store.
+
+The poller publishes every ticker it fetches as a versioned, pre-serialized JSON blob to the
+shared backend (Redis in production). Web and celery processes read the snapshot from there
+instead of calling the upstream, and keep the last one they parsed into a Ticker in memory until
+the version changes. Every snapshot is published together with its diff against the previous
+one, so that consumers can limit their work to the coins that changed
+"""
+import json
+import threading
+import time
+
+from app.backends import get_backend
+from .services import get_all_crypto_currency_prices
+from .ticker import Ticker, TickerDiff
+
+VERSION_KEY = "crypto:ticker:version"
+CURRENT_KEY = "crypto:ticker:current"
+BLOB_KEY = "crypto:ticker:blob:{}"
+DIFF_KEY = "crypto:ticker:diff:{}"
+
+
+class SnapshotStore(object):
+    """
+    Reads and writes ticker snapshots to the shared backend
+    :cvar max_age seconds after which a stored snapshot is considered too old to serve and
+    the upstream is called instead
+    :cvar blob_ttl seconds a published snapshot blob is kept in the backend
+    """
+
+    def __init__(self, app=None):
+        self.max_age = 300
+        self.blob_ttl = 3600
+        self.backend = None
+        self._lock = threading.Lock()
+        self._cached = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Sets up the backend and the snapshot ages from the application configuration
+        :param app: the flask app
+        """
+        self.backend = get_backend(app)
+        self.max_age = app.config.get("TICKER_SNAPSHOT_MAX_AGE", self.max_age)
+        self.blob_ttl = app.config.get("TICKER_SNAPSHOT_BLOB_TTL", self.blob_ttl)
+        with self._lock:
+            self._cached = None
+
+    def publish(self, data, fetched_at=None):
+        """
+        Publishes a new ticker snapshot
+        :param data: list of upstream ticker entries
+        :param fetched_at: unix timestamp the data was fetched at, defaults to now
+        :return: the published snapshot
+        :rtype: Ticker
+        """
+        fetched_at = fetched_at or time.time()
+        version = self.backend.incr(VERSION_KEY)
+        blob = json.dumps({"version": version, "fetched_at": fetched_at, "data": data})
+        self.backend.set(BLOB_KEY.format(version), blob, ex=self.blob_ttl)
+
+        snapshot = Ticker.from_json(data, version=version, fetched_at=fetched_at)
+        diff = TickerDiff.compute(snapshot, self.read_version(version - 1))
+        self.backend.set(DIFF_KEY.format(version), json.dumps(diff.to_json()), ex=self.blob_ttl)
+        # a slower publisher must never move the current pointer back to an older version
+        self.backend.set_max(CURRENT_KEY, version)
+
+        with self._lock:
+            if self._cached is None or self._cached.version < version:
+                self._cached = snapshot
+        return snapshot
+
+    def read(self):
+        """
+        Reads the current snapshot. The blob is only fetched and parsed when the published
+        version differs from the one parsed last by this process
+        :return: current snapshot or None if nothing has been published
+        :rtype: Ticker
+        """
+        version = self.backend.get(CURRENT_KEY)
+        if version is None:
+            return None
+        version = int(version)
+
+        cached = self._cached
+        if cached is not None and cached.version == version:
+            return cached
+
+        snapshot = self._read_blob(version)
+        if snapshot is None:
+            return None
+        with self._lock:
+            if self._cached is None or self._cached.version < snapshot.version:
+                self._cached = snapshot
+        return snapshot
+
+    def read_version(self, version):
+        """
+        Reads an earlier snapshot, as long as its blob has not expired from the backend
+        :param version: version of the snapshot
+        :return: the snapshot or None
+        :rtype: Ticker
+        """
+        cached = self._cached
+        if cached is not None and cached.version == version:
+            return cached
+
+        return self._read_blob(version)
+
+    def read_diff(self, version):
+        """
+        Reads the diff of a snapshot against the one published before it
+        :param version: version of the snapshot
+        :return: the diff or None if the snapshot or its diff expired
+        :rtype: TickerDiff
+        """
+        diff = self.backend.get(DIFF_KEY.format(version))
+        snapshot = self.read_version(version) if diff is not None else None
+        if snapshot is None:
+            return None
+        return TickerDiff.from_json(snapshot, json.loads(diff))
+
+    def _read_blob(self, version):
+        blob = self.backend.get(BLOB_KEY.format(version))
+        if blob is None:
+            return None
+        payload = json.loads(blob)
+        return Ticker.from_json(payload["data"], version=payload["version"], fetched_at=payload["fetched_at"])
+
+    def fetch(self):
+        """
+        Fetches the ticker from the upstream and publishes it
+        :return: the published snapshot or None if the fetch failed
+        :rtype: Ticker
+        """
+        data = get_all_crypto_currency_prices()
+        if not data:
+            return None
+        return self.publish(data)
+
+    def load(self):
+        """
+        Loads the current snapshot, only falling back to the upstream when nothing has been
+        published yet or the published snapshot is older than max_age
+        :return: current snapshot or None
+        :rtype: Ticker
+        """
+        snapshot = self.read()
+        if snapshot is None or snapshot.age > self.max_age:
+            snapshot = self.fetch() or snapshot
+        return snapshot
+
+
+snapshot_store = SnapshotStore()
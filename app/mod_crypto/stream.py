@@ -0,0 +1,225 @@
+"""
+Server-Sent Events price stream.
+
+One watcher thread per process follows the versions published to the shared snapshot store,
+which only costs a read of the current version key per poll and never an upstream call. For
+every new snapshot the changed coins are serialized once and pushed to the bounded queue of
+each connected client, optionally filtered by coin. A client that does not keep up loses its
+oldest events instead of growing its queue. The watcher stops when the last client disconnects
+"""
+import json
+import threading
+from collections import deque
+
+from app import app_logger
+from .store import snapshot_store
+from .ticker import TickerDiff
+
+
+def format_event(data, event=None, id=None):
+    """
+    Formats a Server-Sent Event
+    :param data: event data, a JSON string
+    :param event: event name
+    :param id: event id
+    :rtype: str
+    """
+    lines = []
+    if id is not None:
+        lines.append("id: {}".format(id))
+    if event is not None:
+        lines.append("event: {}".format(event))
+    lines.append("data: {}".format(data))
+    return "\n".join(lines) + "\n\n"
+
+
+class StreamSubscriber(object):
+    """
+    A connected stream client
+    :cvar coin_ids ids of the coins the client wants, None for all of them
+    :cvar events queued events, the oldest ones are dropped once it is full
+    :cvar dropped number of events dropped because the client did not keep up
+    """
+
+    def __init__(self, coin_ids=None, queue_size=32):
+        self.coin_ids = frozenset(coin_ids) if coin_ids else None
+        self.events = deque(maxlen=queue_size)
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    def push(self, event):
+        with self._lock:
+            if len(self.events) == self.events.maxlen:
+                self.dropped += 1
+            self.events.append(event)
+        self._ready.set()
+
+    def drain(self, timeout=None):
+        """
+        Waits for events and takes all queued ones
+        :param timeout: seconds to wait for an event
+        :return: list of events, empty if none arrived in time
+        """
+        self._ready.wait(timeout)
+        with self._lock:
+            events = list(self.events)
+            self.events.clear()
+            self._ready.clear()
+        return events
+
+    def wants(self, coin_id):
+        return self.coin_ids is None or coin_id in self.coin_ids
+
+
+class PriceBroadcaster(object):
+    """
+    Pushes the changed prices of every new snapshot to the connected stream clients
+    :cvar poll_interval seconds between two checks of the published snapshot version
+    :cvar queue_size number of events queued per client
+    :cvar heartbeat seconds after which an idle stream gets a keep alive comment
+    """
+
+    def __init__(self, store=snapshot_store, app=None):
+        self.store = store
+        self.poll_interval = 1.0
+        self.queue_size = 32
+        self.heartbeat = 15
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._snapshot = None
+        self._thread = None
+        self._stop = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Reads the poll interval, queue size and heartbeat from the application configuration
+        :param app: the flask app
+        """
+        self.poll_interval = app.config.get("STREAM_POLL_INTERVAL", self.poll_interval)
+        self.queue_size = app.config.get("STREAM_QUEUE_SIZE", self.queue_size)
+        self.heartbeat = app.config.get("STREAM_HEARTBEAT", self.heartbeat)
+
+    @property
+    def subscribers(self):
+        return len(self._subscribers)
+
+    def subscribe(self, coin_ids=None, snapshot=None):
+        """
+        Connects a client, starting the watcher if it is the first one
+        :param coin_ids: ids of the coins the client wants, None for all of them
+        :param snapshot: Ticker the client starts from. A starting watcher compares the next
+        published snapshot with it, and a client starting from an older snapshot than the
+        watcher's gets the changes in between right away, so that the client misses no change
+        :rtype: StreamSubscriber
+        """
+        subscriber = StreamSubscriber(coin_ids, queue_size=self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            last = self._snapshot
+            if snapshot is not None and snapshot.version is not None:
+                if last is None:
+                    self._snapshot = snapshot
+                elif snapshot.version < last.version:
+                    changed = TickerDiff.compute(last, snapshot).changed
+                    data = [json.dumps(coin.to_json()) for coin in changed if subscriber.wants(coin.id)]
+                    if data:
+                        subscriber.push(format_event("[" + ",".join(data) + "]", event="prices", id=changed.version))
+            if self._thread is None:
+                # every watcher gets its own event, a stopping one must not be revived by it
+                self._stop = threading.Event()
+                self._thread = threading.Thread(target=self._watch, args=(self._stop,), name="price-broadcaster",
+                                                daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """
+        Disconnects a client, stopping the watcher once no client is left
+        :param subscriber: StreamSubscriber
+        """
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            if not self._subscribers and self._thread is not None:
+                self._stop.set()
+                self._stop = None
+                self._thread = None
+                self._snapshot = None
+
+    def _watch(self, stop):
+        """
+        Polls for new snapshots until the given event is set
+        :param stop: threading.Event of this watcher
+        """
+        while not stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                app_logger.exception(f"Failed to broadcast prices. Error => {e}")
+            stop.wait(self.poll_interval)
+
+    def poll(self):
+        """
+        Checks for a new snapshot and broadcasts the coins that changed in it
+        :return: number of coins broadcast
+        :rtype: int
+        """
+        snapshot = self.store.read()
+        last = self._snapshot
+        if snapshot is None or (last is not None and snapshot.version <= last.version):
+            return 0
+        self._snapshot = snapshot
+        if last is None:
+            # the clients got a snapshot at least as recent when they connected
+            return 0
+
+        diff = self.store.read_diff(snapshot.version) if snapshot.version == last.version + 1 else None
+        if diff is None:
+            diff = TickerDiff.compute(snapshot, last)
+        return self.broadcast(diff.changed)
+
+    def broadcast(self, changed):
+        """
+        Pushes changed coins to the clients that want them. Every coin is serialized once
+        :param changed: Ticker of the changed coins
+        :return: number of coins broadcast
+        :rtype: int
+        """
+        if not changed:
+            return 0
+        encoded = {coin.id: json.dumps(coin.to_json()) for coin in changed}
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            data = [value for coin_id, value in encoded.items() if subscriber.wants(coin_id)]
+            if data:
+                subscriber.push(format_event("[" + ",".join(data) + "]", event="prices", id=changed.version))
+        return len(encoded)
+
+    def stream(self, coin_ids=None, snapshot=None):
+        """
+        Generates the events of a client until it disconnects. The client is only connected once
+        the first event is taken, so a response that is never sent leaves no subscriber behind
+        :param coin_ids: ids of the coins the client wants, None for all of them
+        :param snapshot: Ticker sent to the client first, so it starts from a complete state
+        :return: generator of Server-Sent Event strings
+        """
+        subscriber = self.subscribe(coin_ids, snapshot)
+        try:
+            if snapshot is not None:
+                coins = [coin.to_json() for coin in snapshot if subscriber.wants(coin.id)]
+                yield format_event(json.dumps(coins), event="snapshot", id=snapshot.version)
+            while True:
+                events = subscriber.drain(timeout=self.heartbeat)
+                if events:
+                    yield "".join(events)
+                else:
+                    yield ": keep-alive\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+
+price_broadcaster = PriceBroadcaster()
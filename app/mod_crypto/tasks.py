@@ -1,33 +1,205 @@
-from app import celery
-from .services import post_iftt_webhook_event, get_latest_crypto_price
-from .constants import BITCOIN_PRICE_THRESHOLD
+from celery import chord, group
+from celery.backends.base import DisabledBackend
+from app import celery, app_logger
+from .alerts import alert_engine, trigger_state
+from .constants import DIGEST_INTERVAL, DIGEST_STEP
+from .dispatch import WebhookDelivery, webhook_dispatcher, merge_reports
+from .history import get_price_history, record_price_ticks, update_price_rollups
+from .polling import polling_policy
+from .ratelimit import rate_limiter, PRIORITY_HIGH
+from .services import post_iftt_webhook_event
+from .store import snapshot_store
+from .ticker import Ticker
 from .utils import format_crypto_history
-from datetime import datetime
+from datetime import datetime, timedelta
+
+
+DIGEST_CLAIM_KEY = "crypto:digest:{}"
+RULES_EVALUATED_KEY = "crypto:alerts:evaluated"
+
+
+def _load_snapshot(version=None):
+    """
+    :param version: version of the snapshot a consumer was triggered with, None for the current one
+    :return: the snapshot or None if it expired from the shared store
+    :rtype: Ticker
+    """
+    return snapshot_store.read_version(version) if version is not None else snapshot_store.load()
+
+
+def _digest_due(snapshot):
+    """
+    Checks whether the snapshot is the first one of a new digest period and claims the period.
+    The claim is a single atomic increment, so only one of concurrent ingests gets the period
+    :rtype: bool
+    """
+    period = int(snapshot.fetched_at // DIGEST_INTERVAL)
+    return snapshot_store.backend.incr(DIGEST_CLAIM_KEY.format(period), ex=2 * DIGEST_INTERVAL) == 1
+
+
+@celery.task()
+def ingest_ticker_snapshot():
+    """
+    The single scheduled task talking to the upstream. Fetches the full ticker once, publishes
+    it to the shared snapshot store and triggers every consumer with the snapshot's version, so
+    that the number of upstream calls stays at one per tick however many consumers there are.
+    The consumers read the snapshot back from the store. The fetch has priority over dashboard
+    refreshes in the upstream rate limiter. The interval until the next ingest is
+    adapted to the market's volatility within the upstream quota
+    :return: version of the ingested snapshot or None if the fetch failed
+    """
+    polling_policy.record_request()
+    with rate_limiter.priority(PRIORITY_HIGH):
+        snapshot = snapshot_store.fetch()
+    if not snapshot:
+        return None
+    polling_policy.update(snapshot, alert_engine.refresh())
+
+    consumers = [persist_price_history.si(snapshot.version), post_crypto_emergency.si(snapshot.version)]
+    if _digest_due(snapshot):
+        consumers.append(post_telegram_notification.si(snapshot.version))
+    group(consumers).apply_async()
+    return snapshot.version
+
+
+@celery.task()
+def persist_price_history(version=None):
+    """
+    Records the prices of a snapshot in the price history and rollups. Only the coins that
+    changed since the previous snapshot are written
+    :param version: version of the snapshot, None for the current one
+    """
+    snapshot = _load_snapshot(version)
+    if snapshot:
+        diff = snapshot_store.read_diff(snapshot.version) if snapshot.version else None
+        changed = diff.changed if diff is not None else snapshot
+        if changed:
+            record_price_ticks(changed)
+            update_price_rollups(changed)
+
+
+def _with_coins(diff, coin_ids):
+    """
+    :param diff: TickerDiff of a snapshot
+    :param coin_ids: ids of coins to add to the changed ones
+    :return: Ticker of the changed coins and the given ones
+    :rtype: Ticker
+    """
+    if not coin_ids:
+        return diff.changed
+    snapshot = diff.snapshot
+    coins = [coin for position, coin in enumerate(snapshot.coins) if diff.bitmap >> position & 1 or coin.id in coin_ids]
+    return Ticker(coins, version=snapshot.version, fetched_at=snapshot.fetched_at)
+
+
+@celery.task()
+def post_crypto_emergency(version=None):
+    """
+    Posts a crypto emergency for every alert rule the snapshot triggers. The rule index
+    is only rebuilt from the subscriptions if they changed since the last run, and as long as
+    they did not, only the coins that changed in the snapshot and the coins of rules waiting in
+    the trigger state are evaluated. Rules that already
+    fired and have not re-armed are not posted again. The emergencies are split into chunks that
+    are delivered in parallel by the worker pool
+    :param version: version of the snapshot, None for the current one
+    :return: number of emergencies posted
+    """
+    with rate_limiter.priority(PRIORITY_HIGH):
+        snapshot = _load_snapshot(version)
+
+    if snapshot:
+        previous = snapshot_store.read_version(snapshot.version - 1) if snapshot.version else None
+        engine = alert_engine.refresh()
+        # the version of the rules all coins were last evaluated with is kept apart from the
+        # engine's, which the ingest task may already have refreshed in this process
+        rules_changed = int(snapshot_store.backend.get(RULES_EVALUATED_KEY) or 0) != engine.version
+        # unchanged coins cannot trigger anything new, unless the rules themselves changed or
+        # one of their fired rules comes out of its cooldown
+        diff = snapshot_store.read_diff(snapshot.version) if snapshot.version else None
+        evaluated = _with_coins(diff, trigger_state.coin_ids(engine)) \
+            if diff is not None and not rules_changed else snapshot
+        triggers = trigger_state.filter(engine.evaluate(evaluated, previous), engine, evaluated)
+        if rules_changed:
+            snapshot_store.backend.set_max(RULES_EVALUATED_KEY, engine.version)
+        deliveries = [dict(event=f"{trigger.rule.coin_id}_price_emergency", key=trigger.rule.webhook_key,
+                           data=trigger.value)
+                      for trigger in triggers]
+        fan_out_webhooks(deliveries)
+        return len(deliveries)
+
+
+def _has_result_backend():
+    """
+    :return: whether celery is configured with a result backend, which chords need
+    :rtype: bool
+    """
+    return not isinstance(celery.backend, DisabledBackend)
+
+
+def fan_out_webhooks(deliveries):
+    """
+    Splits webhook deliveries into chunks of WEBHOOK_CHUNK_SIZE and sends every chunk with its own
+    deliver_webhooks task. With a result backend the chunk reports are combined by
+    aggregate_delivery_reports once all chunks are done, without one the chunks are only sent
+    :param deliveries: list of dicts with the event, key and data of a delivery
+    :return: async result of the aggregate report, or of the group of chunks without a result
+    backend, None if there was nothing to deliver
+    """
+    if not deliveries:
+        return None
+    size = max(webhook_dispatcher.chunk_size, 1)
+    chunks = [deliver_webhooks.s(deliveries[start:start + size]) for start in range(0, len(deliveries), size)]
+    if not _has_result_backend():
+        return group(chunks).apply_async()
+    return chord(chunks)(aggregate_delivery_reports.s())
 
 
 @celery.task()
-def post_crypto_emergency():
+def deliver_webhooks(deliveries):
     """
-    Posts a crypto emergency. In this case only the bitcoin price is tracked
+    Sends a chunk of webhook deliveries concurrently
+    :param deliveries: list of dicts with the event, key and data of a delivery
+    :return: detailed report of the chunk
+    :rtype: dict
     """
-    bitcoin = get_latest_crypto_price("bitcoin")
+    report = webhook_dispatcher.dispatch([WebhookDelivery(delivery["event"], delivery.get("key"), delivery["data"])
+                                          for delivery in deliveries])
+    return report.to_json(details=True)
 
-    if bitcoin:
-        price = bitcoin["price_usd"]
-        if price < BITCOIN_PRICE_THRESHOLD:
-            post_iftt_webhook_event("bitcoin_price_emergency", price)
+
+@celery.task()
+def aggregate_delivery_reports(reports):
+    """
+    Combines the reports of the chunks of a fanned out batch and logs the outcome
+    :param reports: detailed reports returned by deliver_webhooks
+    :return: report of the whole batch
+    :rtype: dict
+    """
+    report = merge_reports(reports)
+    app_logger.info(f"Posted crypto emergencies => {report.to_json()}")
+    return report.to_json()
 
 
 @celery.task()
-def post_telegram_notification():
+def post_telegram_notification(version=None):
     """
-    Posts a telegram notification
+    Posts a telegram notification with the bitcoin prices of the digest period up to a snapshot,
+    one every DIGEST_STEP seconds from the persisted price history
+    :param version: version of the snapshot, None for the current one
     """
-    crypto_history = []
-    bitcoin = get_latest_crypto_price("bitcoin")
-    price = bitcoin["price_usd"]
+    snapshot = _load_snapshot(version)
+    bitcoin = snapshot.get("bitcoin") if snapshot else None
+    if bitcoin is None:
+        return
+
+    end = datetime.utcfromtimestamp(snapshot.fetched_at)
+    history = get_price_history("bitcoin", end - timedelta(seconds=DIGEST_INTERVAL), end, step=DIGEST_STEP)
+    crypto_history = [{'date': datetime.utcfromtimestamp(tick["timestamp"]), 'price': tick["price_usd"]}
+                      for tick in history]
 
-    date = datetime.now()
-    crypto_history.append({'date': date, 'price': price})
+    updated = bitcoin.last_updated or int(snapshot.fetched_at)
+    if not history or history[-1]["timestamp"] < updated:
+        # the snapshot's own tick may not be persisted yet, it is persisted concurrently
+        crypto_history.append({'date': datetime.utcfromtimestamp(updated), 'price': bitcoin.price_usd})
 
     post_iftt_webhook_event("bitcoin_price_update", format_crypto_history(crypto_history))
@@ -0,0 +1,301 @@
+"""
+Typed in memory representation of the upstream ticker.
+
+The upstream sends every numeric field as a string. A snapshot is parsed once when it is
+fetched (or read from the shared store) into compact Coin records with id and symbol indexes,
+and only converted back to the upstream JSON schema at the API edge
+"""
+import threading
+import time
+from operator import attrgetter
+
+
+def _parse_float(value):
+    return float(value) if value is not None else None
+
+
+def _parse_int(value):
+    return int(value) if value is not None else None
+
+
+def _format_number(value):
+    """
+    Formats a parsed number back to the upstream string representation, never using the
+    exponent notation
+    :param value: int, float or None
+    :return: string representation or None
+    :rtype: str
+    """
+    if value is None:
+        return None
+    text = repr(value)
+    if "e" in text:
+        text = "{:.20f}".format(value).rstrip("0").rstrip(".")
+    return text
+
+
+class Coin(object):
+    """
+    A single crypto currency in a ticker snapshot. Prices, volumes and supplies are floats,
+    the rank and last_updated timestamp are ints
+    :cvar FIELDS upstream JSON key, attribute name and parser of every field
+    """
+    FIELDS = (
+        ("id", "id", str),
+        ("name", "name", str),
+        ("symbol", "symbol", str),
+        ("rank", "rank", _parse_int),
+        ("price_usd", "price_usd", _parse_float),
+        ("price_btc", "price_btc", _parse_float),
+        ("24h_volume_usd", "volume_24h_usd", _parse_float),
+        ("market_cap_usd", "market_cap_usd", _parse_float),
+        ("available_supply", "available_supply", _parse_float),
+        ("total_supply", "total_supply", _parse_float),
+        ("max_supply", "max_supply", _parse_float),
+        ("percent_change_1h", "percent_change_1h", _parse_float),
+        ("percent_change_24h", "percent_change_24h", _parse_float),
+        ("percent_change_7d", "percent_change_7d", _parse_float),
+        ("last_updated", "last_updated", _parse_int),
+    )
+    __slots__ = tuple(attribute for _, attribute, _ in FIELDS)
+    ATTRIBUTES = {key: attribute for key, attribute, _ in FIELDS}
+
+    def __init__(self, **kwargs):
+        for _, attribute, _ in self.FIELDS:
+            setattr(self, attribute, kwargs.get(attribute))
+
+    @classmethod
+    def from_json(cls, coin):
+        """
+        Creates a coin from an upstream ticker entry
+        :param coin: dictionary with string values as sent by the upstream
+        :return: parsed coin
+        :rtype: Coin
+        """
+        record = cls.__new__(cls)
+        for key, attribute, parse in cls.FIELDS:
+            value = coin.get(key)
+            setattr(record, attribute, parse(value) if value is not None else None)
+        return record
+
+    def to_json(self, fields=None):
+        """
+        Converts the coin back to the upstream JSON schema
+        :param fields: upstream keys to include, all of them if None
+        :return: dictionary with string values
+        :rtype: dict
+        """
+        coin = {}
+        for key, attribute, parse in self.FIELDS:
+            if fields is not None and key not in fields:
+                continue
+            value = getattr(self, attribute)
+            coin[key] = value if parse is str else _format_number(value)
+        return coin
+
+    def __repr__(self):
+        return "Coin(id={}, symbol={}, price_usd={})".format(self.id, self.symbol, self.price_usd)
+
+
+class Ticker(object):
+    """
+    A parsed ticker snapshot
+    :cvar coins coins ordered by rank as sent by the upstream
+    :cvar version version of the snapshot in the shared store, None if it was not published
+    :cvar fetched_at unix timestamp of when the snapshot was fetched from the upstream
+    :cvar MAX_MEMOIZED_QUERIES number of query results and other derived values kept per snapshot
+    """
+    __slots__ = ("coins", "version", "fetched_at", "_by_id", "_by_symbol", "_sorted", "_memo", "_lock")
+    MAX_MEMOIZED_QUERIES = 64
+
+    def __init__(self, coins, version=None, fetched_at=None):
+        self.coins = coins
+        self.version = version
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+        self._by_id = {coin.id: coin for coin in coins}
+        self._by_symbol = {}
+        for coin in coins:
+            # symbols are not unique upstream, the highest ranked coin wins
+            if coin.symbol is not None:
+                self._by_symbol.setdefault(coin.symbol.upper(), coin)
+        self._sorted = {}
+        self._memo = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_json(cls, ticker, version=None, fetched_at=None):
+        """
+        Parses an upstream ticker response
+        :param ticker: list of upstream ticker entries
+        :param version: version of the snapshot
+        :param fetched_at: unix timestamp of when the ticker was fetched
+        :return: parsed ticker
+        :rtype: Ticker
+        """
+        return cls([Coin.from_json(coin) for coin in ticker], version=version, fetched_at=fetched_at)
+
+    def to_json(self):
+        """
+        Converts the ticker back to the upstream JSON schema
+        :return: list of upstream ticker entries
+        :rtype: list
+        """
+        return [coin.to_json() for coin in self.coins]
+
+    @property
+    def age(self):
+        return time.time() - self.fetched_at
+
+    def get(self, coin_id):
+        """
+        :param coin_id: crypto currency id, e.g. bitcoin
+        :return: the coin or None
+        :rtype: Coin
+        """
+        return self._by_id.get(coin_id)
+
+    def get_by_symbol(self, symbol):
+        """
+        :param symbol: crypto currency symbol, e.g. BTC. Case insensitive
+        :return: the coin or None
+        :rtype: Coin
+        """
+        return self._by_symbol.get(symbol.upper())
+
+    def sorted_by(self, key, descending=False):
+        """
+        Gets the coins ordered by the given field. Every ordering is only computed once per snapshot
+        :param key: upstream key to order by, e.g. market_cap_usd
+        :param descending: True to order from the greatest value down
+        :return: ordered coins, coins without a value for the field come last
+        :rtype: list
+        """
+        order = (key, descending)
+        coins = self._sorted.get(order)
+        if coins is None:
+            attribute = Coin.ATTRIBUTES[key]
+            present = [coin for coin in self.coins if getattr(coin, attribute) is not None]
+            absent = [coin for coin in self.coins if getattr(coin, attribute) is None]
+            present.sort(key=attrgetter(attribute), reverse=descending)
+            coins = self._sorted[order] = present + absent
+        return coins
+
+    def query(self, fields=None, start=0, limit=None, min_market_cap=None, sort=None):
+        """
+        Selects, orders, paginates and projects the coins of this snapshot. Results are memoized
+        per snapshot, so repeated queries only cost a dictionary lookup
+        :param fields: frozenset of upstream keys to include, all of them if None
+        :param start: index of the first coin to return
+        :param limit: maximum number of coins to return, all of them if None
+        :param min_market_cap: only include coins with at least this market cap in USD
+        :param sort: upstream key to order by, prefixed with - for descending order. Rank order if None
+        :return: list of upstream ticker entries
+        :rtype: list
+        """
+        query = ("query", fields, start, limit, min_market_cap, sort)
+        return self.memoize(query, lambda: self._query(fields, start, limit, min_market_cap, sort))
+
+    def _query(self, fields, start, limit, min_market_cap, sort):
+        if sort:
+            coins = self.sorted_by(sort.lstrip("-"), descending=sort.startswith("-"))
+        else:
+            coins = self.coins
+        if min_market_cap is not None:
+            coins = [coin for coin in coins
+                     if coin.market_cap_usd is not None and coin.market_cap_usd >= min_market_cap]
+        end = start + limit if limit is not None else None
+        return [coin.to_json(fields) for coin in coins[start:end]]
+
+    def memoize(self, key, factory):
+        """
+        Gets a value derived from this snapshot, computing it with factory the first time
+        :param key: hashable key of the value
+        :param factory: callable computing the value
+        :return: memoized value
+        """
+        value = self._memo.get(key)
+        if value is not None:
+            return value
+
+        value = factory()
+        with self._lock:
+            if len(self._memo) >= self.MAX_MEMOIZED_QUERIES:
+                self._memo.pop(next(iter(self._memo)))
+            self._memo[key] = value
+        return value
+
+    def __iter__(self):
+        return iter(self.coins)
+
+    def __len__(self):
+        return len(self.coins)
+
+    def __repr__(self):
+        return "Ticker(version={}, fetched_at={}, coins={})".format(self.version, self.fetched_at,
+                                                                    len(self.coins))
+
+
+class TickerDiff(object):
+    """
+    Changes of a snapshot against the snapshot published before it. Coins whose last_updated
+    timestamp or values did not move are left out, so consumers only process the churn
+    :cvar snapshot the complete snapshot
+    :cvar base_version version of the snapshot it was compared with, None if there was none and
+    every coin counts as changed
+    :cvar bitmap int with bit i set if the coin at position i of the snapshot changed
+    :cvar changed Ticker of the changed coins, with the version and fetch time of the snapshot
+    :cvar COMPARED_ATTRIBUTES attributes compared when last_updated does not decide
+    """
+    __slots__ = ("snapshot", "base_version", "bitmap", "changed")
+    COMPARED_ATTRIBUTES = tuple(attribute for _, attribute, parse in Coin.FIELDS if parse is _parse_float)
+
+    def __init__(self, snapshot, bitmap, base_version=None):
+        self.snapshot = snapshot
+        self.base_version = base_version
+        self.bitmap = bitmap
+        self.changed = Ticker([coin for position, coin in enumerate(snapshot.coins) if bitmap >> position & 1],
+                              version=snapshot.version, fetched_at=snapshot.fetched_at)
+
+    @classmethod
+    def _has_changed(cls, coin, previous):
+        if previous is None:
+            return True
+        if coin.last_updated is not None and coin.last_updated == previous.last_updated:
+            return False
+        return any(getattr(coin, attribute) != getattr(previous, attribute) for attribute in cls.COMPARED_ATTRIBUTES)
+
+    @classmethod
+    def compute(cls, snapshot, previous=None):
+        """
+        Compares a snapshot with the one before it
+        :param snapshot: the new Ticker
+        :param previous: the previous Ticker, None if there is none
+        :return: the diff
+        :rtype: TickerDiff
+        """
+        if previous is None:
+            return cls(snapshot, (1 << len(snapshot)) - 1)
+        bitmap = 0
+        for position, coin in enumerate(snapshot.coins):
+            if cls._has_changed(coin, previous.get(coin.id)):
+                bitmap |= 1 << position
+        return cls(snapshot, bitmap, base_version=previous.version)
+
+    @classmethod
+    def from_json(cls, snapshot, diff):
+        """
+        :param snapshot: the Ticker the diff was computed for
+        :param diff: dictionary as returned by to_json
+        :rtype: TickerDiff
+        """
+        return cls(snapshot, int(diff["bitmap"], 16), base_version=diff.get("base_version"))
+
+    def to_json(self):
+        return dict(base_version=self.base_version, bitmap=format(self.bitmap, "x"))
+
+    def __len__(self):
+        return len(self.changed)
+
+    def __repr__(self):
+        return "TickerDiff(version={}, base_version={}, changed={}/{})".format(
+            self.snapshot.version, self.base_version, len(self.changed), len(self.snapshot))
@@ -1,22 +1,222 @@
+import math
+import time
+from datetime import datetime
+
 from . import crypto
-from flask import jsonify
-from .services import get_all_crypto_currency_prices, get_latest_crypto_price
+from flask import Response, jsonify, request
+from flask_login import login_required, current_user
+from app import db
+from .alerts import AlertRule, alert_engine, validate_rule
+from .breaker import upstream_breaker, CLOSED, OPEN
+from .cache import ticker_cache
+from .client import http_client
+from .history import get_price_history
+from .models import AlertSubscription
+from .ratelimit import rate_limiter
+from .singleflight import single_flight
+from .store import snapshot_store
+from .stream import price_broadcaster
+from .responses import EncodedBody, json_response
+from .ticker import Coin
+
+
+def _split_param(name):
+    """
+    Splits a comma separated query parameter into its unique values, keeping their order
+    :param name: name of the query parameter
+    :return: list of values
+    :rtype: list
+    """
+    values = []
+    for value in request.args.get(name, "").split(","):
+        value = value.strip()
+        if value and value not in values:
+            values.append(value)
+    return values
+
+
+def _number_param(name, number_type, default=None):
+    """
+    Parses a numeric query parameter
+    :param name: name of the query parameter
+    :param number_type: int or float
+    :param default: value to use if the parameter is not given
+    :raises ValueError: if the parameter is not a number
+    """
+    value = request.args.get(name)
+    if value is None or value == "":
+        return default
+    return number_type(value)
+
+
+def _ticker_query_args():
+    """
+    Parses the ticker query parameters of the current request
+    :raises ValueError: if a parameter is invalid
+    :return: keyword arguments for Ticker.query
+    :rtype: dict
+    """
+    fields = _split_param("fields")
+    unknown_fields = [field for field in fields if field not in Coin.ATTRIBUTES]
+    if unknown_fields:
+        raise ValueError("Unknown fields: {}".format(", ".join(unknown_fields)))
+
+    sort = request.args.get("sort") or None
+    if sort is not None and sort.lstrip("-") not in Coin.ATTRIBUTES:
+        raise ValueError("Unknown sort field: {}".format(sort.lstrip("-")))
+
+    try:
+        start = _number_param("start", int, default=0)
+        limit = _number_param("limit", int)
+        min_market_cap = _number_param("min_market_cap", float)
+    except ValueError:
+        raise ValueError("start and limit must be integers, min_market_cap a number")
+    if start < 0 or (limit is not None and limit < 0):
+        raise ValueError("start and limit must not be negative")
+
+    return dict(fields=frozenset(fields) if fields else None, start=start, limit=limit,
+                min_market_cap=min_market_cap, sort=sort)
+
+
+def _with_staleness(response, snapshot):
+    """
+    Tells clients how old the served snapshot is with X-Data-Age (seconds) and flags it with a
+    Warning header when it is older than the snapshot max age or the upstream circuit is open,
+    i.e. the last good snapshot is served while the upstream is unavailable
+    :param response: response serving data of the snapshot
+    :param snapshot: Ticker the data comes from
+    :return: the response
+    """
+    if snapshot is None:
+        return response
+    age = max(int(snapshot.age), 0)
+    response.headers["X-Data-Age"] = str(age)
+    if age > snapshot_store.max_age or upstream_breaker.state != CLOSED:
+        response.headers["Warning"] = '110 - "Response is Stale"'
+    return response
+
+
+def _unavailable(message):
+    """
+    Response for data that is neither in the snapshot nor could be fetched. While the upstream
+    circuit is open that is a 503 telling the client when to retry, otherwise a 404
+    :param message: message of the response
+    """
+    if upstream_breaker.state == OPEN:
+        response = jsonify({
+            "message": f"{message}, the price service is unavailable",
+            "success": False
+        })
+        response.status_code = 503
+        response.headers["Retry-After"] = str(upstream_breaker.retry_after)
+        return response
+    return jsonify({
+        "message": message,
+        "success": False
+    }), 404
 
 
 @crypto.route("/all", methods=["GET"])
 def get_all_prices():
     """
-    Gets all prices for crypto currencies
+    Gets all prices for crypto currencies. The list can be projected with ?fields=id,symbol,
+    filtered with ?min_market_cap=, ordered with ?sort=market_cap_usd (prefix with - for
+    descending order) and paginated with ?start= and ?limit=
     :return: JSONIFY response
     """
-    response = get_all_crypto_currency_prices()
+    try:
+        query_args = _ticker_query_args()
+    except ValueError as e:
+        return jsonify({
+            "message": str(e),
+            "success": False
+        }), 400
+
+    response = ticker_cache.get_all()
     if response:
-        return jsonify(response)
+        body = response.memoize(("body", frozenset(query_args.items())),
+                                lambda: EncodedBody(response.query(**query_args)))
+        return _with_staleness(json_response(body), response)
     else:
+        return _unavailable("Could not find Crypto currency prices")
+
+
+@crypto.route("/batch", methods=["GET"])
+def get_batch_prices():
+    """
+    Gets the prices for several crypto currencies given by id (?ids=bitcoin,ethereum) and/or
+    symbol (?symbols=BTC,ETH). All of them are resolved from one ticker snapshot, coins that are
+    not part of it are reported as missing instead of being fetched one by one
+    :return: JSONIFY response with the found crypto currencies and the missing ids and symbols
+    """
+    ids = _split_param("ids")
+    symbols = _split_param("symbols")
+    if not ids and not symbols:
         return jsonify({
-            "message": "Could not find Crypto currency prices",
+            "message": "Provide crypto currency ids and/or symbols, e.g. ?ids=bitcoin&symbols=ETH",
             "success": False
-        }), 404
+        }), 400
+
+    ticker = ticker_cache.get_all()
+    if not ticker:
+        return _unavailable("Could not find Crypto currency prices")
+
+    coins = {}
+    missing_ids = []
+    missing_symbols = []
+    for coin_id in ids:
+        coin = ticker.get(coin_id)
+        if coin is None:
+            missing_ids.append(coin_id)
+        else:
+            coins.setdefault(coin.id, coin)
+    for symbol in symbols:
+        coin = ticker.get_by_symbol(symbol)
+        if coin is None:
+            missing_symbols.append(symbol)
+        else:
+            coins.setdefault(coin.id, coin)
+
+    return _with_staleness(jsonify({
+        "data": [coin.to_json() for coin in coins.values()],
+        "missing": {"ids": missing_ids, "symbols": missing_symbols},
+        "success": True
+    }), ticker)
+
+
+@crypto.route("/stream", methods=["GET"])
+def stream_prices():
+    """
+    Streams prices as Server-Sent Events. The current snapshot is sent first as a snapshot event,
+    then a prices event with the coins that changed in every new snapshot. ?ids=bitcoin,ethereum
+    limits the stream to the given coins
+    :return: text/event-stream response
+    """
+    ids = _split_param("ids")
+    # the published snapshot, the process' cached copy may be older than the watcher's
+    snapshot = snapshot_store.read() or ticker_cache.get_all()
+    response = Response(price_broadcaster.stream(ids or None, snapshot), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    # keeps proxies like nginx from buffering the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+@crypto.route("/stats", methods=["GET"])
+def get_stats():
+    """
+    Gets the upstream counters of this process: connection pool hits and misses of the HTTP
+    client, coalesced upstream fetches and rate limiter waits
+    :return: JSONIFY response
+    """
+    return jsonify({
+        "data": {
+            "http_pool": http_client.stats.to_json(),
+            "single_flight": single_flight.stats.to_json(),
+            "rate_limiter": rate_limiter.stats.to_json()
+        },
+        "success": True
+    })
 
 
 @crypto.route("/<string:crypto_currency>", methods=["GET"])
@@ -26,11 +226,207 @@ def get_latest_price(crypto_currency):
     :param crypto_currency: Crypto currency to get information for
     :return:
     """
-    response = get_latest_crypto_price(crypto_currency)
-    if response:
-        return jsonify(response)
-    else:
+    snapshot = ticker_cache.get_all()
+    if not snapshot:
+        return _unavailable(f"Could not find price for {crypto_currency}")
+
+    response = snapshot.get(crypto_currency)
+    if response is None:
+        # the snapshot lists every coin, one missing from it is not fetched on its own
         return jsonify({
             "message": f"Could not find price for {crypto_currency}",
             "success": False
         }), 404
+    body = snapshot.memoize(("coin", response.id), lambda: EncodedBody(response.to_json()))
+    return _with_staleness(json_response(body), snapshot)
+
+
+@crypto.route("/<string:crypto_currency>/history", methods=["GET"])
+def get_price_history_view(crypto_currency):
+    """
+    Gets the price history of a crypto currency between ?from= and ?to= (unix timestamps,
+    defaulting to the last 24 hours), optionally down sampled to one entry every ?step= seconds.
+    Steps of a minute or more are answered with OHLC entries built from the price rollups
+    :param crypto_currency: Crypto currency to get the history for
+    :return: JSONIFY response
+    """
+    try:
+        end = _number_param("to", int, default=int(time.time()))
+        start = _number_param("from", int, default=end - 24 * 60 * 60)
+        step = _number_param("step", int)
+        start_at, end_at = datetime.utcfromtimestamp(start), datetime.utcfromtimestamp(end)
+    except (ValueError, OverflowError, OSError):
+        return jsonify({
+            "message": "from, to and step must be unix timestamps and seconds",
+            "success": False
+        }), 400
+    if start > end or (step is not None and step <= 0):
+        return jsonify({
+            "message": "from must not be after to and step must be positive",
+            "success": False
+        }), 400
+
+    history = get_price_history(crypto_currency, start_at, end_at, step=step)
+    return jsonify({
+        "id": crypto_currency,
+        "from": start,
+        "to": end,
+        "step": step,
+        "data": history,
+        "success": True
+    })
+
+
+def _subscription_values():
+    """
+    Reads and validates the alert subscription fields of the current request's JSON body or form
+    :raises ValueError: if a field is invalid
+    :return: the given fields
+    :rtype: dict
+    """
+    data = request.get_json(silent=True) or request.values
+    values = {name: data[name] for name in ("coin_id", "field", "condition", "threshold", "channel", "webhook_key",
+                                            "active") if name in data}
+    if "threshold" in values:
+        try:
+            values["threshold"] = float(values["threshold"])
+        except (TypeError, ValueError):
+            raise ValueError("threshold must be a number")
+        if not math.isfinite(values["threshold"]):
+            raise ValueError("threshold must be a finite number")
+    if "active" in values and not isinstance(values["active"], bool):
+        values["active"] = str(values["active"]).lower() in ("1", "true", "yes")
+    return values
+
+
+def _validate_subscription(subscription):
+    """
+    :raises ValueError: if the subscription is incomplete or could not be evaluated
+    """
+    if not subscription.coin_id or subscription.condition is None or subscription.threshold is None:
+        raise ValueError("coin_id, condition and threshold are required")
+    validate_rule(AlertRule(subscription.id, subscription.user_account_id, subscription.coin_id, subscription.field,
+                            subscription.condition, subscription.threshold, subscription.channel))
+
+
+def _get_own_subscription(subscription_id):
+    return AlertSubscription.query.filter_by(id=subscription_id, user_account_id=current_user.id).first()
+
+
+@crypto.route("/subscriptions", methods=["GET"])
+@login_required
+def get_subscriptions():
+    """
+    Lists the current user's alert subscriptions
+    :return: JSONIFY response
+    """
+    subscriptions = AlertSubscription.query.filter_by(user_account_id=current_user.id) \
+        .order_by(AlertSubscription.id).all()
+    return jsonify({
+        "data": [subscription.to_json() for subscription in subscriptions],
+        "success": True
+    })
+
+
+@crypto.route("/subscriptions", methods=["POST"])
+@login_required
+def create_subscription():
+    """
+    Creates an alert subscription for the current user, e.g. coin_id=bitcoin, condition=below,
+    threshold=10000 and optionally field, channel and webhook_key
+    :return: JSONIFY response with the new subscription
+    """
+    subscription = AlertSubscription(user_account_id=current_user.id)
+    try:
+        subscription.from_json(_subscription_values())
+        _validate_subscription(subscription)
+    except ValueError as e:
+        return jsonify({
+            "message": str(e),
+            "success": False
+        }), 400
+
+    db.session.add(subscription)
+    db.session.commit()
+    alert_engine.invalidate()
+    return jsonify({
+        "data": subscription.to_json(),
+        "success": True
+    }), 201
+
+
+@crypto.route("/subscriptions/<int:subscription_id>", methods=["GET"])
+@login_required
+def get_subscription(subscription_id):
+    """
+    Gets one of the current user's alert subscriptions
+    :param subscription_id: id of the subscription
+    :return: JSONIFY response
+    """
+    subscription = _get_own_subscription(subscription_id)
+    if subscription is None:
+        return jsonify({
+            "message": f"Could not find subscription {subscription_id}",
+            "success": False
+        }), 404
+    return jsonify({
+        "data": subscription.to_json(),
+        "success": True
+    })
+
+
+@crypto.route("/subscriptions/<int:subscription_id>", methods=["PUT", "PATCH"])
+@login_required
+def update_subscription(subscription_id):
+    """
+    Updates the given fields of one of the current user's alert subscriptions
+    :param subscription_id: id of the subscription
+    :return: JSONIFY response with the updated subscription
+    """
+    subscription = _get_own_subscription(subscription_id)
+    if subscription is None:
+        return jsonify({
+            "message": f"Could not find subscription {subscription_id}",
+            "success": False
+        }), 404
+
+    try:
+        subscription.from_json(_subscription_values())
+        _validate_subscription(subscription)
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({
+            "message": str(e),
+            "success": False
+        }), 400
+
+    db.session.commit()
+    alert_engine.invalidate()
+    return jsonify({
+        "data": subscription.to_json(),
+        "success": True
+    })
+
+
+@crypto.route("/subscriptions/<int:subscription_id>", methods=["DELETE"])
+@login_required
+def delete_subscription(subscription_id):
+    """
+    Deletes one of the current user's alert subscriptions
+    :param subscription_id: id of the subscription
+    :return: JSONIFY response
+    """
+    subscription = _get_own_subscription(subscription_id)
+    if subscription is None:
+        return jsonify({
+            "message": f"Could not find subscription {subscription_id}",
+            "success": False
+        }), 404
+
+    db.session.delete(subscription)
+    db.session.commit()
+    alert_engine.invalidate()
+    return jsonify({
+        "message": f"Deleted subscription {subscription_id}",
+        "success": True
+    })
@@ -3,6 +3,7 @@ Configurations for flask application. These are global variables that the app wi
 lifetime
 """
 import os
+import tempfile
 from abc import ABCMeta
 from setup_env import  setup_env
 from app.__tasks__ import app_schedules
@@ -79,6 +80,110 @@ class Config(object):
     REDIS_PORT = os.environ.get("REDIS_PORT")
     REDIS_DB = os.environ.get("REDIS_DB")
 
+    # upstream HTTP client settings. timeouts are in seconds, pool sizes are per process
+    HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 3.05))
+    HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", 10))
+    HTTP_POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS", 4))
+    HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", 10))
+
+    # seconds a ticker snapshot is served before it is refreshed in the background
+    TICKER_CACHE_TTL = int(os.environ.get("TICKER_CACHE_TTL", 60))
+
+    # directory of the host local lock files used to coalesce upstream fetches across workers
+    SINGLE_FLIGHT_LOCK_DIR = os.environ.get("SINGLE_FLIGHT_LOCK_DIR") or \
+        os.path.join(tempfile.gettempdir(), "crypto_notifier_locks")
+    # seconds a request waits on a coalesced in-flight upstream fetch before it gives up
+    SINGLE_FLIGHT_WAIT_TIMEOUT = int(os.environ.get("SINGLE_FLIGHT_WAIT_TIMEOUT", 30))
+
+    # upstream rate limit shared by all processes: a token bucket refilled with UPSTREAM_RATE
+    # requests per second up to UPSTREAM_BURST. low priority requests (dashboard refreshes) leave
+    # UPSTREAM_LOW_PRIORITY_RESERVE of the bucket to high priority ones (alert fetches), and
+    # requests wait at most UPSTREAM_MAX_WAIT_* seconds for a token before stale data is served.
+    # without redis the bucket is kept in a state file in UPSTREAM_RATE_LIMIT_DIR
+    UPSTREAM_RATE = float(os.environ.get("UPSTREAM_RATE", 0.5))
+    UPSTREAM_BURST = int(os.environ.get("UPSTREAM_BURST", 10))
+    UPSTREAM_LOW_PRIORITY_RESERVE = float(os.environ.get("UPSTREAM_LOW_PRIORITY_RESERVE", 0.3))
+    UPSTREAM_MAX_WAIT_HIGH = float(os.environ.get("UPSTREAM_MAX_WAIT_HIGH", 10))
+    UPSTREAM_MAX_WAIT_LOW = float(os.environ.get("UPSTREAM_MAX_WAIT_LOW", 0))
+    UPSTREAM_RATE_LIMIT_DIR = os.environ.get("UPSTREAM_RATE_LIMIT_DIR") or \
+        os.path.join(tempfile.gettempdir(), "crypto_notifier_locks")
+
+    # the upstream circuit opens when CIRCUIT_BREAKER_FAILURE_RATE of at least
+    # CIRCUIT_BREAKER_MIN_CALLS calls in the last CIRCUIT_BREAKER_WINDOW seconds failed, and lets
+    # a probe call through after CIRCUIT_BREAKER_OPEN_TIMEOUT seconds
+    CIRCUIT_BREAKER_WINDOW = int(os.environ.get("CIRCUIT_BREAKER_WINDOW", 60))
+    CIRCUIT_BREAKER_MIN_CALLS = int(os.environ.get("CIRCUIT_BREAKER_MIN_CALLS", 5))
+    CIRCUIT_BREAKER_FAILURE_RATE = float(os.environ.get("CIRCUIT_BREAKER_FAILURE_RATE", 0.5))
+    CIRCUIT_BREAKER_OPEN_TIMEOUT = int(os.environ.get("CIRCUIT_BREAKER_OPEN_TIMEOUT", 30))
+
+    # price stream: seconds between checks for a new snapshot, events queued per client before the
+    # oldest are dropped and seconds after which an idle stream gets a keep alive
+    STREAM_POLL_INTERVAL = float(os.environ.get("STREAM_POLL_INTERVAL", 1.0))
+    STREAM_QUEUE_SIZE = int(os.environ.get("STREAM_QUEUE_SIZE", 32))
+    STREAM_HEARTBEAT = int(os.environ.get("STREAM_HEARTBEAT", 15))
+
+    # seconds the users' last seen times are buffered before they are written in one bulk update
+    LAST_SEEN_FLUSH_INTERVAL = int(os.environ.get("LAST_SEEN_FLUSH_INTERVAL", 60))
+
+    # user records loaded for sessions are cached for IDENTITY_CACHE_TTL seconds in every process,
+    # at most IDENTITY_CACHE_SIZE of them, and for IDENTITY_CACHE_SHARED_TTL seconds in redis
+    IDENTITY_CACHE_SIZE = int(os.environ.get("IDENTITY_CACHE_SIZE", 1024))
+    IDENTITY_CACHE_TTL = int(os.environ.get("IDENTITY_CACHE_TTL", 30))
+    IDENTITY_CACHE_SHARED_TTL = int(os.environ.get("IDENTITY_CACHE_SHARED_TTL", 300))
+
+    # seconds the auth tokens issued at login are valid for and number of verified tokens whose
+    # claims are cached until they expire
+    AUTH_TOKEN_EXPIRATION = int(os.environ.get("AUTH_TOKEN_EXPIRATION", 3600))
+    AUTH_TOKEN_CACHE_SIZE = int(os.environ.get("AUTH_TOKEN_CACHE_SIZE", 4096))
+
+    # passwords are hashed with PASSWORD_HASH_ITERATIONS rounds of PBKDF2 by a pool of
+    # PASSWORD_HASH_WORKERS threads (one per core if unset). logins and registrations beyond
+    # PASSWORD_HASH_QUEUE_SIZE waiting ones, or waiting longer than PASSWORD_HASH_TIMEOUT
+    # seconds, are rejected with 503
+    PASSWORD_HASH_ITERATIONS = int(os.environ.get("PASSWORD_HASH_ITERATIONS", 150000))
+    PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 0))
+    PASSWORD_HASH_QUEUE_SIZE = int(os.environ.get("PASSWORD_HASH_QUEUE_SIZE", 16))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get("PASSWORD_HASH_TIMEOUT", 10))
+
+    # age in seconds after which a shared ticker snapshot is no longer served and the upstream is
+    # called instead, and how long published snapshot blobs are kept around
+    TICKER_SNAPSHOT_MAX_AGE = int(os.environ.get("TICKER_SNAPSHOT_MAX_AGE", 300))
+    TICKER_SNAPSHOT_BLOB_TTL = int(os.environ.get("TICKER_SNAPSHOT_BLOB_TTL", 3600))
+
+    # number of coins written per multi-row INSERT when recording the price history
+    PRICE_TICK_INSERT_BATCH_SIZE = int(os.environ.get("PRICE_TICK_INSERT_BATCH_SIZE", 1000))
+
+    # IFTTT webhook key for alerts without a key of their own
+    IFTTT_WEBHOOK_KEY = os.environ.get("IFTTT_WEBHOOK_KEY")
+
+    # webhook dispatcher settings. requests in flight overall and per host, retries on 429/5xx
+    # with jittered exponential backoff (seconds) and how many given up deliveries are kept
+    WEBHOOK_MAX_CONCURRENCY = int(os.environ.get("WEBHOOK_MAX_CONCURRENCY", 16))
+    WEBHOOK_MAX_PER_HOST = int(os.environ.get("WEBHOOK_MAX_PER_HOST", 8))
+    WEBHOOK_MAX_RETRIES = int(os.environ.get("WEBHOOK_MAX_RETRIES", 3))
+    WEBHOOK_BACKOFF_BASE = float(os.environ.get("WEBHOOK_BACKOFF_BASE", 0.5))
+    WEBHOOK_BACKOFF_MAX = float(os.environ.get("WEBHOOK_BACKOFF_MAX", 30))
+    WEBHOOK_DEAD_LETTER_SIZE = int(os.environ.get("WEBHOOK_DEAD_LETTER_SIZE", 1000))
+
+    # an alert that fired is re-armed once the value is back past its threshold by more than this
+    # fraction of the threshold, and fires again no sooner than the cooldown in seconds
+    ALERT_HYSTERESIS = float(os.environ.get("ALERT_HYSTERESIS", 0.01))
+    ALERT_COOLDOWN = int(os.environ.get("ALERT_COOLDOWN", 3600))
+
+    # adaptive ticker polling. the interval in seconds moves between the bounds with the volatility
+    # of the watched coins (a 1h change of POLL_VOLATILE_PERCENT counts as fully volatile) and their
+    # distance to an alert threshold (relative, POLL_THRESHOLD_BAND), within POLL_QUOTA_REQUESTS
+    # upstream requests per POLL_QUOTA_WINDOW seconds
+    POLL_MIN_INTERVAL = int(os.environ.get("POLL_MIN_INTERVAL", 15))
+    POLL_MAX_INTERVAL = int(os.environ.get("POLL_MAX_INTERVAL", 300))
+    POLL_QUOTA_REQUESTS = int(os.environ.get("POLL_QUOTA_REQUESTS", 1440))
+    POLL_QUOTA_WINDOW = int(os.environ.get("POLL_QUOTA_WINDOW", 86400))
+    POLL_VOLATILE_PERCENT = float(os.environ.get("POLL_VOLATILE_PERCENT", 5.0))
+    POLL_THRESHOLD_BAND = float(os.environ.get("POLL_THRESHOLD_BAND", 0.05))
+
+    # number of webhook deliveries per celery task when alerts are fanned out across workers
+    WEBHOOK_CHUNK_SIZE = int(os.environ.get("WEBHOOK_CHUNK_SIZE", 100))
+
     @staticmethod
     def init_app(app):
         """Initializes the current application"""
@@ -104,6 +209,15 @@ class TestingConfig(Config):
     CSRF_ENABLED = False
     PRESERVE_CONTEXT_ON_EXCEPTION = False
 
+    # keep the upstream rate limit per test app instead of sharing it through the host
+    UPSTREAM_RATE_LIMIT_DIR = None
+
+    # last seen times are only written when a test flushes them
+    LAST_SEEN_FLUSH_INTERVAL = 0
+
+    # cheap password hashes keep the tests fast
+    PASSWORD_HASH_ITERATIONS = 1000
+
 
 class ProductionConfig(Config):
     """
@@ -136,10 +136,16 @@ def user_add(email, password, admin=False):
 @manager.option('-e', '--email', help='email address', required=True)
 def user_del(email):
     """delete a user from the database"""
+    from app.mod_auth.identity import identity_cache
     from app.mod_auth.models import UserAccount
-    user_account = UserAccount.query.filter_by(email=email)
+    from app.mod_crypto.alerts import alert_engine
+    user_account = UserAccount.query.filter_by(email=email).first()
     if user_account:
+        # the user's alert subscriptions are deleted with the account
         db.session.delete(user_account)
+        db.session.commit()
+        identity_cache.invalidate(user_account.id)
+        alert_engine.invalidate()
         app_logger.info("User with email: {} deleted".format(email))
     else:
         app_logger.error("User with email: {} does not exist in DB".format(email))
@@ -0,0 +1,90 @@
+import threading
+import unittest
+from unittest.mock import patch
+from app.mod_auth.exceptions import ServiceBusy
+from app.mod_auth.hashing import PasswordHasher, password_hasher
+from app.mod_auth.models import UserAccount
+from tests import BaseTestCase
+
+
+class PasswordHasherTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(PasswordHasherTestCase, self).setUp()
+        self.hasher = PasswordHasher(self.app)
+
+    def test_hash_uses_configured_cost(self):
+        password_hash = self.hasher.hash("secret")
+
+        self.assertTrue(password_hash.startswith("pbkdf2:sha256:1000$"))
+        self.assertTrue(self.hasher.verify(password_hash, "secret"))
+        self.assertFalse(self.hasher.verify(password_hash, "wrong"))
+
+    def test_hashes_of_another_cost_are_verified(self):
+        password_hash = PasswordHasher().hash("secret")
+
+        self.assertTrue(self.hasher.verify(password_hash, "secret"))
+
+    def test_saturated_pool_rejects_right_away(self):
+        self.app.config.update(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE_SIZE=0)
+        self.hasher.init_app(self.app)
+        started, release = threading.Event(), threading.Event()
+
+        def slow_hash(*args):
+            started.set()
+            release.wait(5)
+            return "hash"
+
+        with patch("app.mod_auth.hashing.generate_password_hash", side_effect=slow_hash):
+            busy = threading.Thread(target=self.hasher.hash, args=("secret",))
+            busy.start()
+            started.wait(5)
+            with self.assertRaises(ServiceBusy):
+                self.hasher.verify("hash", "secret")
+            release.set()
+            busy.join(5)
+
+        self.assertTrue(self.hasher.hash("secret").startswith("pbkdf2:sha256:1000$"))
+
+    def test_reconfigured_pool_keeps_its_slots(self):
+        self.app.config.update(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE_SIZE=0)
+        self.hasher.init_app(self.app)
+        started, release = threading.Event(), threading.Event()
+
+        def slow_hash(*args):
+            started.set()
+            release.wait(5)
+            return "hash"
+
+        with patch("app.mod_auth.hashing.generate_password_hash", side_effect=slow_hash):
+            busy = threading.Thread(target=self.hasher.hash, args=("secret",))
+            busy.start()
+            started.wait(5)
+            self.app.config.update(PASSWORD_HASH_QUEUE_SIZE=1)
+            self.hasher.init_app(self.app)
+            slots = self.hasher._slots
+            self.assertTrue(slots.acquire(blocking=False))
+            release.set()
+            busy.join(5)
+
+        # the call started on the old pool must not release a slot of the new one
+        self.assertTrue(slots.acquire(blocking=False))
+        self.assertFalse(slots.acquire(blocking=False))
+
+    def test_login_is_rejected_with_503_when_pool_is_saturated(self):
+        with patch.object(password_hasher, "verify", side_effect=ServiceBusy()):
+            response = self.login()
+
+        self.assertEqual(503, response.status_code)
+        self.assertEqual("1", response.headers["Retry-After"])
+
+    def test_password_setter_hashes_on_the_pool(self):
+        user = UserAccount.query.filter_by(username="user1").first()
+        user.password = "new_pass"
+
+        self.assertTrue(user.password_hash.startswith("pbkdf2:sha256:1000$"))
+        self.assertTrue(user.verify_password("new_pass"))
+
+
+if __name__ == '__main__':
+    unittest.main()
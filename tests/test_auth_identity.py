@@ -0,0 +1,102 @@
+import unittest
+from unittest.mock import patch
+from app.mod_auth.identity import IdentityCache, UserRecord, identity_cache
+from app.mod_auth.models import UserAccount
+from tests import BaseTestCase
+
+
+class IdentityCacheTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(IdentityCacheTestCase, self).setUp()
+        self.cache = IdentityCache(self.app)
+        self.user1 = UserAccount.query.filter_by(username="user1").first()
+        self.user2 = UserAccount.query.filter_by(username="user2").first()
+
+    def test_loaded_record_is_detached_copy_of_account(self):
+        record = self.cache.load(str(self.user1.id))
+
+        self.assertIsInstance(record, UserRecord)
+        self.assertEqual(self.user1.id, record.id)
+        self.assertEqual("user1", record.username)
+        self.assertEqual(str(self.user1.id), record.get_id())
+
+    def test_second_load_skips_the_database(self):
+        record = self.cache.load(self.user1.id)
+
+        with patch.object(UserAccount, "query") as mock_query:
+            self.assertIs(record, self.cache.load(self.user1.id))
+            mock_query.get.assert_not_called()
+
+    def test_missing_account_is_not_cached(self):
+        self.assertIsNone(self.cache.load(1000))
+        self.assertEqual(0, len(self.cache))
+
+    def test_expired_record_is_loaded_again(self):
+        self.cache.ttl = 0
+        record = self.cache.load(self.user1.id)
+
+        self.assertIsNot(record, self.cache.load(self.user1.id))
+
+    def test_least_recently_used_record_is_evicted(self):
+        self.cache.max_size = 2
+        self.cache._put(1, "first")
+        self.cache._put(2, "second")
+        self.cache._get(1)
+        self.cache._put(3, "third")
+
+        self.assertEqual("first", self.cache._get(1))
+        self.assertIsNone(self.cache._get(2))
+        self.assertEqual(2, len(self.cache))
+
+    def test_confirming_the_account_invalidates_its_record(self):
+        identity_cache.load(self.user1.id)
+        token = self.user1.generate_confirmation_token()
+
+        self.assertTrue(self.user1.confirm_token(token))
+        self.db.session.commit()
+
+        self.assertTrue(identity_cache.load(self.user1.id).confirmed)
+
+    def test_changing_the_email_invalidates_the_record(self):
+        identity_cache.load(self.user1.id)
+        token = self.user1.generate_email_change_token("user1@example.org")
+
+        self.assertTrue(self.user1.change_email(token))
+        self.db.session.commit()
+
+        self.assertEqual("user1@example.org", identity_cache.load(self.user1.id).email)
+
+    def test_resetting_the_password_invalidates_the_record_on_commit(self):
+        identity_cache.load(self.user1.id)
+        token = self.user1.generate_reset_token()
+
+        self.assertTrue(self.user1.reset_password(token, "new-password"))
+        self.assertIsNotNone(identity_cache._get(self.user1.id))
+        self.db.session.commit()
+
+        self.assertIsNone(identity_cache._get(self.user1.id))
+
+    def test_rolled_back_change_does_not_invalidate_the_record(self):
+        identity_cache.load(self.user1.id)
+        token = self.user1.generate_reset_token()
+
+        self.assertTrue(self.user1.reset_password(token, "new-password"))
+        self.db.session.rollback()
+        self.db.session.commit()
+
+        self.assertIsNotNone(identity_cache._get(self.user1.id))
+
+    def test_session_user_is_loaded_from_the_cache(self):
+        self.login()
+        self.client.get("/crypto/subscriptions")
+
+        with patch.object(UserAccount, "query") as mock_query:
+            response = self.client.get("/crypto/subscriptions")
+            mock_query.get.assert_not_called()
+
+        self.assert200(response)
+
+
+if __name__ == '__main__':
+    unittest.main()
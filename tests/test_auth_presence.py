@@ -0,0 +1,53 @@
+import unittest
+from datetime import datetime, timedelta
+from app.mod_auth.models import UserAccount
+from app.mod_auth.presence import LastSeenBuffer, last_seen_buffer
+from tests import BaseTestCase
+
+
+class LastSeenBufferTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(LastSeenBufferTestCase, self).setUp()
+        self.buffer = LastSeenBuffer(self.app)
+        self.user = UserAccount.query.filter_by(username="user1").first()
+
+    def last_seen(self):
+        self.db.session.expire_all()
+        return UserAccount.query.get(self.user.id).last_seen
+
+    def test_hits_of_a_user_are_coalesced(self):
+        seen = datetime.now().replace(microsecond=0) + timedelta(hours=2)
+        self.buffer.record(self.user.id, seen)
+        self.buffer.record(self.user.id, seen + timedelta(minutes=1))
+        self.buffer.record(self.user.id, seen - timedelta(minutes=1))
+
+        self.assertEqual(1, self.buffer.pending)
+        self.assertEqual(1, self.buffer.flush())
+        self.assertEqual(seen + timedelta(minutes=1), self.last_seen())
+        self.assertEqual(0, self.buffer.pending)
+
+    def test_flush_does_not_move_last_seen_backwards(self):
+        seen = datetime.now().replace(microsecond=0) + timedelta(hours=2)
+        self.buffer.record(self.user.id, seen)
+        self.buffer.flush()
+
+        self.buffer.record(self.user.id, seen - timedelta(hours=1))
+        self.buffer.flush()
+
+        self.assertEqual(seen, self.last_seen())
+
+    def test_authenticated_request_only_buffers_last_seen(self):
+        self.login()
+        last_seen = self.last_seen()
+
+        self.client.get("/crypto/subscriptions")
+
+        self.assertEqual(last_seen, self.last_seen())
+        self.assertEqual(1, last_seen_buffer.pending)
+        last_seen_buffer.flush()
+        self.assertGreater(self.last_seen(), last_seen)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import json
+import unittest
+from unittest.mock import patch
+from app.mod_auth.models import UserAccount
+from app.mod_auth.security_utils import token_claims_cache, verify_auth_token
+from tests import BaseTestCase
+
+
+class AuthTokenTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(AuthTokenTestCase, self).setUp()
+        self.user = UserAccount.query.filter_by(username="user1").first()
+
+    def test_login_token_carries_the_user_id(self):
+        token = json.loads(self.login().data.decode("utf-8"))["token"]
+
+        claims = verify_auth_token(token)
+
+        self.assertEqual(self.user.id, claims["id"])
+        self.assertEqual("user1", claims["username"])
+
+    def test_tampered_token_is_rejected(self):
+        token = self.user.generate_auth_token()
+
+        self.assertIsNone(verify_auth_token(token[:-2] + ("AA" if token[-2:] != "AA" else "BB")))
+
+    def test_expired_token_is_rejected(self):
+        token = self.user.generate_auth_token(expiration=-60)
+
+        self.assertIsNone(verify_auth_token(token))
+        self.assertEqual(0, len(token_claims_cache))
+
+    def test_expired_claims_are_dropped_from_the_cache(self):
+        token = self.user.generate_auth_token()
+        claims = verify_auth_token(token)
+
+        self.assertIs(claims, token_claims_cache.get(token))
+        self.assertIsNone(token_claims_cache.get(token, now=claims["exp"]))
+        self.assertEqual(0, len(token_claims_cache))
+
+    def test_verified_claims_are_cached(self):
+        token = self.user.generate_auth_token()
+        verify_auth_token(token)
+
+        with patch("jwt.decode") as mock_decode:
+            self.assertEqual(self.user.id, verify_auth_token(token)["id"])
+            mock_decode.assert_not_called()
+
+    def test_bearer_token_authenticates_without_session(self):
+        headers = {"Authorization": "Bearer {}".format(self.user.generate_auth_token())}
+
+        response = self.client.get("/crypto/subscriptions", headers=headers)
+
+        self.assert200(response)
+        self.assertNotIn("Set-Cookie", response.headers)
+
+    def test_invalid_bearer_token_is_unauthorized(self):
+        response = self.client.get("/crypto/subscriptions", headers={"Authorization": "Bearer nope"})
+
+        self.assertEqual(302, response.status_code)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
+import gzip
 import json
 import unittest
+from app.mod_crypto.responses import EncodedBody
 from tests import BaseTestCase
 from unittest.mock import Mock, patch
 
@@ -42,7 +44,7 @@ class CryptoTestCases(BaseTestCase):
 
     @classmethod
     def setUpClass(cls):
-        cls.mock_get_patcher = patch("app.mod_crypto.services.requests.get")
+        cls.mock_get_patcher = patch("app.mod_crypto.services.http_client.get")
         cls.mock_get = cls.mock_get_patcher.start()
 
     @classmethod
@@ -61,6 +63,7 @@ class CryptoTestCases(BaseTestCase):
 
     def test_get_all_prices_returns_404_on_get_request_when_response_is_not_ok(self):
         self.mock_get.return_value.ok = False
+        self.mock_get.return_value.status_code = 500
         response = self.client.get("/crypto/all", follow_redirects=True)
 
         self.assert404(response)
@@ -72,6 +75,89 @@ class CryptoTestCases(BaseTestCase):
         response = self.client.post("/crypto/all", follow_redirects=True)
         self.assert405(response)
 
+    def test_get_all_prices_returns_304_when_etag_matches(self):
+        self.mock_get.return_value = Mock(ok=True)
+        self.mock_get.return_value.json.return_value = crypto_currencies
+
+        response = self.client.get("/crypto/all")
+        etag = response.headers["ETag"]
+        not_modified = self.client.get("/crypto/all", headers={"If-None-Match": etag})
+
+        self.assertEqual(304, not_modified.status_code)
+        self.assertEqual(b"", not_modified.data)
+        self.assertEqual(etag, not_modified.headers["ETag"])
+
+    def test_get_all_prices_is_gzip_encoded_when_accepted(self):
+        self.mock_get.return_value = Mock(ok=True)
+        self.mock_get.return_value.json.return_value = crypto_currencies
+
+        response = self.client.get("/crypto/all", headers={"Accept-Encoding": "gzip"})
+
+        self.assertEqual("gzip", response.headers["Content-Encoding"])
+        self.assertEqual(crypto_currencies, json.loads(gzip.decompress(response.data).decode("utf-8")))
+
+    def test_get_all_prices_projects_sorts_and_paginates(self):
+        self.mock_get.return_value = Mock(ok=True)
+        self.mock_get.return_value.json.return_value = crypto_currencies
+
+        response = self.client.get("/crypto/all?fields=id,price_usd&sort=-price_usd&limit=1")
+        self.assert200(response)
+
+        response_json = json.loads(response.data.decode("utf-8"))
+        self.assertEqual([{"id": "skycoin", "price_usd": "16.0151"}], response_json)
+
+    def test_get_all_prices_filters_by_min_market_cap(self):
+        self.mock_get.return_value = Mock(ok=True)
+        self.mock_get.return_value.json.return_value = crypto_currencies
+
+        response = self.client.get("/crypto/all?fields=id&min_market_cap=129000000&start=0")
+
+        response_json = json.loads(response.data.decode("utf-8"))
+        self.assertEqual([{"id": "storj"}], response_json)
+
+    def test_get_all_prices_returns_400_on_invalid_query(self):
+        self.assert400(self.client.get("/crypto/all?fields=id,colour"))
+        self.assert400(self.client.get("/crypto/all?limit=ten"))
+        self.assert400(self.client.get("/crypto/all?sort=-colour"))
+
+    def test_get_batch_prices_resolves_ids_and_symbols_from_one_upstream_call(self):
+        self.mock_get.reset_mock()
+        self.mock_get.return_value = Mock(ok=True)
+        self.mock_get.return_value.json.return_value = crypto_currencies
+
+        response = self.client.get("/crypto/batch?ids=storj,bitcoin&symbols=sky,STORJ,XYZ")
+        self.assert200(response)
+
+        response_json = json.loads(response.data.decode("utf-8"))
+        self.assertEqual(crypto_currencies, response_json["data"])
+        self.assertEqual({"ids": ["bitcoin"], "symbols": ["XYZ"]}, response_json["missing"])
+        self.assertEqual(1, self.mock_get.call_count)
+
+    def test_get_batch_prices_returns_400_without_ids_or_symbols(self):
+        response = self.client.get("/crypto/batch")
+        self.assert400(response)
+
+    def test_get_latest_price_body_is_encoded_once_per_snapshot(self):
+        self.mock_get.return_value = Mock(ok=True)
+        self.mock_get.return_value.json.return_value = crypto_currencies
+
+        with patch("app.mod_crypto.views.EncodedBody", wraps=EncodedBody) as mock_encoded_body:
+            first = self.client.get("/crypto/storj")
+            second = self.client.get("/crypto/storj")
+
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first.headers["ETag"], second.headers["ETag"])
+        self.assertEqual(1, mock_encoded_body.call_count)
+
+    def test_get_latest_price_returns_404_for_coin_missing_from_snapshot(self):
+        self.mock_get.reset_mock()
+        self.mock_get.return_value = Mock(ok=True)
+        self.mock_get.return_value.json.return_value = crypto_currencies
+
+        self.assert200(self.client.get("/crypto/storj"))
+        self.assert404(self.client.get("/crypto/bitcoin"))
+        self.assertEqual(1, self.mock_get.call_count)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,129 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from app.backends import MemoryBackend
+from app.mod_crypto.alerts import AlertEngine, AlertRule, TriggerState, ABOVE, BELOW, CROSSES_ABOVE, CROSSES_BELOW
+from app.mod_crypto.ticker import Ticker
+from tests.test_crypto_services import crypto_currencies
+
+
+def make_ticker(storj_price, storj_change_24h="-1.13"):
+    return Ticker.from_json([dict(crypto_currencies[0], price_usd=str(storj_price),
+                                  percent_change_24h=str(storj_change_24h)), crypto_currencies[1]])
+
+
+class AlertEngineTestCase(unittest.TestCase):
+
+    def triggered_ids(self, rules, ticker, previous=None):
+        engine = AlertEngine(rules)
+        return sorted(trigger.rule.id for trigger in engine.evaluate(ticker, previous))
+
+    def test_above_and_below_rules_trigger_on_current_value(self):
+        rules = [AlertRule(1, 1, "storj", "price_usd", ABOVE, 0.5),
+                 AlertRule(2, 2, "storj", "price_usd", ABOVE, 1.5),
+                 AlertRule(3, 3, "storj", "price_usd", BELOW, 1.5),
+                 AlertRule(4, 4, "storj", "price_usd", BELOW, 0.5),
+                 AlertRule(5, 5, "skycoin", "price_usd", BELOW, 20)]
+
+        self.assertEqual([1, 3, 5], self.triggered_ids(rules, make_ticker(1.0)))
+
+    def test_crosses_rules_need_the_previous_snapshot(self):
+        rules = [AlertRule(1, 1, "storj", "price_usd", CROSSES_ABOVE, 1.0),
+                 AlertRule(2, 1, "storj", "price_usd", CROSSES_ABOVE, 3.0),
+                 AlertRule(3, 1, "storj", "price_usd", CROSSES_BELOW, 1.0)]
+
+        self.assertEqual([], self.triggered_ids(rules, make_ticker(2.0)))
+        self.assertEqual([1], self.triggered_ids(rules, make_ticker(2.0), make_ticker(0.5)))
+        self.assertEqual([3], self.triggered_ids(rules, make_ticker(0.5), make_ticker(2.0)))
+
+    def test_rules_on_percent_change(self):
+        rules = [AlertRule(1, 1, "storj", "percent_change_24h", BELOW, -10),
+                 AlertRule(2, 1, "storj", "percent_change_24h", ABOVE, 10)]
+
+        self.assertEqual([1], self.triggered_ids(rules, make_ticker(1.0, storj_change_24h=-12.5)))
+
+    def test_rules_for_coins_missing_from_snapshot_are_skipped(self):
+        rules = [AlertRule(1, 1, "bitcoin", "price_usd", BELOW, 10000)]
+
+        self.assertEqual([], self.triggered_ids(rules, make_ticker(1.0)))
+
+    def test_rules_on_unknown_fields_are_rejected(self):
+        with self.assertRaises(ValueError):
+            AlertEngine([AlertRule(1, 1, "storj", "symbol", ABOVE, 1)])
+        with self.assertRaises(ValueError):
+            AlertEngine([AlertRule(1, 1, "storj", "price_usd", "equals", 1)])
+
+    def test_rules_without_finite_threshold_are_rejected(self):
+        with self.assertRaises(ValueError):
+            AlertEngine([AlertRule(1, 1, "storj", "price_usd", BELOW, float("nan"))])
+        with self.assertRaises(ValueError):
+            AlertEngine([AlertRule(1, 1, "storj", "price_usd", ABOVE, float("inf"))])
+
+
+class TriggerStateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = AlertEngine([AlertRule(1, 1, "storj", "price_usd", BELOW, 1.0)])
+        self.state = TriggerState()
+        self.state.hysteresis = 0.1
+        self.state.cooldown = 60
+
+    def delivered(self, price, now):
+        ticker = make_ticker(price)
+        triggers = self.state.filter(self.engine.evaluate(ticker), self.engine, ticker, now=now)
+        return [trigger.rule.id for trigger in triggers]
+
+    def test_rule_fires_once_while_condition_holds(self):
+        self.assertEqual([1], self.delivered(0.9, now=1000))
+        self.assertEqual([], self.delivered(0.8, now=2000))
+
+    def test_rule_rearms_only_past_the_hysteresis_band(self):
+        self.assertEqual([1], self.delivered(0.9, now=1000))
+        self.assertEqual([], self.delivered(1.05, now=2000))
+        self.assertEqual([], self.delivered(0.9, now=3000))
+
+        self.assertEqual([], self.delivered(1.2, now=4000))
+        self.assertEqual([1], self.delivered(0.9, now=5000))
+
+    def test_rearmed_rule_waits_for_the_cooldown(self):
+        self.assertEqual([1], self.delivered(0.9, now=1000))
+        self.assertEqual([], self.delivered(1.2, now=1010))
+        self.assertEqual([], self.delivered(0.9, now=1020))
+        self.assertEqual([1], self.delivered(0.9, now=1061))
+
+    def test_state_of_removed_rules_is_evicted(self):
+        self.delivered(0.9, now=1000)
+        self.engine.load([])
+
+        self.delivered(0.9, now=2000)
+        self.assertEqual({}, self.state._load())
+
+    def test_concurrent_updates_are_not_lost(self):
+        self.state.backend = MemoryBackend()
+        engine = AlertEngine([AlertRule(1, 1, "storj", "price_usd", BELOW, 1.0),
+                              AlertRule(2, 2, "skycoin", "price_usd", BELOW, 100)])
+        ticker = make_ticker(0.9)
+        load = self.state._load
+
+        def slow_load():
+            fired = load()
+            time.sleep(0.05)
+            return fired
+
+        def evaluate(rule_id):
+            triggers = [trigger for trigger in engine.evaluate(ticker) if trigger.rule.id == rule_id]
+            self.state.filter(triggers, engine, ticker, now=1000)
+
+        with patch.object(self.state, "_load", side_effect=slow_load):
+            threads = [threading.Thread(target=evaluate, args=(rule_id,)) for rule_id in (1, 2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(["1", "2"], sorted(self.state._load()))
+
+
+if __name__ == "__main__":
+    unittest.main()
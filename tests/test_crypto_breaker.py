@@ -0,0 +1,83 @@
+import json
+import unittest
+from unittest.mock import Mock, patch
+from requests import Timeout
+from app.mod_crypto.breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN, upstream_breaker
+from app.mod_crypto.cache import ticker_cache
+from tests import BaseTestCase
+from tests.test_crypto_services import crypto_currencies
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.breaker = CircuitBreaker()
+        self.breaker.min_calls = 4
+        self.breaker.failure_rate = 0.5
+        self.breaker.open_timeout = 30
+
+    def test_breaker_opens_at_failure_rate_and_fails_fast(self):
+        for record in (self.breaker.record_success, self.breaker.record_success, self.breaker.record_failure):
+            record()
+        self.assertEqual(CLOSED, self.breaker.state)
+
+        self.breaker.record_failure()
+        self.assertEqual(OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow())
+
+    @patch("app.mod_crypto.breaker.time.monotonic")
+    def test_half_open_breaker_lets_one_probe_through(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        for _ in range(4):
+            self.breaker.record_failure()
+
+        mock_monotonic.return_value = 131
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(HALF_OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow())
+
+        self.breaker.record_failure()
+        self.assertEqual(OPEN, self.breaker.state)
+
+        mock_monotonic.return_value = 162
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(CLOSED, self.breaker.state)
+
+
+class CircuitBreakerViewsTestCase(BaseTestCase):
+
+    @patch("app.mod_crypto.services.http_client.get")
+    def test_open_circuit_fails_fast_with_503(self, mock_get):
+        mock_get.side_effect = Timeout("read timed out")
+        for _ in range(upstream_breaker.min_calls):
+            self.client.get("/crypto/all")
+        mock_get.reset_mock()
+
+        response = self.client.get("/crypto/all")
+
+        self.assertEqual(503, response.status_code)
+        self.assertIn("Retry-After", response.headers)
+        mock_get.assert_not_called()
+
+    @patch("app.mod_crypto.services.http_client.get")
+    def test_last_good_snapshot_is_served_as_stale_when_circuit_is_open(self, mock_get):
+        mock_get.return_value = Mock(ok=True)
+        mock_get.return_value.json.return_value = crypto_currencies
+        self.assert200(self.client.get("/crypto/all"))
+        self.assertNotIn("Warning", self.client.get("/crypto/storj").headers)
+
+        for _ in range(upstream_breaker.min_calls):
+            upstream_breaker.record_failure()
+        ticker_cache.ttl = 0
+
+        response = self.client.get("/crypto/storj")
+
+        self.assert200(response)
+        self.assertEqual("storj", json.loads(response.data.decode("utf-8"))["id"])
+        self.assertIn("Response is Stale", response.headers["Warning"])
+        self.assertIn("X-Data-Age", response.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import time
+import unittest
+from unittest.mock import Mock, patch
+from app.mod_crypto.cache import TickerCache
+from app.mod_crypto.ticker import Ticker
+from tests import BaseTestCase
+from tests.test_crypto_services import crypto_currencies
+
+
+class TickerCacheTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(TickerCacheTestCase, self).setUp()
+        self.ticker = Ticker.from_json(crypto_currencies)
+        self.loader = Mock(return_value=self.ticker)
+        self.cache = TickerCache(self.loader)
+
+    def test_cold_cache_loads_snapshot(self):
+        self.assertIs(self.ticker, self.cache.get_all())
+        self.loader.assert_called_once_with()
+
+    def test_fresh_cache_does_not_call_loader_again(self):
+        self.cache.get_all()
+        self.cache.get_all()
+        self.assertEqual(1, self.loader.call_count)
+
+    def test_stale_cache_serves_snapshot_and_refreshes_in_background(self):
+        self.cache.ttl = 0
+        self.cache.get_all()
+        refreshed = Ticker.from_json([dict(coin, price_usd="1.0") for coin in crypto_currencies])
+        self.loader.return_value = refreshed
+
+        self.assertIs(self.ticker, self.cache.get_all())
+
+        deadline = time.time() + 2
+        while self.cache._refreshing and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(2, self.loader.call_count)
+        self.assertIs(refreshed, self.cache.get_all())
+
+    def test_failed_refresh_keeps_stale_snapshot(self):
+        self.cache.get_all()
+        self.loader.return_value = None
+
+        self.assertIsNone(self.cache.refresh())
+        self.assertIs(self.ticker, self.cache.get_all())
+
+    def test_single_coin_is_served_from_snapshot(self):
+        self.assertEqual(crypto_currencies[1], self.cache.get("skycoin").to_json())
+
+    @patch("app.mod_crypto.services.get_latest_crypto_price")
+    def test_coin_missing_from_snapshot_is_not_fetched_from_upstream(self, mock_get_latest):
+        self.assertIsNone(self.cache.get("bitcoin"))
+        mock_get_latest.assert_not_called()
+        self.assertEqual(1, self.loader.call_count)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from app.mod_crypto.client import http_client
+from tests import BaseTestCase
+
+
+class OkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+class HttpClientTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(HttpClientTestCase, self).setUp()
+        self.server = HTTPServer(("127.0.0.1", 0), OkHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:{}/".format(self.server.server_address[1])
+
+    def tearDown(self):
+        http_client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        super(HttpClientTestCase, self).tearDown()
+
+    def test_pooled_connections_are_counted_as_hits(self):
+        for _ in range(5):
+            self.assertEqual(200, http_client.get(self.url).status_code)
+
+        self.assertEqual(dict(checkouts=5, hits=4, misses=1), http_client.stats.to_json())
+
+    def test_counters_are_served_by_the_stats_route(self):
+        http_client.get(self.url)
+        http_client.get(self.url)
+
+        response = self.client.get("/crypto/stats")
+
+        self.assert200(response)
+        data = json.loads(response.data.decode("utf-8"))["data"]
+        self.assertEqual(dict(checkouts=2, hits=1, misses=1), data["http_pool"])
+        self.assertIn("coalesced", data["single_flight"])
+        self.assertIn("granted", data["rate_limiter"])
+
+
+if __name__ == "__main__":
+    unittest.main()
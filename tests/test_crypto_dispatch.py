@@ -0,0 +1,77 @@
+import threading
+import time
+import unittest
+from unittest.mock import Mock
+from requests import ConnectionError
+from app.mod_crypto.dispatch import WebhookDelivery, WebhookDispatcher, percentile
+
+
+def make_response(status_code, headers=None):
+    return Mock(status_code=status_code, ok=status_code < 400, reason="status {}".format(status_code),
+                headers=headers or {})
+
+
+class WebhookDispatcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Mock(pool_maxsize=10)
+        self.dispatcher = WebhookDispatcher(client=self.client)
+        self.dispatcher.sleep = Mock()
+
+    def test_deliveries_are_sent_concurrently_within_the_per_host_limit(self):
+        self.dispatcher.max_per_host = 3
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        def post(url, json):
+            with lock:
+                in_flight.append(url)
+                peak.append(len(in_flight))
+            time.sleep(0.02)
+            with lock:
+                in_flight.pop()
+            return make_response(200)
+
+        self.client.post.side_effect = post
+        report = self.dispatcher.dispatch([WebhookDelivery("event", "key", i) for i in range(12)])
+
+        self.assertEqual(12, report.sent)
+        self.assertEqual(3, max(peak))
+        self.assertEqual(12, len(report.latencies))
+
+    def test_throttled_and_failing_deliveries_are_retried(self):
+        self.client.post.side_effect = [make_response(429, {"Retry-After": "2"}), ConnectionError("reset"),
+                                        make_response(200)]
+
+        report = self.dispatcher.dispatch([WebhookDelivery("event", "key", 1)])
+
+        self.assertEqual((1, 3, []), (report.sent, report.attempts, report.failed))
+        self.assertGreaterEqual(self.dispatcher.sleep.call_args_list[0][0][0], 2)
+
+    def test_deliveries_are_dead_lettered_after_the_last_retry(self):
+        self.dispatcher.max_retries = 2
+        self.client.post.return_value = make_response(503)
+
+        report = self.dispatcher.dispatch([WebhookDelivery("event", "key", 1)])
+
+        self.assertEqual(3, report.attempts)
+        self.assertEqual(1, len(report.failed))
+        self.assertEqual(list(report.failed), list(self.dispatcher.dead_letters))
+
+    def test_client_errors_are_not_retried(self):
+        self.client.post.return_value = make_response(401)
+
+        report = self.dispatcher.dispatch([WebhookDelivery("event", None, 1)])
+
+        self.assertEqual((0, 1), (report.sent, report.attempts))
+        self.dispatcher.sleep.assert_not_called()
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual((50, 90, 99, None), (percentile(values, 0.5), percentile(values, 0.9),
+                                              percentile(values, 0.99), percentile([], 0.5)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import json
+import unittest
+from sqlalchemy import event
+from app.mod_crypto.history import _rollup_resolution, record_price_ticks, update_price_rollups
+from app.mod_crypto.models import PriceTick, PriceRollup
+from app.mod_crypto.ticker import Ticker
+from tests import BaseTestCase
+from tests.test_crypto_services import crypto_currencies
+
+
+class PriceHistoryTestCase(BaseTestCase):
+
+    def record(self, last_updated, price_usd):
+        ticker = Ticker.from_json([dict(coin, last_updated=str(last_updated), price_usd=str(price_usd))
+                                   for coin in crypto_currencies])
+        update_price_rollups(ticker)
+        return record_price_ticks(ticker)
+
+    def test_snapshot_is_written_with_one_insert_statement(self):
+        statements = []
+
+        def count_inserts(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("INSERT INTO price_tick"):
+                statements.append(statement)
+
+        engine = self.db.engine
+        event.listen(engine, "before_cursor_execute", count_inserts)
+        try:
+            self.assertEqual(2, self.record(1523939652, 1.5))
+        finally:
+            event.remove(engine, "before_cursor_execute", count_inserts)
+
+        self.assertEqual(1, len(statements))
+        self.assertEqual(2, PriceTick.query.count())
+
+    def test_history_returns_ticks_in_range(self):
+        for minute, price in enumerate([1.0, 2.0, 3.0]):
+            self.record(1523939640 + minute * 60, price)
+
+        response = self.client.get("/crypto/storj/history?from=1523939640&to=1523939700")
+        self.assert200(response)
+
+        response_json = json.loads(response.data.decode("utf-8"))
+        self.assertEqual([1.0, 2.0], [tick["price_usd"] for tick in response_json["data"]])
+        self.assertEqual([1523939640, 1523939700], [tick["timestamp"] for tick in response_json["data"]])
+
+    def test_history_keeps_last_tick_per_step(self):
+        for minute, price in enumerate([1.0, 2.0, 3.0, 4.0]):
+            self.record(1523939640 + minute * 60, price)
+
+        response = self.client.get("/crypto/skycoin/history?from=1523939640&to=1523939820&step=120")
+
+        response_json = json.loads(response.data.decode("utf-8"))
+        self.assertEqual([2.0, 4.0], [tick["price_usd"] for tick in response_json["data"]])
+
+    def test_rollups_are_updated_incrementally(self):
+        for second, price in enumerate([2.0, 5.0, 1.0, 3.0]):
+            self.record(1523939640 + second * 10, price)
+        self.record(1523939670, 9.0)
+
+        minute = PriceRollup.query.filter_by(coin_id="storj", resolution=60).one()
+        self.assertEqual((2.0, 5.0, 1.0, 3.0, 4), (minute.open, minute.high, minute.low, minute.close, minute.ticks))
+        self.assertEqual(1, PriceRollup.query.filter_by(coin_id="storj", resolution=86400).count())
+
+    def test_history_with_hourly_step_is_served_from_hourly_rollups(self):
+        for hour, price in enumerate([1.0, 2.0, 3.0]):
+            self.record(1523937600 + hour * 3600, price)
+            self.record(1523937600 + hour * 3600 + 60, price + 0.5)
+
+        response = self.client.get("/crypto/storj/history?from=1523937600&to=1523948400&step=7200")
+
+        response_json = json.loads(response.data.decode("utf-8"))
+        self.assertEqual([dict(open=1.0, high=2.5, low=1.0, close=2.5), dict(open=3.0, high=3.5, low=3.0, close=3.5)],
+                         [dict(open=entry["open"], high=entry["high"], low=entry["low"], close=entry["close"])
+                          for entry in response_json["data"]])
+
+    def test_step_between_resolutions_uses_the_coarsest_one_below_it(self):
+        self.assertEqual(60, _rollup_resolution(90))
+        self.assertEqual(3600, _rollup_resolution(5400))
+        self.assertEqual(86400, _rollup_resolution(86400 * 7))
+        self.assertIsNone(_rollup_resolution(30))
+
+    def test_history_returns_400_on_invalid_range(self):
+        self.assert400(self.client.get("/crypto/storj/history?from=20&to=10"))
+        self.assert400(self.client.get("/crypto/storj/history?step=soon"))
+        self.assert400(self.client.get("/crypto/storj/history?from=1&to=" + "9" * 20))
+        self.assert400(self.client.get("/crypto/storj/history?from=-" + "9" * 20))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from datetime import datetime, timedelta
+from app.mod_crypto.alerts import AlertEngine, AlertRule, BELOW
+from app.mod_crypto.polling import PollingPolicy, AdaptiveSchedule
+from app.mod_crypto.ticker import Ticker
+from tests import BaseTestCase
+from tests.test_crypto_services import crypto_currencies
+
+
+def make_ticker(price_usd="1.0", percent_change_1h="0.0"):
+    return Ticker.from_json([dict(crypto_currencies[0], price_usd=price_usd, percent_change_1h=percent_change_1h)])
+
+
+class PollingPolicyTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(PollingPolicyTestCase, self).setUp()
+        self.policy = PollingPolicy(self.app)
+        self.policy.min_interval = 10
+        self.policy.max_interval = 300
+        self.policy.quota = 100
+        self.policy.quota_window = 3600
+        self.engine = AlertEngine([AlertRule(1, 1, "storj", "price_usd", BELOW, 0.5)])
+
+    def test_calm_market_is_polled_at_the_maximum_interval(self):
+        self.assertEqual(300, self.policy.update(make_ticker(), self.engine, now=7200))
+
+    def test_volatile_market_is_polled_faster(self):
+        self.assertEqual(10, self.policy.update(make_ticker(percent_change_1h="-7.5"), self.engine, now=7200))
+        self.assertEqual(155, self.policy.update(make_ticker(percent_change_1h="2.5"), self.engine, now=7200))
+
+    def test_prices_near_a_threshold_are_polled_faster(self):
+        self.assertEqual(10, self.policy.update(make_ticker(price_usd="0.5"), self.engine, now=7200))
+
+    def test_quota_is_never_exceeded(self):
+        for _ in range(95):
+            self.policy.record_request(now=7200)
+
+        # 5 requests left for the hour: polling every 10 seconds would run out of budget
+        self.assertEqual(720, self.policy.update(make_ticker(percent_change_1h="-7.5"), self.engine, now=7200))
+
+        for _ in range(5):
+            self.policy.record_request(now=7200)
+        self.assertEqual(1800, self.policy.budget_interval(10, now=9000))
+
+    def test_schedule_uses_published_interval(self):
+        schedule = AdaptiveSchedule(self.policy)
+        self.policy.update(make_ticker(percent_change_1h="-7.5"), self.engine)
+
+        self.assertTrue(schedule.is_due(datetime.utcnow() - timedelta(seconds=11)).is_due)
+        self.assertFalse(schedule.is_due(datetime.utcnow() - timedelta(seconds=5)).is_due)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+from app.mod_crypto.ratelimit import RateLimiter, FileTokenStore, PRIORITY_HIGH, PRIORITY_LOW, take_token
+from app.mod_crypto.services import get_all_crypto_currency_prices
+from tests import BaseTestCase
+
+
+class RateLimiterTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(RateLimiterTestCase, self).setUp()
+        self.limiter = RateLimiter(self.app)
+        self.limiter.rate = 1.0
+        self.limiter.capacity = 10
+        self.limiter.low_priority_reserve = 0.3
+        self.limiter.sleep = Mock()
+
+    def test_bucket_refills_at_rate_up_to_capacity(self):
+        state, wait = take_token((0.5, 100), 100, rate=1.0, capacity=10, floor=0)
+        self.assertEqual(((0.5, 100), 0.5), (state, wait))
+
+        state, wait = take_token((0.5, 100), 200, rate=1.0, capacity=10, floor=0)
+        self.assertEqual(((9, 200), 0), (state, wait))
+
+    def test_low_priority_requests_leave_a_reserve_for_high_priority_ones(self):
+        self.limiter.max_wait = {PRIORITY_HIGH: 0, PRIORITY_LOW: 0}
+        with patch("app.mod_crypto.ratelimit.time.time", return_value=1000):
+            low = [self.limiter.acquire(PRIORITY_LOW) for _ in range(10)]
+            high = [self.limiter.acquire(PRIORITY_HIGH) for _ in range(4)]
+
+        self.assertEqual(7, low.count(True))
+        self.assertEqual(3, high.count(True))
+        self.assertEqual(4, self.limiter.stats.rejected)
+
+    def test_high_priority_request_waits_for_a_token(self):
+        with patch("app.mod_crypto.ratelimit.time.time", side_effect=[1000] * 11 + [1001]):
+            results = [self.limiter.acquire(PRIORITY_HIGH) for _ in range(11)]
+
+        self.assertTrue(all(results))
+        self.limiter.sleep.assert_called_once_with(1.0)
+        self.assertEqual(1, self.limiter.stats.waited)
+
+    def test_file_store_is_shared_between_processes(self):
+        directory = tempfile.mkdtemp()
+        first, second = FileTokenStore(directory), FileTokenStore(directory)
+
+        self.assertEqual(0, first.take("bucket", 1000, 1.0, 2, 0))
+        self.assertEqual(0, second.take("bucket", 1000, 1.0, 2, 0))
+        self.assertEqual(1.0, first.take("bucket", 1000, 1.0, 2, 0))
+
+    @patch("app.mod_crypto.services.http_client.get")
+    @patch("app.mod_crypto.services.rate_limiter.acquire", return_value=False)
+    def test_upstream_is_not_called_when_the_limit_is_reached(self, mock_acquire, mock_get):
+        self.assertIsNone(get_all_crypto_currency_prices())
+        mock_get.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
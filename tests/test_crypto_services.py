@@ -1,5 +1,8 @@
 import unittest
 from unittest.mock import Mock, patch
+from flask import current_app
+from requests import ConnectionError
+from app.mod_crypto.client import http_client
 from app.mod_crypto.services import get_latest_crypto_price, get_all_crypto_currency_prices
 from tests import BaseTestCase
 
@@ -39,7 +42,7 @@ crypto_currencies = [
 
 class CryptoServicesTestCase(BaseTestCase):
 
-    @patch("app.mod_crypto.services.requests.get")
+    @patch("app.mod_crypto.services.http_client.get")
     def test_get_all_crypto_prices_returns_when_response_is_ok(self, mock_get):
         mock_get.return_value = Mock(ok=True)
         mock_get.return_value.json.return_value = crypto_currencies
@@ -48,15 +51,15 @@ class CryptoServicesTestCase(BaseTestCase):
 
         self.assertEqual(crypto_currencies, response)
 
-    @patch("app.mod_crypto.services.requests.get")
+    @patch("app.mod_crypto.services.http_client.get")
     def test_get_all_crypto_currency_prices_returns_none_when_response_is_not_ok(self, mock_get):
-        mock_get.return_value = Mock(ok=False)
+        mock_get.return_value = Mock(ok=False, status_code=500)
 
         response = get_all_crypto_currency_prices()
 
         self.assertIsNone(response)
 
-    @patch("app.mod_crypto.services.requests.get")
+    @patch("app.mod_crypto.services.http_client.get")
     def test_get_latest_crypto_currency_returns_currency_price_for_crypto(self, mock_get):
         mock_get.return_value = Mock(ok=True)
         mock_get.return_value.json.return_value = crypto_currencies
@@ -65,14 +68,28 @@ class CryptoServicesTestCase(BaseTestCase):
 
         self.assertEqual(crypto_currencies[0], response)
 
-    @patch("app.mod_crypto.services.requests.get")
+    @patch("app.mod_crypto.services.http_client.get")
     def test_get_latest_crypto_currency_returns_none_when_response_is_not_ok_for_crypto(self, mock_get):
-        mock_get.return_value = Mock(ok=False)
+        mock_get.return_value = Mock(ok=False, status_code=500)
 
         response = get_latest_crypto_price("bitcoin")
 
         self.assertIsNone(response)
 
+    @patch("app.mod_crypto.services.http_client.get")
+    def test_get_all_crypto_currency_prices_returns_none_when_request_fails(self, mock_get):
+        mock_get.side_effect = ConnectionError()
+
+        response = get_all_crypto_currency_prices()
+
+        self.assertIsNone(response)
+
+    def test_http_client_is_configured_from_app_config(self):
+        self.assertEqual((current_app.config["HTTP_CONNECT_TIMEOUT"], current_app.config["HTTP_READ_TIMEOUT"]),
+                         http_client.timeout)
+        self.assertEqual(current_app.config["HTTP_POOL_MAXSIZE"], http_client.pool_maxsize)
+        self.assertIs(http_client.session, http_client.session)
+
 
 if __name__ == '__main__':
     unittest.main()
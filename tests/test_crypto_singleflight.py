@@ -0,0 +1,91 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import Mock
+from app.mod_crypto.singleflight import SingleFlight, FileLockStore
+from tests import BaseTestCase
+
+
+class SingleFlightTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(SingleFlightTestCase, self).setUp()
+        self.single_flight = SingleFlight()
+
+    def test_concurrent_calls_for_same_key_share_one_execution(self):
+        release = threading.Event()
+        fetch = Mock(side_effect=lambda: release.wait() and ["ticker"])
+        results = []
+
+        threads = [threading.Thread(target=lambda: results.append(self.single_flight.do("ticker", fetch)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while self.single_flight.stats.coalesced < 4:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, fetch.call_count)
+        self.assertEqual([["ticker"]] * 5, results)
+        self.assertEqual(4, self.single_flight.stats.coalesced)
+
+    def test_sequential_calls_are_not_coalesced(self):
+        fetch = Mock(return_value=["ticker"])
+
+        self.single_flight.do("ticker", fetch)
+        self.single_flight.do("ticker", fetch)
+
+        self.assertEqual(2, fetch.call_count)
+
+    def test_result_written_by_another_process_is_reused(self):
+        lock_store = FileLockStore(tempfile.mkdtemp())
+        self.single_flight.lock_store = lock_store
+        fetch = Mock(return_value=["ticker"])
+
+        original_lock = lock_store.lock
+
+        def lock_after_other_process_wrote(key):
+            lock_store.write(key, ["other process ticker"])
+            return original_lock(key)
+
+        lock_store.lock = lock_after_other_process_wrote
+
+        self.assertEqual(["other process ticker"], self.single_flight.do("ticker", fetch, shared=True))
+        fetch.assert_not_called()
+        self.assertEqual(1, self.single_flight.stats.coalesced_across_processes)
+
+    def test_unshared_calls_do_not_create_lock_files(self):
+        directory = tempfile.mkdtemp()
+        self.single_flight.lock_store = FileLockStore(directory)
+
+        self.single_flight.do("ticker/some-user-input", Mock(return_value={"id": "bitcoin"}))
+
+        self.assertEqual([], os.listdir(directory))
+
+    def test_waiting_on_in_flight_call_times_out(self):
+        release = threading.Event()
+        leader = threading.Thread(target=self.single_flight.do, args=("ticker", release.wait))
+        leader.start()
+        while "ticker" not in self.single_flight._calls:
+            time.sleep(0.01)
+        self.single_flight.wait_timeout = 0.01
+
+        self.assertIsNone(self.single_flight.do("ticker", Mock()))
+        self.assertEqual(1, self.single_flight.stats.timeouts)
+        release.set()
+        leader.join()
+
+    def test_coalesce_decorator_keys_calls_by_arguments(self):
+        fetch = Mock(side_effect=lambda coin: {"id": coin})
+        coalesced_fetch = self.single_flight.coalesce(lambda coin: f"ticker/{coin}")(fetch)
+
+        self.assertEqual({"id": "bitcoin"}, coalesced_fetch("bitcoin"))
+        self.assertEqual({"id": "ethereum"}, coalesced_fetch("ethereum"))
+
+
+if __name__ == "__main__":
+    unittest.main()
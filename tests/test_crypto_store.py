@@ -0,0 +1,100 @@
+import unittest
+from unittest.mock import patch
+from app.backends import MemoryBackend
+from app.mod_crypto.store import SnapshotStore, CURRENT_KEY
+from tests import BaseTestCase
+from tests.test_crypto_services import crypto_currencies
+
+
+class SnapshotStoreTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(SnapshotStoreTestCase, self).setUp()
+        self.store = SnapshotStore(self.app)
+
+    def test_read_returns_none_when_nothing_is_published(self):
+        self.assertIsNone(self.store.read())
+
+    def test_published_snapshot_is_versioned(self):
+        first = self.store.publish(crypto_currencies)
+        second = self.store.publish(crypto_currencies[:1])
+
+        self.assertEqual(first.version + 1, second.version)
+        self.assertEqual(crypto_currencies[:1], self.store.read().to_json())
+
+    def test_snapshot_published_by_another_process_is_read_from_backend(self):
+        other_process = SnapshotStore(self.app)
+        other_process.publish(crypto_currencies)
+
+        snapshot = self.store.read()
+
+        self.assertEqual(crypto_currencies, snapshot.to_json())
+        self.assertIs(snapshot, self.store.read())
+
+    def test_older_publish_does_not_replace_current_snapshot(self):
+        self.store.publish(crypto_currencies[:1])
+        newer = self.store.publish(crypto_currencies)
+
+        # a slower publisher that got the previous version finishes last
+        slow_publisher = SnapshotStore(self.app)
+        with patch.object(slow_publisher.backend, "incr", return_value=newer.version - 1):
+            slow_publisher.publish(crypto_currencies[:1])
+
+        snapshot = SnapshotStore(self.app).read()
+        self.assertEqual(newer.version, snapshot.version)
+        self.assertEqual(crypto_currencies, snapshot.to_json())
+        self.assertEqual(newer.version, int(self.store.backend.get(CURRENT_KEY)))
+
+    @patch("app.mod_crypto.store.get_all_crypto_currency_prices")
+    def test_load_only_calls_upstream_when_nothing_is_published(self, mock_get_all):
+        mock_get_all.return_value = crypto_currencies
+
+        self.assertEqual(crypto_currencies, self.store.load().to_json())
+        self.assertEqual(crypto_currencies, self.store.load().to_json())
+        mock_get_all.assert_called_once_with()
+
+    @patch("app.mod_crypto.store.get_all_crypto_currency_prices")
+    def test_load_serves_old_snapshot_when_upstream_fails(self, mock_get_all):
+        mock_get_all.return_value = None
+        self.store.publish(crypto_currencies, fetched_at=1)
+
+        self.assertEqual(crypto_currencies, self.store.load().to_json())
+        mock_get_all.assert_called_once_with()
+
+    def test_snapshot_is_published_with_its_diff(self):
+        self.store.publish(crypto_currencies)
+        second = self.store.publish([dict(crypto_currencies[0], price_usd="9.0", last_updated="1523940000"),
+                                     crypto_currencies[1]])
+
+        diff = SnapshotStore(self.app).read_diff(second.version)
+
+        self.assertEqual(second.version - 1, diff.base_version)
+        self.assertEqual(["storj"], [coin.id for coin in diff.changed])
+
+
+class MemoryBackendTestCase(unittest.TestCase):
+
+    def test_set_max_keeps_greatest_value(self):
+        backend = MemoryBackend()
+
+        self.assertEqual(5, backend.set_max("key", 5))
+        self.assertEqual(5, backend.set_max("key", 3))
+
+    def test_expired_keys_are_not_returned(self):
+        backend = MemoryBackend()
+        backend.set("key", "value", ex=-1)
+
+        self.assertIsNone(backend.get("key"))
+
+    def test_incr_only_sets_expiry_on_new_counters(self):
+        backend = MemoryBackend()
+        backend.incr("counter", ex=-1)
+        self.assertIsNone(backend.get("counter"))
+
+        backend.incr("counter")
+        backend.incr("counter", ex=-1)
+        self.assertEqual(2, backend.get("counter"))
+
+
+if __name__ == "__main__":
+    unittest.main()
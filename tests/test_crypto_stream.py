@@ -0,0 +1,153 @@
+import json
+import unittest
+from app.mod_crypto.cache import ticker_cache
+from app.mod_crypto.store import SnapshotStore, snapshot_store
+from app.mod_crypto.stream import PriceBroadcaster, StreamSubscriber, format_event, price_broadcaster
+from tests import BaseTestCase
+from tests.test_crypto_services import crypto_currencies
+
+
+def with_price(coin_id, price):
+    return [dict(coin, price_usd=price, last_updated="1523939999") if coin["id"] == coin_id else coin
+            for coin in crypto_currencies]
+
+
+def parse_event(event):
+    fields = dict(line.split(": ", 1) for line in event.strip().split("\n"))
+    fields["data"] = json.loads(fields["data"])
+    return fields
+
+
+class StreamSubscriberTestCase(unittest.TestCase):
+
+    def test_full_queue_drops_oldest_events(self):
+        subscriber = StreamSubscriber(queue_size=2)
+        for event in ("first", "second", "third"):
+            subscriber.push(event)
+
+        self.assertEqual(["second", "third"], subscriber.drain(timeout=0))
+        self.assertEqual(1, subscriber.dropped)
+
+    def test_drain_returns_nothing_when_no_event_arrived(self):
+        self.assertEqual([], StreamSubscriber().drain(timeout=0))
+
+    def test_format_event(self):
+        self.assertEqual('id: 3\nevent: prices\ndata: []\n\n', format_event("[]", event="prices", id=3))
+
+
+class PriceBroadcasterTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(PriceBroadcasterTestCase, self).setUp()
+        self.store = SnapshotStore(self.app)
+        self.broadcaster = PriceBroadcaster(self.store, app=self.app)
+        self.broadcaster.poll_interval = 0.01
+        self.subscribers = []
+
+    def tearDown(self):
+        for subscriber in self.subscribers:
+            self.broadcaster.unsubscribe(subscriber)
+        super(PriceBroadcasterTestCase, self).tearDown()
+
+    def subscribe(self, coin_ids=None, snapshot=None):
+        subscriber = self.broadcaster.subscribe(coin_ids, snapshot)
+        self.subscribers.append(subscriber)
+        return subscriber
+
+    def test_only_changed_coins_are_pushed(self):
+        first = self.store.publish(crypto_currencies)
+        subscriber = self.subscribe(snapshot=first)
+
+        self.store.publish(with_price("storj", "1.5"))
+        events = subscriber.drain(timeout=5)
+
+        self.assertEqual(1, len(events))
+        event = parse_event(events[0])
+        self.assertEqual("prices", event["event"])
+        self.assertEqual("2", event["id"])
+        self.assertEqual(["storj"], [coin["id"] for coin in event["data"]])
+        self.assertEqual("1.5", event["data"][0]["price_usd"])
+
+    def test_coins_are_filtered_per_subscriber(self):
+        self.store.publish(crypto_currencies)
+        snapshot = self.store.publish(with_price("storj", "1.5"))
+        storj = self.subscribe(["storj"])
+        skycoin = self.subscribe(["skycoin"])
+
+        self.assertEqual(1, self.broadcaster.broadcast(self.store.read_diff(snapshot.version).changed))
+
+        self.assertEqual(1, len(storj.drain(timeout=0)))
+        self.assertEqual([], skycoin.drain(timeout=0))
+
+    def test_changes_of_skipped_snapshots_are_not_lost(self):
+        first = self.store.publish(crypto_currencies)
+        self.broadcaster._snapshot = first
+
+        self.store.publish(with_price("storj", "1.5"))
+        self.store.publish(with_price("storj", "1.5"))
+
+        self.assertEqual(1, self.broadcaster.poll())
+
+    def test_client_starting_from_an_older_snapshot_gets_the_changes_since(self):
+        first = self.store.publish(crypto_currencies)
+        self.broadcaster._snapshot = self.store.publish(with_price("storj", "1.5"))
+
+        events = self.subscribe(["storj"], snapshot=first).drain(timeout=0)
+
+        self.assertEqual(1, len(events))
+        event = parse_event(events[0])
+        self.assertEqual("2", event["id"])
+        self.assertEqual("1.5", event["data"][0]["price_usd"])
+
+    def test_stream_subscribes_only_once_it_is_iterated(self):
+        stream = self.broadcaster.stream(["storj"], self.store.publish(crypto_currencies))
+        self.assertEqual(0, self.broadcaster.subscribers)
+
+        self.assertEqual("snapshot", parse_event(next(stream))["event"])
+        self.assertEqual(1, self.broadcaster.subscribers)
+        stream.close()
+        self.assertEqual(0, self.broadcaster.subscribers)
+
+    def test_watcher_stops_with_last_subscriber(self):
+        subscriber = self.subscribe()
+        self.assertEqual(1, self.broadcaster.subscribers)
+
+        self.broadcaster.unsubscribe(subscriber)
+
+        self.assertEqual(0, self.broadcaster.subscribers)
+        self.assertIsNone(self.broadcaster._thread)
+
+    def test_resubscribing_does_not_keep_the_stopped_watcher_running(self):
+        subscriber = self.subscribe()
+        stopped = self.broadcaster._thread
+        self.broadcaster.unsubscribe(subscriber)
+        self.subscribe()
+
+        stopped.join(timeout=5)
+        self.assertFalse(stopped.is_alive())
+        self.assertTrue(self.broadcaster._thread.is_alive())
+
+
+class StreamViewTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(StreamViewTestCase, self).setUp()
+        ticker_cache.clear()
+        snapshot_store.publish(crypto_currencies)
+
+    def test_stream_starts_with_filtered_snapshot(self):
+        response = self.client.get("/crypto/stream?ids=storj", buffered=False)
+        try:
+            self.assertEqual("text/event-stream", response.mimetype)
+            self.assertEqual("no-cache", response.headers["Cache-Control"])
+            event = parse_event(next(iter(response.response)).decode())
+        finally:
+            response.close()
+
+        self.assertEqual("snapshot", event["event"])
+        self.assertEqual(["storj"], [coin["id"] for coin in event["data"]])
+        self.assertEqual(0, price_broadcaster.subscribers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import json
+import unittest
+from unittest.mock import patch
+from app.mod_auth.models import UserAccount
+from app.mod_crypto.alerts import alert_engine
+from app.mod_crypto.models import AlertSubscription
+from app.mod_crypto.ticker import Ticker
+from tests import BaseTestCase
+from tests.test_crypto_services import crypto_currencies
+
+
+class AlertSubscriptionTestCase(BaseTestCase):
+
+    def create_subscription(self, **values):
+        subscription = dict(coin_id="storj", condition="below", threshold=2.0, webhook_key="user1-key")
+        subscription.update(values)
+        return self.client.post("/crypto/subscriptions", data=json.dumps(subscription),
+                                content_type="application/json")
+
+    def test_subscriptions_require_login(self):
+        self.assertStatus(self.client.get("/crypto/subscriptions"), 302)
+
+    def test_crud(self):
+        self.login()
+
+        response = self.create_subscription()
+        self.assertEqual(201, response.status_code)
+        subscription = json.loads(response.data.decode("utf-8"))["data"]
+        self.assertNotIn("webhook_key", subscription)
+
+        url = "/crypto/subscriptions/{}".format(subscription["id"])
+        response = self.client.put(url, data=json.dumps(dict(threshold=0.5)), content_type="application/json")
+        self.assert200(response)
+        self.assertEqual(0.5, json.loads(response.data.decode("utf-8"))["data"]["threshold"])
+
+        response = self.client.get("/crypto/subscriptions")
+        self.assertEqual([subscription["id"]], [entry["id"] for entry in
+                                                json.loads(response.data.decode("utf-8"))["data"]])
+
+        self.assert200(self.client.delete(url))
+        self.assert404(self.client.get(url))
+
+    def test_subscriptions_are_deleted_with_their_user(self):
+        user2 = UserAccount.query.filter_by(username="user2").first()
+        self.db.session.add(AlertSubscription(user_account_id=user2.id, coin_id="storj", condition="below",
+                                              threshold=2.0))
+        self.db.session.commit()
+
+        self.db.session.delete(user2)
+        self.db.session.commit()
+
+        self.assertEqual(0, AlertSubscription.query.count())
+
+    def test_invalid_subscriptions_are_rejected(self):
+        self.login()
+
+        self.assert400(self.create_subscription(condition="equals"))
+        self.assert400(self.create_subscription(field="symbol"))
+        self.assert400(self.create_subscription(threshold="cheap"))
+        self.assert400(self.create_subscription(threshold="nan"))
+        self.assert400(self.create_subscription(threshold="-inf"))
+        self.assertEqual(0, AlertSubscription.query.count())
+
+    def test_subscriptions_of_other_users_are_not_found(self):
+        user2 = UserAccount.query.filter_by(username="user2").first()
+        other = AlertSubscription(user_account_id=user2.id, coin_id="storj", condition="below", threshold=2.0)
+        self.db.session.add(other)
+        self.db.session.commit()
+        self.login()
+
+        self.assert404(self.client.get("/crypto/subscriptions/{}".format(other.id)))
+        self.assert404(self.client.delete("/crypto/subscriptions/{}".format(other.id)))
+
+    def test_rule_index_is_only_reloaded_after_a_change(self):
+        self.login()
+        self.create_subscription()
+        ticker = Ticker.from_json(crypto_currencies)
+
+        with patch.object(alert_engine, "loader", wraps=alert_engine.loader) as loader:
+            triggers = alert_engine.refresh().evaluate(ticker)
+            alert_engine.refresh()
+            self.assertEqual(1, loader.call_count)
+            self.assertEqual(["user1-key"], [trigger.rule.webhook_key for trigger in triggers])
+
+            self.create_subscription(threshold=0.5)
+            alert_engine.refresh()
+            self.assertEqual(2, loader.call_count)
+            self.assertEqual(2, alert_engine.size - 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+import threading
+import unittest
+from unittest.mock import Mock, patch
+from app import celery
+from app.mod_crypto.cache import ticker_cache
+from app.mod_crypto.dispatch import webhook_dispatcher
+from app.mod_crypto.models import AlertSubscription, PriceTick
+from app.mod_crypto.constants import DIGEST_INTERVAL
+from app.mod_auth.models import UserAccount
+from app.mod_crypto.alerts import alert_engine, trigger_state
+from app.mod_crypto.store import snapshot_store
+from app.mod_crypto.history import record_price_ticks, update_price_rollups
+from app.mod_crypto.tasks import fan_out_webhooks, deliver_webhooks, ingest_ticker_snapshot, post_crypto_emergency, \
+    post_telegram_notification, _digest_due
+from app.mod_crypto.ticker import Ticker
+from tests import BaseTestCase
+from tests.test_crypto_services import crypto_currencies
+
+
+class WebhookFanOutTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(WebhookFanOutTestCase, self).setUp()
+        celery.conf.task_always_eager = True
+        self.chunk_size = webhook_dispatcher.chunk_size
+        webhook_dispatcher.chunk_size = 4
+
+    def tearDown(self):
+        webhook_dispatcher.chunk_size = self.chunk_size
+        celery.conf.task_always_eager = False
+        super(WebhookFanOutTestCase, self).tearDown()
+
+    @patch("app.mod_crypto.dispatch.http_client.post")
+    def test_deliveries_are_sent_in_chunks_and_aggregated(self, mock_post):
+        mock_post.return_value = Mock(status_code=200, ok=True)
+        deliveries = [dict(event="storj_price_emergency", key="key-{}".format(i), data=i) for i in range(10)]
+
+        with patch.object(deliver_webhooks, "s", wraps=deliver_webhooks.s) as chunk_signature, \
+                patch("app.mod_crypto.tasks._has_result_backend", return_value=True):
+            report = fan_out_webhooks(deliveries).get()
+
+        self.assertEqual([4, 4, 2], [len(call[0][0]) for call in chunk_signature.call_args_list])
+        self.assertEqual((10, 0, 10), (report["sent"], report["failed"], report["attempts"]))
+        self.assertEqual(10, mock_post.call_count)
+
+    @patch("app.mod_crypto.dispatch.http_client.post")
+    def test_chunks_are_sent_without_aggregation_when_there_is_no_result_backend(self, mock_post):
+        mock_post.return_value = Mock(status_code=200, ok=True)
+        deliveries = [dict(event="storj_price_emergency", key="key-{}".format(i), data=i) for i in range(10)]
+
+        with patch("app.mod_crypto.tasks.aggregate_delivery_reports") as mock_aggregate:
+            reports = fan_out_webhooks(deliveries).get()
+
+        self.assertEqual([4, 4, 2], [report["sent"] for report in reports])
+        mock_aggregate.s.assert_not_called()
+        self.assertEqual(10, mock_post.call_count)
+
+    def test_nothing_is_dispatched_without_deliveries(self):
+        self.assertIsNone(fan_out_webhooks([]))
+
+
+class IngestTickerSnapshotTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(IngestTickerSnapshotTestCase, self).setUp()
+        celery.conf.task_always_eager = True
+
+    def tearDown(self):
+        celery.conf.task_always_eager = False
+        super(IngestTickerSnapshotTestCase, self).tearDown()
+
+    @patch("app.mod_crypto.services.http_client.post")
+    @patch("app.mod_crypto.services.http_client.get")
+    def test_snapshot_is_fetched_once_and_fanned_out_to_consumers(self, mock_get, mock_post):
+        bitcoin = dict(crypto_currencies[0], id="bitcoin", symbol="BTC", price_usd="12000.0")
+        mock_get.return_value = Mock(ok=True, json=Mock(return_value=crypto_currencies + [bitcoin]))
+
+        version = ingest_ticker_snapshot.delay().get()
+
+        self.assertEqual(1, mock_get.call_count)
+        self.assertEqual(3, PriceTick.query.count())
+        self.assertEqual(version, ticker_cache.get_all().version)
+
+        ingest_ticker_snapshot.delay().get()
+        self.assertEqual(3, PriceTick.query.count())
+        digests = [call for call in mock_post.call_args_list if "bitcoin_price_update" in call[0][0]]
+        self.assertEqual(1, len(digests))
+
+    def test_each_digest_period_is_claimed_once(self):
+        snapshot = Mock(fetched_at=1000 * DIGEST_INTERVAL)
+        claims = []
+        threads = [threading.Thread(target=lambda: claims.append(_digest_due(snapshot))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, claims.count(True))
+        self.assertTrue(_digest_due(Mock(fetched_at=1001 * DIGEST_INTERVAL)))
+
+
+class PostCryptoEmergencyTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(PostCryptoEmergencyTestCase, self).setUp()
+        celery.conf.task_always_eager = True
+        self.cooldown = trigger_state.cooldown
+        trigger_state.cooldown = 60
+
+    def tearDown(self):
+        trigger_state.cooldown = self.cooldown
+        celery.conf.task_always_eager = False
+        super(PostCryptoEmergencyTestCase, self).tearDown()
+
+    def post_at(self, bitcoin_price, now, last_updated=None):
+        bitcoin = dict(crypto_currencies[0], id="bitcoin", symbol="BTC", price_usd=str(bitcoin_price),
+                       last_updated=str(last_updated or now))
+        self.snapshot = snapshot_store.publish(crypto_currencies + [bitcoin])
+        with patch("app.mod_crypto.alerts.time.time", return_value=now):
+            return post_crypto_emergency(self.snapshot.version)
+
+    @patch("app.mod_crypto.dispatch.http_client.post")
+    def test_unchanged_coin_fires_again_after_the_cooldown(self, mock_post):
+        mock_post.return_value = Mock(status_code=200, ok=True)
+
+        self.assertEqual(1, self.post_at(5000, now=1000))
+        self.assertEqual(0, self.post_at(20000, now=1010))
+        self.assertEqual(0, self.post_at(5000, now=1020))
+
+        # bitcoin did not change, but its re-armed rule is out of the cooldown
+        self.assertEqual(1, self.post_at(5000, now=1100, last_updated=1020))
+        self.assertIsNone(snapshot_store.read_diff(self.snapshot.version).changed.get("bitcoin"))
+
+    @patch("app.mod_crypto.dispatch.http_client.post")
+    def test_new_subscription_fires_on_an_unchanged_coin(self, mock_post):
+        mock_post.return_value = Mock(status_code=200, ok=True)
+        self.assertEqual(0, self.post_at(12000, now=1000))
+
+        user = UserAccount.query.filter_by(username="user1").first()
+        self.db.session.add(AlertSubscription(user_account_id=user.id, coin_id="bitcoin", condition="below",
+                                              threshold=20000))
+        self.db.session.commit()
+        alert_engine.invalidate()
+        # the ingest task refreshes the engine before the emergencies are evaluated
+        alert_engine.refresh()
+
+        self.assertEqual(1, self.post_at(12000, now=1010, last_updated=1000))
+        self.assertEqual(0, self.post_at(12000, now=1020, last_updated=1000))
+
+
+class PostTelegramNotificationTestCase(BaseTestCase):
+
+    @staticmethod
+    def bitcoin_at(price, last_updated):
+        return [dict(crypto_currencies[0], id="bitcoin", symbol="BTC", price_usd=str(price),
+                     last_updated=str(last_updated))]
+
+    @patch("app.mod_crypto.tasks.post_iftt_webhook_event")
+    def test_digest_lists_the_prices_of_the_period(self, mock_post):
+        start = 1000 * DIGEST_INTERVAL
+        for minute, price in ((-70, 9000), (0, 10000), (10, 11000), (20, 12000)):
+            ticker = Ticker.from_json(self.bitcoin_at(price, start + minute * 60), fetched_at=start + minute * 60)
+            record_price_ticks(ticker)
+            update_price_rollups(ticker)
+        snapshot = snapshot_store.publish(self.bitcoin_at(13000, start + 30 * 60), fetched_at=start + 30 * 60)
+
+        post_telegram_notification(snapshot.version)
+
+        rows = mock_post.call_args[0][1].split("<br>")
+        self.assertEqual(["$<b>10000.0</b>", "$<b>11000.0</b>", "$<b>12000.0</b>", "$<b>13000.0</b>"],
+                         [row.split(": ")[1] for row in rows])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from app.mod_crypto.ticker import Coin, Ticker, TickerDiff
+from tests.test_crypto_services import crypto_currencies
+
+
+class TickerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.ticker = Ticker.from_json(crypto_currencies, version=3)
+
+    def test_numeric_fields_are_parsed_once(self):
+        storj = self.ticker.get("storj")
+
+        self.assertEqual(0.952095, storj.price_usd)
+        self.assertEqual(99, storj.rank)
+        self.assertEqual(14439800.0, storj.volume_24h_usd)
+        self.assertEqual(1523939652, storj.last_updated)
+        self.assertIsNone(storj.max_supply)
+
+    def test_ticker_converts_back_to_upstream_schema(self):
+        self.assertEqual(crypto_currencies, self.ticker.to_json())
+
+    def test_coins_can_be_looked_up_by_symbol(self):
+        self.assertIs(self.ticker.get("skycoin"), self.ticker.get_by_symbol("sky"))
+        self.assertIsNone(self.ticker.get_by_symbol("BTC"))
+
+    def test_small_numbers_are_not_formatted_with_exponent(self):
+        coin = Coin.from_json(dict(crypto_currencies[0], price_btc="0.00001234"))
+
+        self.assertEqual("0.00001234", coin.to_json()["price_btc"])
+
+    def test_large_numbers_are_formatted_without_trailing_dot(self):
+        coin = Coin.from_json(dict(crypto_currencies[0], total_supply="1e16"))
+
+        self.assertEqual("10000000000000000", coin.to_json()["total_supply"])
+
+    def test_query_results_are_memoized_per_snapshot(self):
+        fields = frozenset(["id", "symbol"])
+        result = self.ticker.query(fields=fields, sort="-market_cap_usd", limit=1)
+
+        self.assertEqual([{"id": "storj", "symbol": "STORJ"}], result)
+        self.assertIs(result, self.ticker.query(fields=fields, sort="-market_cap_usd", limit=1))
+
+    def test_coin_has_no_instance_dict(self):
+        self.assertFalse(hasattr(self.ticker.get("storj"), "__dict__"))
+
+
+class TickerDiffTestCase(unittest.TestCase):
+
+    def test_only_coins_that_moved_are_changed(self):
+        previous = Ticker.from_json(crypto_currencies, version=1)
+        storj = dict(crypto_currencies[0], price_usd="2.0", last_updated="1523940000")
+        skycoin = dict(crypto_currencies[1], price_usd="99.0")
+        snapshot = Ticker.from_json([storj, skycoin, dict(crypto_currencies[1], id="newcoin")], version=2)
+
+        diff = TickerDiff.compute(snapshot, previous)
+
+        self.assertEqual(["storj", "newcoin"], [coin.id for coin in diff.changed])
+        self.assertEqual(0b101, diff.bitmap)
+        self.assertEqual(1, diff.base_version)
+
+    def test_without_previous_snapshot_every_coin_changed(self):
+        diff = TickerDiff.compute(Ticker.from_json(crypto_currencies, version=1))
+
+        self.assertEqual(2, len(diff))
+        self.assertIsNone(diff.base_version)
+
+    def test_json_round_trip(self):
+        snapshot = Ticker.from_json(crypto_currencies, version=2)
+        diff = TickerDiff(snapshot, 0b10, base_version=1)
+
+        restored = TickerDiff.from_json(snapshot, diff.to_json())
+
+        self.assertEqual((0b10, 1, ["skycoin"]), (restored.bitmap, restored.base_version,
+                                                  [coin.id for coin in restored.changed]))
+
+
+if __name__ == "__main__":
+    unittest.main()